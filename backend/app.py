@@ -22,6 +22,7 @@ HOST = server_cfg.get("host", "0.0.0.0")
 BACKEND_PORT = int(server_cfg.get("backend_port", 5001))
 ENABLED_CORS = bool(server_cfg.get("enabled_cors", True))
 OUT_GRAPH = cfg.paths.get("OUT_GRAPH")
+OUT_VERSION = cfg.paths.get("OUT_VERSION")
 
 app = Flask(__name__, static_folder="../frontend/dist", static_url_path="/")
 
@@ -55,6 +56,25 @@ def api_graph():
         log.exception("Error servint /api/graph")
         return jsonify({"error": "INTERNAL", "detail": str(e)}), 500
 
+# Versió de graph_sigma.json (canvia quan el graf o el seu render canvien) i
+# resum de l'últim canvi: el frontend només recarrega /api/graph quan canvia
+@app.get("/api/graph/changes")
+def api_graph_changes():
+    try:
+        path = Path(OUT_VERSION)
+        if not path.exists():
+            return jsonify({"version": None, "summary": {}})
+
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        return jsonify({"version": (data.get("sigma") or {}).get("version"),
+                        "summary": (data.get("graph") or {}).get("summary", {})})
+
+    except Exception as e:
+        log.exception("Error servint /api/graph/changes")
+        return jsonify({"error": "INTERNAL", "detail": str(e)}), 500
+
 @app.route("/", defaults={"path": ""})
 @app.route("/<path:path>")
 def serve_frontend(path):
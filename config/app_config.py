@@ -22,6 +22,8 @@ class Config:
         self.colors      = params.get("colors", {})
         self.input_files = params.get("input_files", {})
         self.mapping     = params.get("mapping", {})
+        self.retrieval   = params.get("retrieval", {})
+        self.output      = params.get("output", {})
 
         # --- Load top-level simple keys ---
         for k, v in params.items():
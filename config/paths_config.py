@@ -41,6 +41,10 @@ OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 OUT_JSON    = OUT_DIR / "suggestions.json"
 OUT_GRAPH   = OUT_DIR / "graph_sigma.json"
+OUT_CHANGES = OUT_DIR / "changes.json"
+OUT_VERSION = OUT_DIR / "graph_version.json"
+EMBEDDINGS_PATH = OUT_DIR / "embeddings.npz"
+ANN_INDEX_PATH  = OUT_DIR / "ann_index.npz"
 
 LOG_DIR = PROJECT_DIR / "backend" / "data" / "logs"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
@@ -64,6 +68,10 @@ def get_paths():
         "OUT_DIR": OUT_DIR,
         "OUT_JSON": OUT_JSON,
         "OUT_GRAPH": OUT_GRAPH,
+        "OUT_CHANGES": OUT_CHANGES,
+        "OUT_VERSION": OUT_VERSION,
+        "EMBEDDINGS_PATH": EMBEDDINGS_PATH,
+        "ANN_INDEX_PATH": ANN_INDEX_PATH,
         "LOG_DIR": LOG_DIR,
         "STOPWORDS_PATH": STOPWORDS_PATH,
     }
@@ -1,5 +1,6 @@
 # config/text_normalization.py
 import re
+from functools import lru_cache
 
 SENT_PUNCT = r"[\.!?…]"  # pots ampliar si vols
 
@@ -28,47 +29,44 @@ SAFE_REPLACEMENTS = (
     # ...
 )
 
-def _apply_safe_replacements(s: str) -> str:
-    out = s
-    for bad, good in SAFE_REPLACEMENTS:
-        out = re.sub(rf"\b{re.escape(bad)}\b", good, out, flags=re.IGNORECASE)
-    return out
-
-def _sentence_case_term(term_lc: str, wanted: str) -> re.Pattern:
+def _alternation(words, prefix: str = "") -> re.Pattern:
     """
-    Construeix un patró que només fa match del terme a:
-      - inici de text (^)
-      - DESPRÉS d'un signe final d'oració + 1 espai ('. ', '! ', '? ', '… ')
-    Ex.: (group1) captura el prefix, (group2) el terme.
+    Un sol patró (insensible a majúscules) per a tots els mots: el grup i+1 és el mot i.
+    Els mots són sencers (límits de mot) i distints, així que en cada posició en pot casar com a molt un.
     """
-    # \b per assegurar límit de mot abans i després
-    return re.compile(
-        rf"(^|(?<={SENT_PUNCT}\s))(\b{re.escape(term_lc)}\b)",
-        flags=re.IGNORECASE
-    )
+    alts = "|".join(f"({re.escape(w)})" for w in words)
+    return re.compile(rf"{prefix}\b(?:{alts})\b", flags=re.IGNORECASE)
 
-def normalize_text(s: str) -> str:
-    if not s:
-        return s
 
-    # 1) Correccions segures (no toquen majúscules contextuals)
-    s = _apply_safe_replacements(s)
+# Compilats un sol cop (abans: un re.sub i un patró nou per entrada i per crida)
+_SAFE_RE = _alternation(bad for bad, _ in SAFE_REPLACEMENTS)
+_SAFE_OUT = tuple(good for _, good in SAFE_REPLACEMENTS)
+
+# Només a l'inici del text o DESPRÉS d'un signe final d'oració + 1 espai ('. ', '! ', '? ', '… ')
+_SENTENCE_RE = _alternation(SENTENCE_CASE_TERMS, prefix=rf"(?:^|(?<={SENT_PUNCT}\s))")
+_SENTENCE_OUT = tuple(SENTENCE_CASE_TERMS.values())
+
+_CACHE_SIZE = 16384
+
+
+def _apply_safe_replacements(s: str) -> str:
+    return _SAFE_RE.sub(lambda m: _SAFE_OUT[m.lastindex - 1], s)
+
+
+def _apply_sentence_case(s: str) -> str:
+    # El terme en posició d'inici d'oració pren sempre la forma desitjada
+    return _SENTENCE_RE.sub(lambda m: _SENTENCE_OUT[m.lastindex - 1], s)
 
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def _normalize(s: str) -> str:
+    # 1) Correccions segures (no toquen majúscules contextuals)
     # 2) Capitalització condicionada a inici d’oració
-    #    Per cada terme, només capitalitza si és a l'inici o després de '. ' / '! ' / '? ' / '… '
-    for term_lc, wanted in SENTENCE_CASE_TERMS.items():
-        pat = _sentence_case_term(term_lc, wanted)
-
-        def repl(m: re.Match) -> str:
-            prefix = m.group(1) or ""  # '' o el separador d'oració
-            # Si ja està exactament com 'wanted', no toquem
-            matched = m.group(2)
-            if matched == wanted:
-                return prefix + matched
-            # Si el match té majúscules ja “correctes” (p.ex. tot en majúscules a un títol),
-            # pots decidir respectar-ho. Aquí forcem la forma 'wanted' només en posició d'inici d’oració.
-            return prefix + wanted
-
-        s = pat.sub(repl, s)
-
-    return s
+    return _apply_sentence_case(_apply_safe_replacements(s))
+
+
+def normalize_text(s: str) -> str:
+    if not s:
+        return s
+    # Títols i motius es repeteixen molt: memoritzat
+    return _normalize(s)
@@ -10,6 +10,8 @@ import { ConnectionList } from './components/ConnectionList';
 import { SettingsModal } from './components/SettingsModal';
 import './viewer/style.css'; // Import legacy styles
 
+const GRAPH_POLL_MS = 60000;
+
 function App() {
   const { t } = useTranslation();
   const [graphData, setGraphData] = useState(null);
@@ -33,16 +35,31 @@ function App() {
 
   const [config, setConfig] = useState(null);
 
+  const graphVersion = useRef(undefined);
+
   // Load Data
   useEffect(() => {
     // Fetch Graph Data
-    fetch('/api/graph')
+    const loadGraph = () => fetch('/api/graph')
       .then(res => res.json())
       .then(data => {
         setGraphData(data);
       })
       .catch(err => console.error("Error loading graph:", err));
 
+    // Reload the graph only when a pipeline run changed it
+    const checkChanges = () => fetch('/api/graph/changes')
+      .then(res => res.json())
+      .then(({ version }) => {
+        if (graphVersion.current !== undefined && version !== graphVersion.current) loadGraph();
+        graphVersion.current = version;
+      })
+      .catch(err => console.error("Error checking graph changes:", err));
+
+    loadGraph();
+    checkChanges();
+    const poll = setInterval(checkChanges, GRAPH_POLL_MS);
+
     // Fetch Config
     fetch('/api/config')
       .then(res => res.json())
@@ -53,7 +70,10 @@ function App() {
     const matcher = window.matchMedia('(prefers-color-scheme: dark)');
     const onChange = (e) => setIsDarkMode(e.matches);
     matcher.addEventListener('change', onChange);
-    return () => matcher.removeEventListener('change', onChange);
+    return () => {
+      clearInterval(poll);
+      matcher.removeEventListener('change', onChange);
+    };
   }, []);
 
   // Derived Data for Sidebar (Filter Options)
@@ -236,6 +236,10 @@ export const GraphViewer = forwardRef(({
                     } else if (edgesConfig.explicit_color) {
                         color = edgesConfig.explicit_color;
                     }
+                } else if (data.kind === 'near_duplicate') {
+                    if (edgesConfig.near_duplicate_color) {
+                        color = edgesConfig.near_duplicate_color;
+                    }
                 } else if (data.kind === 'inferred' || data.kind === 'similarity') {
                     // Inferred edges - use buckets
                     const sim = data.similarity || 0;
@@ -41,6 +41,7 @@ export const Legend = ({ graphData, isDarkMode }) => {
                 else if (edge.label === "Strong Similarity (>85%)") labelKey = "legend_strong_similarity";
                 else if (edge.label === "Medium Similarity (>70%)") labelKey = "legend_medium_similarity";
                 else if (edge.label === "Weak Similarity (>60%)") labelKey = "legend_weak_similarity";
+                else if (edge.label === "Near-duplicate") labelKey = "legend_near_duplicate";
 
                 return (
                     <div key={idx} style={{ display: 'flex', alignItems: 'center', gap: '8px' }}>
@@ -1,8 +1,15 @@
 # pipeline/ai_clients/ai_client.py
+import json
+import time
 import requests
+from urllib3.exceptions import ReadTimeoutError
 from config.logger_config import setup_logging, get_logger
 from config.app_config import load_params
 from config.env_config import get_env
+from pipeline.ai_health import CircuitBreaker, CircuitOpenError, probe_endpoint
+from pipeline.ai_latency import LatencyTracker
+from pipeline.ai_pool import BackendPool, Endpoint
+from pipeline.parses.prompt_builder import estimate_tokens
 
 cfg = load_params()
 setup_logging(getattr(cfg, "log_level", "INFO"))
@@ -14,64 +21,309 @@ AI_MODEL   = cfg.ai["model_name"]
 AI_URL     = cfg.ai["model_url"]
 # API Key is optional for local Ollama, but required for some remote providers.
 # We get it if it exists, otherwise use a dummy value if needed or None.
-AI_API_KEY = get_env("HF_API_KEY", required=False) or "ollama" 
+AI_API_KEY = get_env("HF_API_KEY", required=False) or "ollama"
 
+AI_PROBE_TTL       = float(cfg.ai.get("probe_ttl", 30))
+AI_PROBE_TIMEOUT   = float(cfg.ai.get("probe_timeout", 5))
+AI_CONNECT_TIMEOUT = 5
 
-def call_ai_client(prompt: str, stream: bool = False, timeout: int = 120):
-    headers = {
-        "Content-Type": "application/json",
-    }
-    if AI_API_KEY:
-        headers["Authorization"] = f"Bearer {AI_API_KEY}"
 
+def _structured_mode(value) -> str | None:
+    # ai.structured_output: false | "json_schema" (OpenAI response_format) | "ollama" (format) | "auto"
+    if value is True:
+        return "auto"
+    if not value:
+        return None
+    value = str(value).strip().lower()
+    if value not in ("auto", "json_schema", "ollama"):
+        log.warning("Unknown ai.structured_output %r; structured output disabled", value)
+        return None
+    return value
+
+
+AI_STRUCTURED_OUTPUT = _structured_mode(cfg.ai.get("structured_output", False))
+
+
+def _new_breaker(name: str) -> CircuitBreaker:
+    # Opens after consecutive failures, half-opens after the cooldown.
+    return CircuitBreaker(
+        name,
+        failure_threshold=int(cfg.ai.get("circuit_failure_threshold", 3)),
+        reset_timeout=float(cfg.ai.get("circuit_reset_timeout", 60)),
+    )
+
+
+def _new_latency() -> LatencyTracker:
+    # Rolling latency stats; the next call's timeout is p99 × factor, capped by ai.timeout.
+    return LatencyTracker(
+        window=int(cfg.ai.get("latency_window", 100)),
+        factor=float(cfg.ai.get("timeout_factor", 3)),
+        min_timeout=float(cfg.ai.get("timeout_min", 15)),
+        max_timeout=float(cfg.ai.get("timeout", 300)),
+        min_samples=int(cfg.ai.get("latency_min_samples", 5)),
+    )
+
+
+def _build_pool() -> BackendPool:
+    """
+    ai.endpoints: list of {url, model?, api_key_env?}; falls back to ai.model_url.
+    """
+    endpoints = []
+    for spec in (cfg.ai.get("endpoints") or []):
+        if isinstance(spec, str):
+            spec = {"url": spec}
+        if not isinstance(spec, dict) or not spec.get("url"):
+            log.warning("Ignoring invalid ai.endpoints entry: %r", spec)
+            continue
+        key_env = spec.get("api_key_env")
+        api_key = (get_env(key_env, required=False) if key_env else None) or AI_API_KEY
+        endpoints.append(Endpoint(spec["url"], spec.get("model") or AI_MODEL, api_key,
+                                  breaker=_new_breaker(spec["url"]), latency=_new_latency()))
+    if not endpoints:
+        endpoints.append(Endpoint(AI_URL, AI_MODEL, AI_API_KEY,
+                                  breaker=_new_breaker(AI_URL), latency=_new_latency()))
+    return BackendPool(endpoints)
+
+
+AI_POOL = _build_pool()
+
+# Run-wide latency stats across all endpoints (per-endpoint stats live in AI_POOL)
+AI_LATENCY = _new_latency()
+
+
+class AIServerError(RuntimeError):
+    """5xx answer from an AI endpoint (counts as an endpoint failure)."""
+
+
+class AIText(str):
+    """Text answer; `structured` is True when the server was asked to follow a JSON schema."""
+    structured = False
+    endpoint: str | None = None
+
+
+def call_ai_client(prompt: str, stream: bool = False, timeout: float | None = None,
+                   json_schema: dict | None = None) -> AIText:
+    """
+    Sends `prompt` to the least-loaded healthy endpoint and returns the text answer.
+    A failed request is retried once on each other endpoint.
+    Raises CircuitOpenError without touching the network when every circuit is open.
+    If `timeout` is None, an adaptive timeout is derived from the endpoint's recent latencies.
+    With `json_schema` and ai.structured_output enabled, the server is asked to constrain
+    its answer to that schema (see _schema_fields).
+    With `stream`, the answer is read as server-sent chunks (see _read_stream).
+    """
+    tried: set[str] = set()
+    last_err: Exception | None = None
+
+    for _ in range(len(AI_POOL.endpoints)):
+        ep = AI_POOL.acquire(exclude=tried)
+        if ep is None:
+            break
+        tried.add(ep.url)
+        try:
+            return _call_endpoint(ep, prompt, timeout, json_schema, stream)
+        except Exception as e:
+            last_err = e
+            if len(tried) < len(AI_POOL.endpoints):
+                log.warning("AI endpoint %s failed (%s); trying another endpoint", ep.url, e)
+        finally:
+            AI_POOL.release(ep)
+
+    if last_err is not None:
+        raise last_err
+    raise CircuitOpenError("AI circuit open for every endpoint; call skipped")
+
+
+def _schema_fields(ep: Endpoint, schema: dict | None) -> dict:
+    """Request fields that constrain the answer to `schema` on this endpoint ({} if off)."""
+    if not schema or not AI_STRUCTURED_OUTPUT or not ep.structured_ok:
+        return {}
+    mode = AI_STRUCTURED_OUTPUT
+    if mode == "auto":
+        mode = "ollama" if ep.kind == "ollama" else "json_schema"
+    fields = {"response_format": {"type": "json_schema",
+                                  "json_schema": {"name": "connections", "strict": True, "schema": schema}}}
+    if mode == "ollama":
+        # Ollama's native API takes the schema as `format`; its /v1 layer reads response_format
+        fields["format"] = schema
+    return fields
+
+
+def _read_stream(resp, deadline: float) -> dict:
+    """
+    Joins an SSE chat completion (OpenAI chunks) into the non-streamed response
+    shape. The read timeout only bounds the gap between chunks, so the call's
+    whole timeout is checked as a deadline at each chunk.
+    """
+    content, reasoning, usage = [], [], None
+    try:
+        for raw in resp.iter_lines():
+            if time.perf_counter() > deadline:
+                raise requests.Timeout("streamed answer exceeded its timeout")
+            line = raw.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                break
+            chunk = json.loads(payload)
+            usage = chunk.get("usage") or usage
+            for choice in chunk.get("choices") or []:
+                delta = choice.get("delta") or {}
+                content.append(delta.get("content") or "")
+                reasoning.append(delta.get("reasoning_content") or "")
+    except (requests.ConnectionError, ReadTimeoutError) as e:
+        # requests reports a read timeout between chunks as a ConnectionError
+        if isinstance(e, ReadTimeoutError) or any(isinstance(a, ReadTimeoutError) for a in e.args):
+            raise requests.ReadTimeout(e) from e
+        raise
+    message = {"content": "".join(content), "reasoning_content": "".join(reasoning)}
+    return {"choices": [{"message": message}], "usage": usage}
+
+
+def _call_endpoint(ep: Endpoint, prompt: str, timeout: float | None,
+                   json_schema: dict | None = None, stream: bool = False) -> AIText:
     # Construct OpenAI-compatible payload
     body = {
-        "model": AI_MODEL,
+        "model": ep.model,
         "messages": [
             {"role": "user", "content": prompt}
         ],
         "max_tokens": 1000,
         "temperature": 0.2,
+        **ep.extra_body,
     }
+    structured = _schema_fields(ep, json_schema)
+    body.update(structured)
+    if stream:
+        body["stream"] = True
+        body["stream_options"] = {"include_usage": True}
 
+    if timeout is None:
+        timeout = ep.latency.next_timeout()
+
+    t0 = time.perf_counter()
+    data = None
     try:
-        resp = requests.post(AI_URL, headers=headers, json=body, timeout=timeout)
-        if resp.status_code != 200:
-            raise RuntimeError(f"AI error {resp.status_code}: {resp.text}")
+        resp = requests.post(ep.url, headers=ep.headers(), json=body, stream=stream,
+                             timeout=(min(AI_CONNECT_TIMEOUT, timeout), timeout))
+        if stream and resp.status_code == 200:
+            with resp:
+                data = _read_stream(resp, t0 + timeout)
+    except requests.RequestException as e:
+        ep.failures += 1
+        ep.breaker.record_failure()
+        if isinstance(e, requests.Timeout):
+            ep.latency.record_timeout(timeout)
+            AI_LATENCY.record_timeout(timeout)
+            log.error(f"AI call to {ep.url} timed out after {timeout:.0f}s")
+        else:
+            log.error(f"AI call failed: {e}")
+        raise
+    except ValueError as e:
+        ep.failures += 1
+        ep.breaker.record_failure()
+        log.error(f"AI call failed: unexpected streamed chunk ({e})")
+        raise
+    elapsed = time.perf_counter() - t0
 
-        data = resp.json()
+    if resp.status_code >= 500:
+        ep.failures += 1
+        ep.breaker.record_failure()
+        raise AIServerError(f"AI error {resp.status_code}: {resp.text}")
+    # Any other answer means the server is alive
+    ep.breaker.record_success()
+    if resp.status_code == 400 and structured:
+        # Server rejects schema-constrained output: stop asking this endpoint for it
+        ep.structured_ok = False
+        log.warning("⚠️ %s rejected structured output (%s); using free-form JSON from now on",
+                    ep.url, resp.text[:200])
+        return _call_endpoint(ep, prompt, timeout, stream=stream)
+    if resp.status_code != 200:
+        ep.failures += 1
+        raise RuntimeError(f"AI error {resp.status_code}: {resp.text}")
 
+    try:
+        if data is None:
+            data = resp.json()
         # Parse response in OpenAI format
         msg = data["choices"][0]["message"]
-        return msg.get("content") or msg.get("reasoning_content") or ""
+        text = msg.get("content") or msg.get("reasoning_content") or ""
     except Exception as e:
-        log.error(f"AI call failed: {e}")
-        # Return empty string or re-raise depending on desired behavior. 
-        # The original code returned str(data) on key error, but logging and returning empty might be safer or raising.
-        # Let's stick to raising runtime error if status is bad, but for parsing errors...
-        if 'resp' in locals() and resp.status_code != 200:
-             raise RuntimeError(f"AI error {resp.status_code}: {resp.text}")
-        raise e
+        ep.failures += 1
+        log.error(f"AI call failed: unexpected response ({e})")
+        raise
 
+    _record_latency(ep, elapsed, data.get("usage"), prompt, text)
+    out = AIText(text)
+    out.structured = bool(structured)
+    out.endpoint = ep.url
+    return out
 
-def check_model_availability() -> bool:
-    """Checks if the AI model is reachable."""
-    headers = {
-        "Content-Type": "application/json",
-    }
-    if AI_API_KEY:
-        headers["Authorization"] = f"Bearer {AI_API_KEY}"
 
-    # Perform simple inference check
-    body = {
-        "model": AI_MODEL,
-        "messages": [{"role": "user", "content": "Hi"}],
-        "max_tokens": 1
-    }
-    try:
-        # Increased timeout for cold starts
-        resp = requests.post(AI_URL, headers=headers, json=body, timeout=30)
-        return resp.status_code == 200
-    except Exception as e:
-        log.warning(f"AI Model check failed: {e}")
-        return False
+def _record_latency(ep: Endpoint, elapsed: float, usage, prompt: str, text: str) -> None:
+    """Records latency and throughput; `usage` counts are preferred over local estimates."""
+    usage = usage if isinstance(usage, dict) else {}
+    completion = usage.get("completion_tokens")
+    prompt_tok = usage.get("prompt_tokens")
+    estimated = completion is None
+    if estimated:
+        completion = estimate_tokens(text)
+        prompt_tok = estimate_tokens(prompt)
+    ep.latency.record(elapsed, completion_tokens=completion, prompt_tokens=prompt_tok)
+    tps = AI_LATENCY.record(elapsed, completion_tokens=completion, prompt_tokens=prompt_tok)
+    log.info("  ↳ AI call: %.1fs · %s%d completion tokens · %s tok/s · next timeout %.0fs%s",
+             elapsed, "~" if estimated else "", completion or 0,
+             f"{tps:.1f}" if tps else "?", ep.latency.next_timeout(),
+             f" · {ep.url}" if len(AI_POOL.endpoints) > 1 else "")
+
+
+def log_ai_stats() -> None:
+    """Logs the run's AI latency/throughput summary (and per-endpoint lines for a pool)."""
+    stats = AI_LATENCY.summary()
+    if not stats["calls"] and not stats["timeouts"]:
+        return
+    log.info("🤖 AI calls: %d (timeouts %d) · p50=%ss p95=%ss p99=%ss · %s tok/s · %d prompt / %d completion tokens",
+             stats["calls"], stats["timeouts"], stats["p50_s"], stats["p95_s"], stats["p99_s"],
+             stats["tokens_per_s"], stats["prompt_tokens"], stats["completion_tokens"])
+    if len(AI_POOL.endpoints) > 1:
+        for ep in AI_POOL.endpoints:
+            s = ep.summary()
+            log.info("   · %s [%s] calls=%d failures=%d circuit_opened=%d · p50=%s · %s tok/s · %d completion tokens",
+                     s["url"], s["state"], s["calls"], s["failures"], s["circuit_opened"],
+                     f"{s['p50_s']}s" if s["p50_s"] is not None else "n/a",
+                     s["tokens_per_s"] if s["tokens_per_s"] is not None else "n/a", s["completion_tokens"])
+
+
+def ai_available() -> bool:
+    """
+    False while every endpoint's circuit is open (the pipeline should run tags-only).
+    Once an endpoint's cooldown has elapsed, a cheap probe decides whether to let a trial call through
+    (the first check after the circuit opened probes for real; later ones reuse it for ai.probe_ttl).
+    """
+    if not AI_POOL.all_open():
+        return True
+    for ep in AI_POOL.endpoints:
+        if not ep.breaker.cooldown_elapsed():
+            continue
+        if probe_endpoint(ep.url, ep.headers(), ep.model, ttl=AI_PROBE_TTL, timeout=AI_PROBE_TIMEOUT,
+                          since=ep.breaker.opened_at):
+            return True
+        ep.breaker.reopen()
+    return False
+
+
+def check_model_availability() -> bool:
+    """Checks if any AI endpoint is reachable (cheap listing probe, no inference)."""
+    ok_any = False
+    for ep in AI_POOL.endpoints:
+        if not ep.url:
+            continue
+        ok = probe_endpoint(ep.url, ep.headers(), ep.model, ttl=AI_PROBE_TTL, timeout=AI_PROBE_TIMEOUT)
+        if ok:
+            ok_any = True
+        else:
+            log.warning(f"AI Model check failed: no answer from {ep.url}")
+            # skip it until its cooldown elapses
+            ep.breaker.reopen()
+    return ok_any
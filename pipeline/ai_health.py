@@ -0,0 +1,160 @@
+# pipeline/ai_health.py
+"""
+Cheap liveness checks and a circuit breaker for the AI model server.
+
+- probe_endpoint(): GET /v1/models (OpenAI-compatible) or /api/tags (Ollama),
+  cached for a short TTL instead of running a real chat completion.
+- CircuitBreaker: opens after N consecutive failures, half-opens after a cooldown
+  so a single trial request can close it again.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from config.logger_config import get_logger
+
+log = get_logger(__name__)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a call is refused because the circuit is open."""
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def cooldown_elapsed(self) -> bool:
+        return self.state == self.OPEN and (time.monotonic() - self.opened_at) >= self.reset_timeout
+
+    def allow_request(self) -> bool:
+        """True if a request may go through (closed, or the single half-open trial)."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if (time.monotonic() - self.opened_at) < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+                log.info("🔌 Circuit '%s' half-open: allowing a trial request", self.name)
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                log.info("🔌 Circuit '%s' closed again", self.name)
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    log.warning("🔌 Circuit '%s' OPEN after %d consecutive failures (retry in %.0fs)",
+                                self.name, self.failures, self.reset_timeout)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def reopen(self) -> None:
+        """Restarts the cooldown (e.g. a half-open probe failed)."""
+        with self._lock:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+
+# -----------------------------------------------------------------------------
+# Liveness probe
+# -----------------------------------------------------------------------------
+_probe_cache: dict[str, tuple[float, bool]] = {}
+_probe_lock = threading.Lock()
+
+
+def base_url(chat_url: str) -> str:
+    """Server root of a chat URL (strips '/v1/...' or Ollama '/api/...')."""
+    parts = urlsplit(chat_url)
+    path = parts.path
+    base_path = path.split("/v1/", 1)[0] if "/v1/" in path else path.rsplit("/api/", 1)[0]
+    return urlunsplit((parts.scheme, parts.netloc, base_path.rstrip("/"), "", ""))
+
+
+def probe_urls(chat_url: str) -> list[str]:
+    """Candidate listing endpoints for a chat URL, cheapest first."""
+    base = base_url(chat_url)
+    return [f"{base}/v1/models", f"{base}/api/tags"]
+
+
+def list_models(payload: dict) -> list[str]:
+    """Model names from a /v1/models or /api/tags response."""
+    if not isinstance(payload, dict):
+        return []
+    if isinstance(payload.get("data"), list):
+        return [str(m.get("id")) for m in payload["data"] if isinstance(m, dict) and m.get("id")]
+    if isinstance(payload.get("models"), list):
+        return [str(m.get("name") or m.get("model")) for m in payload["models"] if isinstance(m, dict)]
+    return []
+
+
+def probe_endpoint(chat_url: str, headers: dict | None = None, model: str | None = None,
+                   ttl: float = 30.0, timeout: float = 5.0, force: bool = False,
+                   since: float = 0.0) -> bool:
+    """
+    Returns True if the server answers a model listing endpoint.
+    Results are cached per URL for `ttl` seconds; a cached result taken before
+    `since` (time.monotonic(), e.g. when a circuit opened) is not reused.
+    """
+    now = time.monotonic()
+    with _probe_lock:
+        hit = _probe_cache.get(chat_url)
+        if hit and not force and hit[0] >= since and (now - hit[0]) < ttl:
+            return hit[1]
+
+    ok = False
+    for url in probe_urls(chat_url):
+        try:
+            resp = requests.get(url, headers=headers or {}, timeout=timeout)
+        except requests.RequestException as e:
+            log.debug("Probe %s failed: %s", url, e)
+            # connection refused/timeout: the other path lives on the same host
+            break
+        if resp.status_code != 200:
+            continue
+        ok = True
+        try:
+            names = list_models(resp.json())
+        except ValueError:
+            names = []
+        if model and names and not any(n == model or n.split(":")[0] == model for n in names):
+            log.warning("⚠️  Model '%s' not listed by %s (available: %s)", model, url, ", ".join(names[:5]))
+        break
+
+    with _probe_lock:
+        _probe_cache[chat_url] = (time.monotonic(), ok)
+    return ok
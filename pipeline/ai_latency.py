@@ -0,0 +1,105 @@
+# pipeline/ai_latency.py
+"""
+Latency and throughput tracking for AI calls, with adaptive timeouts.
+
+The next call's timeout is derived from a rolling p99 of recent latencies
+(p99 × factor, interpolated between ranks), clamped to [min_timeout,
+max_timeout]. Until enough samples exist, the configured maximum is used.
+
+Timed-out calls are not latencies and stay out of the window: after one, the
+next call gets twice the timeout that was hit (a stall backs off), and the
+first call that completes goes back to the p99-based timeout.
+"""
+from __future__ import annotations
+
+import threading
+from collections import deque
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 100, factor: float = 3.0, min_timeout: float = 15.0,
+                 max_timeout: float = 300.0, min_samples: int = 5):
+        self.factor = float(factor)
+        self.min_timeout = float(min_timeout)
+        self.max_timeout = float(max_timeout)
+        self.min_samples = max(1, int(min_samples))
+        self._latencies: deque[float] = deque(maxlen=max(1, int(window)))
+        self._stall_timeout = 0.0   # last timeout hit since the last completed call (0 = none)
+        self._lock = threading.Lock()
+        # Run totals
+        self.calls = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.generation_seconds = 0.0  # only calls with a known completion token count
+
+    def record(self, seconds: float, completion_tokens: int | None = None,
+               prompt_tokens: int | None = None) -> float | None:
+        """Records a finished call. Returns its tokens/second (None if unknown)."""
+        with self._lock:
+            self._latencies.append(seconds)
+            self._stall_timeout = 0.0
+            self.calls += 1
+            self.total_seconds += seconds
+            if prompt_tokens:
+                self.prompt_tokens += int(prompt_tokens)
+            if completion_tokens:
+                self.completion_tokens += int(completion_tokens)
+                self.generation_seconds += seconds
+                return completion_tokens / seconds if seconds > 0 else None
+        return None
+
+    def record_timeout(self, timeout: float) -> None:
+        """A cut-off call: the next one gets twice this timeout, until a call completes."""
+        with self._lock:
+            self._stall_timeout = max(self._stall_timeout, float(timeout))
+            self.timeouts += 1
+
+    def percentile(self, q: float) -> float | None:
+        with self._lock:
+            data = sorted(self._latencies)
+        if not data:
+            return None
+        # linear interpolation between the closest ranks
+        pos = q / 100.0 * (len(data) - 1)
+        lo = int(pos)
+        hi = min(lo + 1, len(data) - 1)
+        return data[lo] + (data[hi] - data[lo]) * (pos - lo)
+
+    def next_timeout(self) -> float:
+        with self._lock:
+            n = len(self._latencies)
+            stall = self._stall_timeout
+        if n < self.min_samples:
+            return self.max_timeout
+        p99 = self.percentile(99) or self.max_timeout
+        timeout = max(self.min_timeout, p99 * self.factor, 2 * stall)
+        return min(self.max_timeout, timeout)
+
+    def mean_seconds(self) -> float | None:
+        return (self.total_seconds / self.calls) if self.calls else None
+
+    def tokens_per_second(self) -> float | None:
+        if self.generation_seconds <= 0:
+            return None
+        return self.completion_tokens / self.generation_seconds
+
+    def summary(self) -> dict:
+        tps = self.tokens_per_second()
+        return {
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "p50_s": _round(self.percentile(50)),
+            "p95_s": _round(self.percentile(95)),
+            "p99_s": _round(self.percentile(99)),
+            "mean_s": _round(self.mean_seconds()),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "tokens_per_s": _round(tps),
+            "next_timeout_s": _round(self.next_timeout()),
+        }
+
+
+def _round(v: float | None) -> float | None:
+    return None if v is None else round(v, 2)
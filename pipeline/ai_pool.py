@@ -0,0 +1,96 @@
+# pipeline/ai_pool.py
+"""
+Pool of OpenAI-compatible AI endpoints serving the same model.
+
+Each endpoint keeps its own circuit breaker, latency tracker and counters.
+Requests go to the healthy endpoint with the fewest outstanding requests,
+then the least work so far weighted by its mean latency ((calls + 1) × mean):
+with sequential calls each endpoint gets a share proportional to its speed,
+and an endpoint without latency samples yet is tried first.
+"""
+from __future__ import annotations
+
+import threading
+
+from pipeline.ai_health import CircuitBreaker
+from pipeline.ai_latency import LatencyTracker
+
+
+class Endpoint:
+    def __init__(self, url: str, model: str, api_key: str | None = None,
+                 breaker: CircuitBreaker | None = None, latency: LatencyTracker | None = None):
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.breaker = breaker or CircuitBreaker(url)
+        self.latency = latency or LatencyTracker()
+        # Provider-specific request fields (e.g. Ollama keep_alive, set by AISession)
+        self.extra_body: dict = {}
+        # "ollama" once AISession has loaded the model through the native API (None = unknown)
+        self.kind: str | None = None
+        # False after the server rejected a JSON-schema constrained request
+        self.structured_ok = True
+        self.in_flight = 0
+        self.calls = 0     # requests sent (a retry without structured output is the same request)
+        self.failures = 0
+
+    def headers(self) -> dict:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def load(self) -> float:
+        """Work it would have after one more request, in mean-latency seconds (0 = no samples yet)."""
+        return (self.calls + 1) * (self.latency.mean_seconds() or 0.0)
+
+    def usable(self) -> bool:
+        """Closed, or open but due for a half-open trial."""
+        return not self.breaker.is_open or self.breaker.cooldown_elapsed()
+
+    def summary(self) -> dict:
+        return {
+            **self.latency.summary(),
+            "url": self.url,
+            "model": self.model,
+            "state": self.breaker.state,
+            "calls": self.calls,  # attempts, including failed ones
+            "failures": self.failures,
+            "circuit_opened": self.breaker.times_opened,
+        }
+
+
+class BackendPool:
+    def __init__(self, endpoints: list[Endpoint]):
+        if not endpoints:
+            raise ValueError("BackendPool needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self._lock = threading.Lock()
+
+    def acquire(self, exclude: set[str] | None = None) -> Endpoint | None:
+        """
+        Reserves the least-loaded usable endpoint (not in `exclude`) and counts the request.
+        Returns None if every endpoint is excluded or has its circuit open.
+        """
+        exclude = exclude or set()
+        with self._lock:
+            ranked = sorted(
+                (ep for ep in self.endpoints if ep.url not in exclude and ep.usable()),
+                key=lambda ep: (ep.in_flight, ep.load(), ep.calls),
+            )
+            for ep in ranked:
+                if ep.breaker.allow_request():
+                    ep.in_flight += 1
+                    ep.calls += 1
+                    return ep
+        return None
+
+    def release(self, ep: Endpoint) -> None:
+        with self._lock:
+            ep.in_flight = max(0, ep.in_flight - 1)
+
+    def any_usable(self) -> bool:
+        return any(ep.usable() for ep in self.endpoints)
+
+    def all_open(self) -> bool:
+        return all(ep.breaker.is_open for ep in self.endpoints)
@@ -0,0 +1,152 @@
+# pipeline/ai_session.py
+"""
+AI session manager: warm-up, keep-alive and release of the model around a run.
+
+On Ollama the model is preloaded with an empty /api/generate request, pinned with
+`keep_alive` for the whole run (re-pinned periodically, since every /v1 request
+resets Ollama's expiry to its default) and unloaded at the end with keep_alive=0.
+Other OpenAI-compatible servers get a 1-token warm-up completion.
+
+Load time is reported separately, so cold-start cost does not hide in the
+per-note inference latencies tracked by ai_client.
+
+With several endpoints in the AI pool, every endpoint is warmed, pinned and
+released on its own.
+"""
+from __future__ import annotations
+
+import atexit
+import threading
+import time
+
+import requests
+import pipeline.ai_client as ai_client
+from config.app_config import load_params
+from config.logger_config import get_logger
+from pipeline.ai_health import base_url
+from pipeline.ai_pool import Endpoint
+
+cfg = load_params()
+log = get_logger(__name__)
+
+AI_PRELOAD           = bool(cfg.ai.get("preload", True))
+AI_KEEP_ALIVE        = cfg.ai.get("keep_alive", "30m")
+AI_KEEP_ALIVE_REFRESH = float(cfg.ai.get("keep_alive_refresh", 240))
+AI_PRELOAD_TIMEOUT   = float(cfg.ai.get("preload_timeout", 300))
+
+
+class AISession:
+    def __init__(self, endpoints: list[Endpoint] | None = None,
+                 keep_alive=AI_KEEP_ALIVE, refresh_every: float = AI_KEEP_ALIVE_REFRESH):
+        self.endpoints = list(endpoints) if endpoints is not None else list(ai_client.AI_POOL.endpoints)
+        self.keep_alive = keep_alive
+        self.refresh_every = float(refresh_every)
+        self.ollama: set[str] = set()
+        self.load_seconds: dict[str, float] = {}
+        self.started_at: float | None = None
+        self._stop = threading.Event()
+        self._refresher: threading.Thread | None = None
+        self._active = False
+
+    # -- context manager ------------------------------------------------------
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    # -- lifecycle ------------------------------------------------------------
+    def start(self) -> "AISession":
+        if self._active:
+            return self
+        self._active = True
+        self.started_at = time.perf_counter()
+        atexit.register(self.stop)
+        if AI_PRELOAD:
+            for ep in self.endpoints:
+                self.preload(ep)
+        pinned = [ep for ep in self.endpoints if ep.url in self.ollama]
+        if pinned and self.keep_alive is not None:
+            for ep in pinned:
+                ep.extra_body["keep_alive"] = self.keep_alive
+            if self.refresh_every > 0:
+                self._refresher = threading.Thread(target=self._refresh_loop, name="ai-keep-alive", daemon=True)
+                self._refresher.start()
+        return self
+
+    def stop(self) -> None:
+        if not self._active:
+            return
+        self._active = False
+        self._stop.set()
+        for ep in self.endpoints:
+            ep.extra_body.pop("keep_alive", None)
+            if ep.url in self.ollama:
+                self.release(ep)
+        self.log_summary()
+
+    # -- Ollama native endpoints ------------------------------------------------
+    def _generate(self, ep: Endpoint, keep_alive, timeout: float) -> requests.Response:
+        body = {"model": ep.model, "prompt": "", "stream": False, "keep_alive": keep_alive}
+        return requests.post(f"{base_url(ep.url)}/api/generate", json=body, timeout=timeout)
+
+    def preload(self, ep: Endpoint) -> None:
+        """Loads the model before analysis starts and records the load time."""
+        if ep.breaker.is_open:
+            return
+        t0 = time.perf_counter()
+        try:
+            resp = self._generate(ep, self.keep_alive, AI_PRELOAD_TIMEOUT)
+            if resp.status_code == 200:
+                self.ollama.add(ep.url)
+                ep.kind = "ollama"
+                data = resp.json()
+                # Ollama reports nanoseconds; 0 means the model was already resident
+                load_ns = data.get("load_duration")
+                load = (load_ns / 1e9) if isinstance(load_ns, (int, float)) else time.perf_counter() - t0
+                self.load_seconds[ep.url] = load
+                log.info("🔥 Model %s preloaded in %.1fs on %s (keep_alive=%s)", ep.model, load, ep.url, self.keep_alive)
+                return
+        except (requests.RequestException, ValueError) as e:
+            log.debug("Ollama preload not available on %s: %s", ep.url, e)
+
+        # Not Ollama: a 1-token completion warms the model without touching latency stats
+        t0 = time.perf_counter()
+        body = {"model": ep.model, "messages": [{"role": "user", "content": "Hi"}], "max_tokens": 1}
+        try:
+            resp = requests.post(ep.url, headers=ep.headers(), json=body, timeout=AI_PRELOAD_TIMEOUT)
+            if resp.status_code == 200:
+                self.load_seconds[ep.url] = time.perf_counter() - t0
+                log.info("🔥 Model %s warmed up in %.1fs on %s", ep.model, self.load_seconds[ep.url], ep.url)
+            else:
+                log.warning("⚠️  Model warm-up on %s returned %s", ep.url, resp.status_code)
+        except requests.RequestException as e:
+            log.warning("⚠️  Model warm-up on %s failed: %s", ep.url, e)
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.wait(self.refresh_every):
+            for ep in self.endpoints:
+                if ep.url not in self.ollama:
+                    continue
+                try:
+                    self._generate(ep, self.keep_alive, 30)
+                except requests.RequestException as e:
+                    log.debug("keep_alive refresh on %s failed: %s", ep.url, e)
+
+    def release(self, ep: Endpoint) -> None:
+        """Unloads the model (keep_alive=0) so it does not hold memory after the run."""
+        try:
+            resp = self._generate(ep, 0, 30)
+            if resp.status_code == 200:
+                log.info("💤 Model %s released on %s", ep.model, ep.url)
+        except requests.RequestException as e:
+            log.debug("Model release on %s failed: %s", ep.url, e)
+
+    def log_summary(self) -> None:
+        stats = ai_client.AI_LATENCY.summary()
+        wall = (time.perf_counter() - self.started_at) if self.started_at else 0.0
+        load = f"{sum(self.load_seconds.values()):.1f}s" if self.load_seconds else "n/a"
+        log.info("🤖 AI session: load %s · inference %d calls, %.1fs total (mean %ss) · session %.1fs",
+                 load, stats["calls"], ai_client.AI_LATENCY.total_seconds, stats["mean_s"], wall)
@@ -0,0 +1,196 @@
+# pipeline/bench_ai_pipeline.py
+"""
+End-to-end benchmark of the AI path of process() against the local stub server.
+
+Notion is replaced by synthetic notes, and the AI pool is pointed to
+pipeline.stub_ai_server. Outputs go to a temporary directory. The rest of
+process() runs unchanged: tags, analyze_ai scheduling/retries/parsing,
+postprocess, validation and the sigma export.
+
+Usage:
+    python -m pipeline.bench_ai_pipeline --notes 60 --latency 0.2 --tps 50 --malformed-rate 0.1 --error-rate 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+# process() never reaches Notion here, but loading the config requires the variables
+os.environ.setdefault("NOTION_TOKEN", "bench")
+os.environ.setdefault("DATABASE_ID", "bench")
+
+import pipeline.ai_client as ai_client
+import pipeline.parses.robust_ai_parser as ai_parser
+import pipeline.retrieval.semantic_index as semantic_index
+import pipeline.suggest_connections_digital_brain as brain
+from config.logger_config import setup_logging, get_logger
+from pipeline.ai_pool import BackendPool, Endpoint
+from pipeline.json_to_sigma import convert_for_sigma
+from pipeline.stub_ai_server import StubConfig, chat_url, embeddings_url, start_stub_server
+
+log = get_logger(__name__)
+
+_TAGS = ["filosofia", "ètica", "ciència", "memòria", "tecnologia", "llenguatge", "política",
+         "aprenentatge", "xarxes", "creativitat", "història", "psicologia", "economia", "art"]
+_WORDS = ["coneixement", "sistema", "relació", "concepte", "argument", "context", "procés",
+          "estructura", "model", "teoria", "pràctica", "idea", "xarxa", "memòria", "canvi"]
+
+
+def synthetic_notes(n: int, reading_share: float = 0.4, seed: int = 0,
+                    duplicate_share: float = 0.0) -> dict[str, list[dict]]:
+    """
+    Deterministic notes shaped like notion_api.get_notes_by_type() output.
+    `duplicate_share` of them copy an earlier note's content with a few words changed.
+    """
+    rng = random.Random(seed)
+    out: dict[str, list[dict]] = {"Nota permanent": [], "Nota de lectura": [], "Nota índex": []}
+    contents: list[str] = []
+    for i in range(n):
+        nid = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        tags = [{"name": t} for t in rng.sample(_TAGS, rng.randint(1, 4))]
+        content = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(40, 160)))
+        if duplicate_share and contents and rng.random() < duplicate_share:
+            words = rng.choice(contents).split()
+            for _ in range(max(1, len(words) // 50)):
+                words[rng.randrange(len(words))] = rng.choice(_WORDS)
+            content = " ".join(words)
+        contents.append(content)
+        kind = "Nota de lectura" if rng.random() < reading_share else "Nota permanent"
+        out[kind].append({
+            "id": nid,
+            "titulo": f"Nota {i:04d} sobre {rng.choice(_WORDS)} i {rng.choice(_WORDS)}",
+            "tags": tags,
+            "projects": [],
+            "project_ids": [],
+            "contenido": content,
+            "mentions": [],
+            "url": brain.notion_url(nid),
+        })
+    return out
+
+
+def _offline(notes: dict[str, list[dict]], out_dir: Path) -> None:
+    """Replaces Notion access and output paths of the pipeline module for this process."""
+    brain.get_notes = lambda select_type: list(notes.get(select_type, []))
+    brain.get_database_properties = lambda **kw: {"properties": {}}
+    brain.query_database = lambda **kw: {"results": []}
+    brain.update_page_relations = lambda *a, **kw: None
+    brain._get_relations_links_to = lambda page_id, **kw: []
+    brain._enviar_email = lambda *a, **kw: None
+    brain.DELAY_ENTRE_NOTAS = 0
+    brain.OUT_JSON = out_dir / "suggestions.json"
+    brain.OUT_GRAPH = out_dir / "graph_sigma.json"
+    brain.OUT_VERSION = out_dir / "graph_version.json"
+    brain.OUT_CHANGES = out_dir / "changes.json"
+    brain.convert_for_sigma = lambda **kw: convert_for_sigma(sugg_path=out_dir / "suggestions.json",
+                                                             out_path=out_dir / "graph_sigma.json", **kw)
+
+
+def _use_stub(urls: list[str], model: str) -> None:
+    """Points the AI pool at the stub endpoint(s) with fresh health/latency state."""
+    ai_client.AI_POOL = BackendPool([
+        Endpoint(url, model, ai_client.AI_API_KEY,
+                 breaker=ai_client._new_breaker(url), latency=ai_client._new_latency())
+        for url in urls
+    ])
+    ai_client.AI_LATENCY = ai_client._new_latency()
+
+
+def _use_structured(mode: str | None) -> None:
+    """Overrides ai.structured_output for this process (None = free-form JSON)."""
+    ai_client.AI_STRUCTURED_OUTPUT = mode
+    ai_parser.AI_STRUCTURED_OUTPUT = mode
+
+
+def run(args) -> dict:
+    stub_cfg = StubConfig(model=args.model, latency=args.latency, jitter=args.jitter,
+                          tokens_per_second=args.tps, malformed_rate=args.malformed_rate,
+                          error_rate=args.error_rate, match_rate=args.match_rate, seed=args.seed)
+    servers = [start_stub_server(config=stub_cfg) for _ in range(max(1, args.endpoints))]
+    notes = synthetic_notes(args.notes, seed=args.seed, duplicate_share=args.duplicates)
+
+    with tempfile.TemporaryDirectory(prefix="bench_ai_") as tmp:
+        _offline(notes, Path(tmp))
+        _use_stub([chat_url(s) for s in servers], args.model)
+        # Embeddings from the first stub, cached in the temporary directory
+        semantic_index.RETRIEVAL_ENABLED = not args.no_retrieval
+        semantic_index.EMBED_URL = embeddings_url(servers[0])
+        semantic_index.EMBED_STORE_PATH = Path(tmp) / "embeddings.npz"
+        if args.structured is not None:
+            _use_structured(args.structured or None)
+
+        t0 = time.perf_counter()
+        brain.process()
+        wall = time.perf_counter() - t0
+
+        graph = json.loads((Path(tmp) / "suggestions.json").read_text(encoding="utf-8"))
+
+    for s in servers:
+        s.shutdown()
+
+    analyzed = len(notes["Nota permanent"]) + len(notes["Nota de lectura"])
+    stub = [s.stub_stats.summary() for s in servers]
+    requests_total = sum(s["requests"] for s in stub)
+    ai_edges = sum(1 for e in graph.get("edges", []) if "ai" in (e.get("evidence") or []))
+    dup_edges = sum(1 for e in graph.get("edges", []) if "near_duplicate" in (e.get("evidence") or []))
+    return {
+        "notes": analyzed,
+        "wall_s": round(wall, 2),
+        "notes_per_s": round(analyzed / wall, 3) if wall else None,
+        "ai_requests": requests_total,
+        "calls_per_s": round(requests_total / wall, 3) if wall else None,
+        "ai_edges": ai_edges,
+        "near_duplicate_edges": dup_edges,
+        "stub": stub,
+        "client": ai_client.AI_LATENCY.summary(),
+        "parser": {mode: dict(st) for mode, st in ai_parser.MODE_STATS.items() if st["calls"]},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark process() against the local stub AI server")
+    ap.add_argument("--notes", type=int, default=40)
+    ap.add_argument("--endpoints", type=int, default=1, help="number of stub servers in the AI pool")
+    ap.add_argument("--model", default="stub-model")
+    ap.add_argument("--latency", type=float, default=0.1)
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--tps", type=float, default=0.0)
+    ap.add_argument("--malformed-rate", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--match-rate", type=float, default=0.3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--structured", nargs="?", const="json_schema", default=None,
+                    choices=["", "json_schema", "ollama", "auto"],
+                    help="override ai.structured_output ('' = off)")
+    ap.add_argument("--no-retrieval", action="store_true", help="disable embedding candidate pre-selection")
+    ap.add_argument("--duplicates", type=float, default=0.0, help="share of near-duplicate synthetic notes")
+    ap.add_argument("--json", dest="json_out", help="also write the report to this file")
+    args = ap.parse_args()
+
+    setup_logging("WARNING")
+    report = run(args)
+
+    print("=" * 60)
+    print(f"📈 {report['notes']} notes in {report['wall_s']}s → {report['notes_per_s']} notes/s")
+    print(f"🤖 {report['ai_requests']} AI requests → {report['calls_per_s']} calls/s · {report['ai_edges']} AI edges kept"
+          f" · {report['near_duplicate_edges']} near-duplicate edges")
+    for i, s in enumerate(report["stub"]):
+        print(f"   stub[{i}]: {s}")
+    c = report["client"]
+    print(f"   client: p50={c['p50_s']}s p99={c['p99_s']}s timeouts={c['timeouts']} tok/s={c['tokens_per_s']}")
+    for mode, st in report["parser"].items():
+        print(f"   parser[{mode}]: {st}")
+    print("=" * 60)
+
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
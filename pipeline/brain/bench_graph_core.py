@@ -0,0 +1,124 @@
+# pipeline/brain/bench_graph_core.py
+"""
+Time and memory per consolidation stage: list-of-dict edges vs the columnar GraphCore.
+
+Synthetic nodes (UUIDs + tag nodes) and raw pipeline edges (several per pair)
+go through one EdgeStore; then both representations run the same stages:
+  build   final edges (validated, similarity cut) – store.edges() / store.core()
+  json    serialization – json.dumps of the dicts / of core.to_graph()
+  prune   top-K per node – prune_edges() over the dicts / store.core(topk)
+Each stage runs twice: timed without tracing, then under tracemalloc for
+memory retained (still alive after the stage) and peak (during the stage).
+Edges of both paths are checked to be equal.
+
+Usage:
+    python -m pipeline.brain.bench_graph_core --notes 20000 --edges 400000 --topk 3
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+# EdgeStore pulls in the config, which requires the variables
+os.environ.setdefault("NOTION_TOKEN", "bench")
+os.environ.setdefault("DATABASE_ID", "bench")
+
+from config.logger_config import setup_logging
+from pipeline.brain.edge_pruner import prune_edges
+from pipeline.brain.edge_store import EdgeStore
+
+_EVIDENCE = [["ai"], ["ai"], ["ai"], ["explicit"], ["tags_inferred"], ["tag"], ["near_duplicate"]]
+_REASONS = ["ref: Enllaça a", "comparteixen el concepte de memòria i aprenentatge", "common tags: ètica",
+            "tagged with: art", "el mateix argument sobre xarxes socials i política"]
+
+
+def synthetic_graph(notes: int, edges: int, tags: int = 50, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    ids = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(notes)]
+    tag_ids = [f"tag::t{i}" for i in range(tags)]
+    nodes = [{"id": nid, "title": f"Nota {i}", "tags": rng.sample(range(tags), 2), "projects": []}
+             for i, nid in enumerate(ids)]
+    nodes += [{"id": t, "title": t, "tags": [], "projects": []} for t in tag_ids]
+    raw = []
+    for _ in range(edges):
+        ev = rng.choice(_EVIDENCE)
+        target = rng.choice(tag_ids) if ev == ["tag"] else rng.choice(ids)
+        raw.append({
+            "source": rng.choice(ids), "target": target, "evidence": ev,
+            "dashes": ev == ["ai"], "similarity": rng.randint(40, 100), "score": rng.random(),
+            "reason": rng.choice(_REASONS),
+        })
+    return {"nodes": nodes, "edges": raw}
+
+
+def _measure(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    del result
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    result = fn()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"s": round(elapsed, 3), "retained_mb": round((after - before) / 1e6, 1),
+                    "peak_mb": round((peak - before) / 1e6, 1)}
+
+
+def run(args) -> dict:
+    graph = synthetic_graph(args.notes, args.edges, seed=args.seed)
+    store, ingest = _measure(lambda: EdgeStore(graph["nodes"], min_sim=args.min_sim).extend(graph["edges"]))
+
+    dicts, core = {}, {}
+    edges, dicts["build"] = _measure(store.edges)
+    text_dicts, dicts["json"] = _measure(lambda: json.dumps({"nodes": graph["nodes"], "edges": edges},
+                                                            ensure_ascii=False))
+    del text_dicts
+
+    graph_core, core["build"] = _measure(store.core)
+    text_core, core["json"] = _measure(lambda: json.dumps(graph_core.to_graph(), ensure_ascii=False))
+    del text_core
+    (pruned, _), dicts["prune"] = _measure(lambda: prune_edges(edges, None, args.topk))
+    pruned_core, core["prune"] = _measure(lambda: store.core(topk=args.topk))
+
+    return {
+        "nodes": len(graph["nodes"]), "raw_edges": len(graph["edges"]), "pairs": len(store),
+        "kept": len(edges), "kept_topk": len(pruned), "topk": args.topk,
+        "equal": graph_core.edges() == edges and pruned_core.edges() == pruned,
+        "ingest": ingest, "dicts": dicts, "core": core,
+        "core_nbytes_mb": round(graph_core.nbytes() / 1e6, 1),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Dict vs columnar edges: time and memory per stage")
+    ap.add_argument("--notes", type=int, default=20000)
+    ap.add_argument("--edges", type=int, default=400000)
+    ap.add_argument("--topk", type=int, default=3)
+    ap.add_argument("--min-sim", type=int, default=60)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", dest="json_out", help="also write the report to this file")
+    args = ap.parse_args()
+
+    setup_logging("WARNING")
+    report = run(args)
+    print("=" * 60)
+    print(f"📦 {report['nodes']} nodes · {report['raw_edges']} raw edges → {report['pairs']} pairs → "
+          f"{report['kept']} kept → {report['kept_topk']} top-{report['topk']} · outputs equal: {report['equal']}")
+    print(f"   ingest (shared): {report['ingest']}")
+    for stage in ("build", "json", "prune"):
+        print(f"   {stage:<5} dicts: {report['dicts'][stage]}")
+        print(f"   {stage:<5} core:  {report['core'][stage]}")
+    print("=" * 60)
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# pipeline/brain/edge_pruner.py
+"""
+Min-similarity cut and top-K-per-node pruning of merged graph edges, in one pass.
+
+The rule is the greedy one: walking the edges by (similarity, source, target)
+descending, an edge is kept while either of its endpoints has fewer than K
+kept edges. That is exactly "the edge is among the K best edges of at least
+one endpoint", so a bounded min-heap of the K best edges per node decides it
+without sorting every edge first. Edges can arrive from any iterable (a
+stream, e.g. EdgeStore.core() finalizing pairs one by one); only the heaps
+are held in memory.
+"""
+from __future__ import annotations
+
+import heapq
+from collections import Counter
+from typing import Iterable, Optional
+
+from config.logger_config import get_logger
+
+log = get_logger(__name__)
+
+
+def similarity_rank(e: dict) -> int:
+    """Similarity used for ordering (explicit edges without one go last)."""
+    s = e.get("similarity")
+    return -1 if s is None else int(s)
+
+
+def _evidence(e: dict) -> tuple:
+    return tuple(e.get("evidence") or ("unknown",))
+
+
+def _by_label(counts: Counter) -> Counter:
+    """Counts per evidence combination → counts per evidence type."""
+    out: Counter = Counter()
+    for evidence, n in counts.items():
+        for ev in evidence:
+            out[ev] += n
+    return out
+
+
+class TopKPruner:
+    def __init__(self, min_similarity: Optional[int] = None, topk: Optional[int] = None):
+        """None disables the similarity cut; None or topk <= 0 disables top-K."""
+        self.min_similarity = min_similarity
+        self.topk = topk if topk is not None and topk > 0 else None
+        self._heaps: dict[str, list] = {}   # node -> min-heap of (rank, -seq, edge)
+        self._passed: list[dict] = []       # without top-K: every edge over the cut
+        self.seen = 0
+        self.dropped_min = 0
+        self.passed_by: Counter = Counter()        # per evidence combination (tuple)
+        self.dropped_min_by: Counter = Counter()
+
+    def _passes_min(self, e: dict) -> bool:
+        if self.min_similarity is None:
+            return True
+        sim = e.get("similarity")
+        try:
+            return (sim is None) or (int(sim) >= self.min_similarity)  # explicit ones can carry None
+        except Exception:
+            return True
+
+    def add(self, e: dict) -> None:
+        seq = self.seen
+        self.seen += 1
+        if not self._passes_min(e):
+            self.dropped_min += 1
+            self.dropped_min_by[_evidence(e)] += 1
+            return
+        self.passed_by[_evidence(e)] += 1
+        if self.topk is None:
+            self._passed.append(e)
+            return
+        # Ties keep input order (like the stable sort): earlier = larger -seq = better
+        item = ((similarity_rank(e), e["source"], e["target"]), -seq, e)
+        # A self-loop takes two slots of its node, as in the greedy rule
+        for node in (e["source"], e["target"]):
+            heap = self._heaps.setdefault(node, [])
+            if len(heap) < self.topk:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+    def extend(self, edges: Iterable[dict]) -> "TopKPruner":
+        for e in edges:
+            self.add(e)
+        return self
+
+    def kept(self) -> list[dict]:
+        """Surviving edges: best first with top-K, else in input order."""
+        if self.topk is None:
+            return list(self._passed)
+        best = {item[1]: item for heap in self._heaps.values() for item in heap}
+        return [item[2] for item in sorted(best.values(), key=lambda it: it[:2], reverse=True)]
+
+    def stats(self, kept: list[dict]) -> dict:
+        """Edges kept / dropped by the similarity cut / dropped by top-K, overall and per evidence type."""
+        kept_by = _by_label(Counter(map(_evidence, kept)))
+        passed_by, dropped_min_by = _by_label(self.passed_by), _by_label(self.dropped_min_by)
+        passed = self.seen - self.dropped_min
+        return {
+            "seen": self.seen,
+            "kept": len(kept),
+            "dropped_min_similarity": self.dropped_min,
+            "dropped_topk": passed - len(kept),
+            "by_evidence": {
+                ev: {
+                    "kept": kept_by[ev],
+                    "dropped_min_similarity": dropped_min_by[ev],
+                    "dropped_topk": passed_by[ev] - kept_by[ev],
+                }
+                for ev in sorted(set(passed_by) | set(dropped_min_by))
+            },
+        }
+
+
+def prune_edges(edges: Iterable[dict], min_similarity: Optional[int] = None,
+                topk: Optional[int] = None) -> tuple[list[dict], dict]:
+    """Prunes `edges` (any iterable); returns (kept edges, stats) and logs the stats."""
+    pruner = TopKPruner(min_similarity, topk).extend(edges)
+    kept = pruner.kept()
+    stats = pruner.stats(kept)
+    log_stats(stats, min_similarity, topk)
+    return kept, stats
+
+
+def log_stats(stats: dict, min_similarity: Optional[int] = None, topk: Optional[int] = None) -> None:
+    """Logs TopKPruner.stats(), overall and per evidence type."""
+    log.info("✂️ Pruning (min_similarity=%s, topk=%s): kept %d of %d · dropped %d by similarity, %d by top-K",
+             min_similarity, topk, stats["kept"], stats["seen"],
+             stats["dropped_min_similarity"], stats["dropped_topk"])
+    for ev, st in stats["by_evidence"].items():
+        log.info("   %s: kept %d · dropped %d by similarity, %d by top-K",
+                 ev, st["kept"], st["dropped_min_similarity"], st["dropped_topk"])
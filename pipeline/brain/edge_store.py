@@ -0,0 +1,421 @@
+# pipeline/brain/edge_store.py
+"""
+Single-pass edge consolidation: validation, per-pair merge and similarity cut.
+
+Edges are keyed by (min id, max id). Every incoming edge is checked once
+(UUID ids, known nodes, no self-loops) and merged in place into its pair's
+entry: evidence union, max similarity and score, collected reasons. edges()
+then builds each pair's final edge once and applies the min-similarity cut;
+core() streams them through edge_pruner's TopKPruner (cut and optional top-K
+per node) into a columnar GraphCore.
+
+Two kinds of input:
+  add()   raw pipeline edges ("reason", evidence as given by the analyzers);
+  merge() already consolidated edges ("reasons"), merged with merge_edge as
+          validate_graph always did, with the similarity cut applied on input;
+          merge_all() does the same for a whole batch with NumPy masks.
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Iterable, Optional
+
+import numpy as np
+
+from config.text_normalization import normalize_text
+from pipeline.brain.edge_pruner import TopKPruner
+from pipeline.brain.graph_core import GraphCore
+
+UUID_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.I)
+
+
+def is_uuid(x: str) -> bool:
+    if not isinstance(x, str):
+        return False
+    if x.startswith("tag::"):
+        return True
+    return bool(UUID_RE.match(x))
+
+
+def _overlap_tag(tag) -> str:
+    if isinstance(tag, dict):
+        tag = tag.get("name") or tag.get("title") or ""
+    tag = str(tag or "").strip().casefold()
+    tag = unicodedata.normalize("NFD", tag)
+    return "".join(ch for ch in tag if unicodedata.category(ch) != "Mn")
+
+
+def tag_features(tags) -> frozenset[str]:
+    """Normalized tag set compared for tags_overlap."""
+    return frozenset(t for t in map(_overlap_tag, tags or []) if t)
+
+
+def project_features(projects) -> frozenset[str]:
+    """Normalized project set compared for project_overlap."""
+    return frozenset((p or "").strip().casefold() for p in (projects or []))
+
+
+def edge_evidence(e: dict) -> set[str]:
+    """Evidence set of a raw edge ('evidence' if given, else inferred from dashes; via_tags adds 'tags')."""
+    ev_list = e.get("evidence")
+    if isinstance(ev_list, str):
+        ev_list = [ev_list]
+    ev_set = {(x or "").strip().lower() for x in (ev_list or []) if isinstance(x, str) and x.strip()}
+    if not ev_set:
+        # old compatibility: infer from dashes if needed
+        ev_set = {"ai"} if e.get("dashes", False) else {"explicit"}
+    if e.get("via_tags"):
+        ev_set.add("tags")
+    return ev_set
+
+
+def display_similarity(e: dict) -> int:
+    """Integer similarity of an edge; derived from 'score' (0..1 or 0..100) when missing, else 0."""
+    sim = e.get("similarity")
+    if sim is None:
+        sc = e.get("score")
+        if isinstance(sc, (int, float)):
+            sim = int(round(sc*100)) if sc <= 1 else int(round(sc))
+        else:
+            sim = 0
+    try:
+        return int(sim)
+    except Exception:
+        return 0
+
+
+_PLAIN = (int, float)
+_EXACT = 2.0 ** 53   # ints beyond this lose precision as float64
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def _numbers(values: list) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(float64 values, None mask, odd mask): odd = anything but a finite int/float below 2**53."""
+    n = len(values)
+    types = set(map(type, values))
+    arr = None
+    if types <= {int, float, type(None)}:
+        try:
+            arr = np.array(values, dtype=np.float64)   # None → NaN
+            none = np.equal(np.array(values, dtype=object), None) if type(None) in types else np.zeros(n, bool)
+            odd = np.zeros(n, dtype=bool)
+        except OverflowError:
+            arr = None
+    if arr is None:
+        none = np.fromiter((v is None for v in values), dtype=bool, count=n)
+        odd = np.fromiter((type(v) not in _PLAIN for v in values), dtype=bool, count=n) & ~none
+        arr = np.array([v if type(v) is float or (type(v) is int and abs(v) < _EXACT) else np.nan
+                        for v in values], dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        odd |= ~none & ~(np.abs(arr) < _EXACT)   # NaN, ±inf, huge ints
+    return arr, none, odd
+
+
+def display_similarities(edges: list[dict], where: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    display_similarity of every edge, vectorized. Unusual values (strings, bools,
+    NaN, huge ints) take the scalar path, only on rows of the `where` mask if given;
+    if one of them does not fit in int64 the result is an object array of Python ints.
+    """
+    out = np.zeros(len(edges), dtype=np.int64)
+    sim, sim_none, odd = _numbers([e.get("similarity") for e in edges])
+    plain = ~sim_none & ~odd
+    out[plain] = np.trunc(sim[plain])
+    derived = np.flatnonzero(sim_none)
+    if len(derived):
+        sc, sc_none, sc_odd = _numbers([edges[i].get("score") for i in derived.tolist()])
+        ok = ~sc_none & ~sc_odd
+        v = sc[ok]
+        out[derived[ok]] = np.where(v <= 1, np.round(v * 100), np.round(v))
+        odd[derived[sc_odd]] = True
+    if where is not None:
+        odd &= where
+    for row in np.flatnonzero(odd).tolist():
+        value = display_similarity(edges[row])
+        if out.dtype != object and not _INT64_MIN <= value <= _INT64_MAX:
+            out = out.astype(object)
+        out[row] = value
+    return out
+
+
+def merge_edge(a, b):
+    """Fusiona dues arestes (mateixa parella) conservant màxim similarity i unió d'evidències/raons."""
+    out = dict(a)
+    # similarity → màxim
+    sa = a.get("similarity"); sb = b.get("similarity")
+    if isinstance(sa, (int, float)) or isinstance(sb, (int, float)):
+        out["similarity"] = max(sa or 0, sb or 0)
+    # score → màxim si existeix
+    if isinstance(a.get("score"), (int, float)) or isinstance(b.get("score"), (int, float)):
+        out["score"] = max(a.get("score") or 0, b.get("score") or 0)
+    # evidence → unió
+    ev = set()
+    for e in (a.get("evidence"), b.get("evidence")):
+        if isinstance(e, list): ev.update(e)
+        elif isinstance(e, str): ev.add(e)
+    out["evidence"] = sorted(ev) if ev else out.get("evidence", [])
+    # reasons → úniques
+    rs = []
+    for rlist in (a.get("reasons"), b.get("reasons")):
+        if isinstance(rlist, list):
+            for r in rlist:
+                if r and r not in rs:
+                    rs.append(r)
+        elif isinstance(rlist, str) and rlist and rlist not in rs:
+            rs.append(rlist)
+    if rs:
+        out["reasons"] = rs
+    return out
+
+
+def _direction(evidence: set[str], reasons: list[str]) -> tuple[bool, str]:
+    """Directionality, only for explicit evidence, from the link wording of the reasons."""
+    if "explicit" in evidence:
+        reasons_lower = [r.lower() for r in reasons]
+        if any("enllaça a" in r for r in reasons_lower):
+            return True, "source_to_target"
+        if any("enllaçat per" in r or "referenciat per" in r for r in reasons_lower):
+            return True, "target_to_source"
+    return False, "undirected"
+
+
+class EdgeStore:
+    def __init__(self, nodes: Iterable[dict], min_sim: int = 0, dedup: bool = True):
+        """
+        Keeps only UUID nodes, drops edges with invalid/unknown ids or self-loops,
+        and cuts edges below `min_sim` (similarity derived from score when missing).
+        dedup: merge edges of the same pair (merge() input only; raw edges always merge).
+        """
+        nodes = list(nodes or [])
+        self.min_sim = min_sim
+        self.dedup = dedup
+        self.nodes = [n for n in nodes if is_uuid(n.get("id"))]
+        self._id2node = {n["id"]: n for n in self.nodes}
+        self._index = {nid: i for i, nid in enumerate(self._id2node)}   # interned node ids
+        self._node_features: Optional[dict] = None
+        self._entries: dict[tuple, dict] = {}      # raw edges, consolidated per pair
+        self._merged: dict = {}                     # merge() edges, per pair (or per position without dedup)
+        self._cut_on_input = 0
+        self.stats = dict(
+            total_nodes=len(nodes), valid_nodes=len(self.nodes),
+            total_edges=0, kept_edges=0,
+            removed_selfloops=0, removed_invalid_ids=0, removed_low_sim=0, dedup_merged=0
+        )
+
+    @property
+    def _features(self) -> dict:
+        # Node features once per node, not per edge (raw add() input only)
+        if self._node_features is None:
+            self._node_features = {
+                nid: (tag_features(n.get("tags", [])), project_features(n.get("projects", [])))
+                for nid, n in self._id2node.items()}
+        return self._node_features
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self._merged)
+
+    def _accept(self, s, t) -> bool:
+        self.stats["total_edges"] += 1
+        if not (is_uuid(s) and is_uuid(t)):
+            self.stats["removed_invalid_ids"] += 1
+            return False
+        if s not in self._index or t not in self._index:
+            self.stats["removed_invalid_ids"] += 1
+            return False
+        if s == t:
+            self.stats["removed_selfloops"] += 1
+            return False
+        return True
+
+    def add(self, e: dict) -> None:
+        """Merges a raw pipeline edge into its pair's entry."""
+        s = e.get("source"); t = e.get("target")
+        if not self._accept(s, t):
+            return
+        ev_set = edge_evidence(e)
+        reason = normalize_text(e.get("reason", "")).strip()
+        sim = e.get("similarity")
+        key = (s, t) if s <= t else (t, s)
+
+        entry = self._entries.get(key)
+        if entry is None:
+            (s_tags, s_projects), (t_tags, t_projects) = self._features[s], self._features[t]
+            self._entries[key] = {
+                "source": s, "target": t,
+                "evidence": ev_set,
+                "reasons": [reason] if reason else [],
+                "similarity": sim if isinstance(sim, (int, float)) else None,  # single displayable value
+                "score": e.get("score", None),
+                "tags_overlap": sorted(s_tags & t_tags),
+                "project_overlap": sorted(s_projects & t_projects),
+            }
+            return
+        self.stats["dedup_merged"] += 1
+        entry["evidence"].update(ev_set)
+        if reason:
+            entry["reasons"].append(reason)
+        # Max similarity / score
+        if isinstance(sim, (int, float)):
+            if entry["similarity"] is None or sim > entry["similarity"]:
+                entry["similarity"] = sim
+        if isinstance(e.get("score"), (int, float)):
+            if entry["score"] is None or e["score"] > entry["score"]:
+                entry["score"] = e["score"]
+
+    def extend(self, edges: Iterable[dict]) -> "EdgeStore":
+        for e in edges:
+            self.add(e)
+        return self
+
+    @staticmethod
+    def _shaped(e: dict, sim: int) -> dict:
+        # Normalitza camps mínims
+        ne = {**e, "similarity": sim, "dashes": bool(e.get("dashes", False))}
+        if isinstance(ne.get("evidence"), str):
+            ne["evidence"] = [ne["evidence"]]
+        return ne
+
+    def _keep_merged(self, s, t, ne: dict) -> None:
+        if not self.dedup:
+            self._merged[len(self._merged)] = ne
+            return
+        key = (s, t) if s < t else (t, s)
+        if key in self._merged:
+            self._merged[key] = merge_edge(self._merged[key], ne)
+            self.stats["dedup_merged"] += 1
+        else:
+            self._merged[key] = ne
+
+    def merge(self, e: dict) -> None:
+        """Adds an already consolidated edge (validate_graph input), merging duplicates with merge_edge."""
+        s = e.get("source"); t = e.get("target")
+        if not self._accept(s, t):
+            return
+        sim = display_similarity(e)
+        if sim < self.min_sim:
+            self._cut_on_input += 1
+            self.stats["removed_low_sim"] = self._cut_on_input
+            return
+        self._keep_merged(s, t, self._shaped(e, sim))
+
+    def _interned(self, ids: list) -> np.ndarray:
+        """Node index of every id (-1 if unknown or not hashable)."""
+        index = self._index
+        try:
+            return np.fromiter(map(index.get, ids, [-1] * len(ids)), dtype=np.int64, count=len(ids))
+        except TypeError:   # an unhashable id somewhere
+            def lookup(x):
+                try:
+                    return index.get(x, -1)
+                except TypeError:
+                    return -1
+            return np.fromiter(map(lookup, ids), dtype=np.int64, count=len(ids))
+
+    def merge_all(self, edges: Iterable[dict]) -> "EdgeStore":
+        """
+        merge() for a batch, same result and stats: ids are checked by membership
+        against the interned node ids, similarities coerced with NumPy and the
+        keep-mask built at once; only kept edges are copied and merged.
+        """
+        edges = list(edges)
+        sources = [e.get("source") for e in edges]
+        targets = [e.get("target") for e in edges]
+        src, dst = self._interned(sources), self._interned(targets)
+        known = (src >= 0) & (dst >= 0)
+        loops = known & (src == dst)
+        accepted = known & ~loops
+        sim = display_similarities(edges, where=accepted)
+        low = accepted & (sim < self.min_sim)
+        keep = accepted & ~low
+
+        self.stats["total_edges"] += len(edges)
+        self.stats["removed_invalid_ids"] += int((~known).sum())
+        self.stats["removed_selfloops"] += int(loops.sum())
+        self._cut_on_input += int(low.sum())
+        self.stats["removed_low_sim"] = self._cut_on_input
+        rows = np.flatnonzero(keep).tolist()
+        shaped = self._shaped
+        if not self.dedup:
+            merged = self._merged
+            for row, value in zip(rows, sim[rows].tolist()):
+                merged[len(merged)] = shaped(edges[row], value)
+            return self
+        # Pairs seen once (the usual case) skip the per-edge key lookup
+        lo, hi = np.minimum(src, dst)[rows], np.maximum(src, dst)[rows]
+        pair = lo * len(self._index) + hi
+        _, inverse, counts = np.unique(pair, return_inverse=True, return_counts=True)
+        single = (counts[inverse] == 1).tolist()
+        merged = self._merged
+        for row, value, alone in zip(rows, sim[rows].tolist(), single):
+            s, t = sources[row], targets[row]
+            key = (s, t) if s < t else (t, s)
+            if alone and key not in merged:
+                merged[key] = shaped(edges[row], value)
+            else:
+                self._keep_merged(s, t, shaped(edges[row], value))
+        return self
+
+    @staticmethod
+    def _finalized(m: dict) -> tuple[list[str], list[str], bool, str]:
+        directed, direction_info = _direction(m["evidence"], m["reasons"])
+        evidence = sorted(m["evidence"])
+        # Unique and clean reasons
+        reasons = [r for r in dict.fromkeys([normalize_text(r) for r in m["reasons"]]) if r]
+        if not reasons and "explicit" in evidence:
+            reasons = ["Explicit link between the two notes"]
+        return evidence, reasons, directed, direction_info
+
+    def _final(self, m: dict) -> dict:
+        evidence, reasons, directed, direction_info = self._finalized(m)
+        return {
+            **m,
+            "evidence": evidence,
+            "reasons": reasons,
+            "directed": directed,
+            "direction_info": direction_info,
+            "dashes": evidence == ["ai"],   # dashed only if EXCLUSIVELY AI
+            "arrow": "end" if directed else None,
+        }
+
+    def edges(self) -> list[dict]:
+        """Final edges: one per pair (raw input first), cut by min_sim."""
+        out = []
+        cut = 0
+        for m in self._entries.values():
+            e = self._final(m)
+            sim = display_similarity(e)
+            if sim < self.min_sim:
+                cut += 1
+                continue
+            e["similarity"] = sim
+            out.append(e)
+        out.extend(self._merged.values())
+        self.stats["removed_low_sim"] = self._cut_on_input + cut
+        self.stats["kept_edges"] = len(out)
+        return out
+
+    def core(self, topk: Optional[int] = None) -> GraphCore:
+        """
+        Like edges(), as a columnar GraphCore (raw add() input only). Pairs are
+        finalized one by one and streamed through a TopKPruner, so only the edges
+        that survive the cut (and top-K per node, if set) get columns; its kept /
+        dropped counts per evidence type end up in stats["pruning"].
+        """
+        if self._merged:
+            raise ValueError("EdgeStore.core() needs raw edges (add()), not merge() input")
+        pruner = TopKPruner(self.min_sim, topk)
+        for m in self._entries.values():
+            pruner.add({"source": m["source"], "target": m["target"], "evidence": sorted(m["evidence"]),
+                        "similarity": display_similarity(m), "entry": m})
+        kept = pruner.kept()
+        core = GraphCore(self.nodes)
+        for e in kept:   # reasons and direction only for the survivors
+            m = e["entry"]
+            evidence, reasons, _, direction_info = self._finalized(m)
+            core.append(e["source"], e["target"], evidence, reasons, e["similarity"], m["score"],
+                        m["tags_overlap"], m["project_overlap"], direction_info, evidence == ["ai"])
+        self.stats["removed_low_sim"] = pruner.dropped_min
+        self.stats["kept_edges"] = len(kept)
+        self.stats["pruning"] = pruner.stats(kept)
+        return core.freeze()
@@ -0,0 +1,190 @@
+# pipeline/brain/graph_core.py
+"""
+Columnar graph core: node ids interned to int32, edge attributes in NumPy columns.
+
+Consolidated edges (see edge_store.py) are held as
+  src, dst      int32 indices into `ids` (sorted, so index order == id order)
+  similarity    float64 + kind (None / int / float), score likewise
+  evidence      uint32 bitmask over `labels`
+  dashes, direction
+and side tables for reasons and tag/project overlaps (empty ones shared).
+EdgeStore.core() fills it with the edges that survive the similarity cut and
+top-K pruning (edge_pruner.py); list-of-dict edges are only materialized at
+the JSON boundary (edges() / to_graph()).
+"""
+from __future__ import annotations
+
+import sys
+from typing import Iterable, Optional
+
+import numpy as np
+
+KNOWN_EVIDENCE = ("ai", "explicit", "near_duplicate", "tag", "tags", "tags_inferred")
+DIRECTIONS = ("undirected", "source_to_target", "target_to_source")
+_DIRECTION_CODE = {d: i for i, d in enumerate(DIRECTIONS)}
+
+# kind codes of the similarity / score columns
+_NONE, _INT, _FLOAT, _OTHER = 0, 1, 2, 3
+_EMPTY: tuple = ()
+
+
+def _kind(x) -> int:
+    if x is None:
+        return _NONE
+    if isinstance(x, bool):
+        return _OTHER
+    if isinstance(x, int):
+        return _INT
+    if isinstance(x, float):
+        return _FLOAT
+    return _OTHER
+
+
+class GraphCore:
+    def __init__(self, nodes: Iterable[dict], extra_ids: Iterable[str] = ()):
+        self.nodes = list(nodes)
+        self.ids: list[str] = sorted({n["id"] for n in self.nodes} | set(extra_ids))
+        self.index = {nid: i for i, nid in enumerate(self.ids)}
+        self.labels: list[str] = list(KNOWN_EVIDENCE)
+        self._bit = {label: 1 << i for i, label in enumerate(self.labels)}
+        self._rows: Optional[dict[str, list]] = {k: [] for k in (
+            "src", "dst", "sim", "sim_kind", "score", "score_kind", "evidence", "dashes", "direction")}
+        self.reasons: list[tuple] = []
+        self.tags_overlap: list = []
+        self.project_overlap: list = []
+        self._objects: dict[tuple[str, int], object] = {}   # non-numeric similarity/score values
+
+    # ------------------------------------------------------------------ building
+
+    def _evidence_mask(self, evidence: Iterable[str]) -> int:
+        mask = 0
+        for label in evidence:
+            bit = self._bit.get(label)
+            if bit is None:
+                if len(self.labels) >= 32:
+                    raise ValueError("GraphCore supports at most 32 evidence labels")
+                bit = self._bit[label] = 1 << len(self.labels)
+                self.labels.append(label)
+            mask |= bit
+        return mask
+
+    def _number(self, column: str, value, row: int) -> tuple[float, int]:
+        # exact types first: the common case is a plain float/int
+        if type(value) is float:
+            return value, _FLOAT
+        if type(value) is int:
+            return float(value), _INT
+        kind = _kind(value)
+        if kind == _OTHER:
+            self._objects[(column, row)] = value
+            return np.nan, kind
+        return (np.nan if value is None else float(value)), kind
+
+    def append(self, source: str, target: str, evidence: Iterable[str], reasons: Iterable[str],
+               similarity, score, tags_overlap=_EMPTY, project_overlap=_EMPTY,
+               direction: str = "undirected", dashes: bool = False) -> None:
+        """Adds one consolidated edge (before freeze())."""
+        rows = self._rows
+        row = len(rows["src"])
+        rows["src"].append(self.index[source])
+        rows["dst"].append(self.index[target])
+        sim, sim_kind = self._number("similarity", similarity, row)
+        rows["sim"].append(sim)
+        rows["sim_kind"].append(sim_kind)
+        sc, sc_kind = self._number("score", score, row)
+        rows["score"].append(sc)
+        rows["score_kind"].append(sc_kind)
+        rows["evidence"].append(self._evidence_mask(evidence))
+        rows["dashes"].append(bool(dashes))
+        rows["direction"].append(_DIRECTION_CODE[direction])
+        self.reasons.append(tuple(reasons))
+        self.tags_overlap.append(tuple(tags_overlap) or _EMPTY)
+        self.project_overlap.append(tuple(project_overlap) or _EMPTY)
+
+    def freeze(self) -> "GraphCore":
+        """Turns the appended rows into NumPy columns."""
+        rows, self._rows = self._rows, None
+        self.src = np.array(rows["src"], dtype=np.int32)
+        self.dst = np.array(rows["dst"], dtype=np.int32)
+        self.similarity = np.array(rows["sim"], dtype=np.float64)
+        self.sim_kind = np.array(rows["sim_kind"], dtype=np.int8)
+        self.score = np.array(rows["score"], dtype=np.float64)
+        self.score_kind = np.array(rows["score_kind"], dtype=np.int8)
+        self.evidence = np.array(rows["evidence"], dtype=np.uint32)
+        self.dashes = np.array(rows["dashes"], dtype=bool)
+        self.direction = np.array(rows["direction"], dtype=np.int8)
+        return self
+
+    @classmethod
+    def from_edges(cls, nodes: Iterable[dict], edges: Iterable[dict]) -> "GraphCore":
+        """Core of consolidated dict edges (the format edge_store / suggestions.json use)."""
+        edges = list(edges)
+        core = cls(nodes, extra_ids=(x for e in edges for x in (e["source"], e["target"])))
+        for e in edges:
+            core.append(e["source"], e["target"], e.get("evidence") or [], e.get("reasons") or [],
+                        e.get("similarity"), e.get("score"), e.get("tags_overlap") or _EMPTY,
+                        e.get("project_overlap") or _EMPTY, e.get("direction_info", "undirected"),
+                        e.get("dashes", False))
+        return core.freeze()
+
+    def __len__(self) -> int:
+        return len(self.src) if self._rows is None else len(self._rows["src"])
+
+    # ------------------------------------------------------------------ JSON boundary
+
+    def _value(self, col: str, values: np.ndarray, kinds: np.ndarray, row: int):
+        kind = kinds[row]
+        if kind == _NONE:
+            return None
+        if kind == _INT:
+            return int(values[row])
+        if kind == _FLOAT:
+            return float(values[row])
+        return self._objects[(col, row)]
+
+    def _values(self, col: str, values: np.ndarray, kinds: np.ndarray) -> list:
+        """Python values of a numeric column (types restored)."""
+        out = values.tolist()
+        for row in np.flatnonzero(kinds != _FLOAT).tolist():
+            out[row] = self._value(col, values, kinds, row)
+        return out
+
+    def edges(self) -> list[dict]:
+        """Consolidated dict edges (edge_store key order)."""
+        ids, labels = self.ids, self.labels
+        evidence_of: dict[int, list[str]] = {}
+        for mask in np.unique(self.evidence).tolist():
+            evidence_of[mask] = sorted(l for i, l in enumerate(labels) if mask >> i & 1)
+        similarity = self._values("similarity", self.similarity, self.sim_kind)
+        score = self._values("score", self.score, self.score_kind)
+        return [{
+            "source": ids[s],
+            "target": ids[t],
+            "evidence": list(evidence_of[mask]),
+            "reasons": list(reasons),
+            "similarity": sim,
+            "score": sc,
+            "tags_overlap": list(tags),
+            "project_overlap": list(projects),
+            "directed": direction != 0,
+            "direction_info": DIRECTIONS[direction],
+            "dashes": dashes,
+            "arrow": "end" if direction != 0 else None,
+        } for s, t, mask, reasons, sim, sc, tags, projects, direction, dashes in zip(
+            self.src.tolist(), self.dst.tolist(), self.evidence.tolist(), self.reasons, similarity, score,
+            self.tags_overlap, self.project_overlap, self.direction.tolist(), self.dashes.tolist())]
+
+    def to_graph(self) -> dict:
+        return {"nodes": self.nodes, "edges": self.edges()}
+
+    # ------------------------------------------------------------------ sizes
+
+    def nbytes(self) -> int:
+        """Approximate memory of the edge representation (columns + side tables, strings shared)."""
+        cols = sum(getattr(self, c).nbytes for c in (
+            "src", "dst", "similarity", "sim_kind", "score", "score_kind", "evidence", "dashes", "direction"))
+        tables = sum(sys.getsizeof(t) for t in (self.reasons, self.tags_overlap, self.project_overlap))
+        tables += sum(sys.getsizeof(t) for t in self.reasons if t)
+        tables += sum(sys.getsizeof(t) for t in self.tags_overlap if t)
+        tables += sum(sys.getsizeof(t) for t in self.project_overlap if t)
+        return cols + tables + sys.getsizeof(self.index) + sys.getsizeof(self.ids)
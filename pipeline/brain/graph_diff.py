@@ -0,0 +1,197 @@
+# pipeline/brain/graph_diff.py
+"""
+Change set between the previous run's consolidated graph (suggestions.json)
+and the new one, so downstream consumers only touch what changed.
+
+  nodes  added (full node) / removed (id) / changed (id + {field: [old, new]})
+  edges  added (full edge) / removed ([source, target]) / changed, keyed by the
+         unordered pair as in edge_store; only EDGE_FIELDS count as a change
+         (AI reasons and raw scores vary between runs without meaning one)
+
+Consumers in the pipeline:
+  - Notion write-back: PreviousRun.unchanged_links() gives the "Links to"
+    relations a note had last run when it has not been edited since, so the
+    relation read and the mention write-back are skipped for those notes;
+  - the email digest lists only new and changed connections;
+  - changes.json keeps the last change set (none on a first run, where it
+    would just repeat the graph).
+
+graph_version.json (GraphVersions) is small enough to poll: the version of
+the last graph change and what graph_sigma.json was rendered from (graph
+version + settings/exporter fingerprint). The Sigma export is skipped while
+both still match, and the frontend reloads only when the Sigma version moves.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from config.logger_config import get_logger
+from pipeline.utils.graph_writer import read_json, write_graph
+
+log = get_logger(__name__)
+
+EDGE_FIELDS = ("evidence", "similarity", "directed", "direction_info", "dashes")
+
+
+def edge_key(e: dict) -> tuple:
+    """Unordered pair of an edge."""
+    return tuple(sorted((e.get("source"), e.get("target")), key=str))
+
+
+def new_version() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def run_minute() -> str:
+    """Current UTC minute, in Notion's last_edited_time format (prefix)."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M")
+
+
+def stable_edit_time(edited: Optional[str], fetched_minute: str) -> Optional[str]:
+    """
+    Notion's last_edited_time has minute resolution: an edit in the same minute
+    as the fetch would keep the same value. Such values are not recorded (None),
+    so the next run treats the note as changed.
+    """
+    if not isinstance(edited, str) or edited[:16] >= fetched_minute:
+        return None
+    return edited
+
+
+class PreviousRun:
+    def __init__(self, graph: Optional[dict]):
+        self.graph = graph
+        self.nodes = {n.get("id"): n for n in (graph or {}).get("nodes", []) if isinstance(n, dict)}
+
+    @classmethod
+    def load(cls, path) -> "PreviousRun":
+        path = Path(path)
+        if not path.exists():
+            log.info("🆕 No previous graph at %s: every node and edge counts as new", path)
+            return cls(None)
+        try:
+            return cls(read_json(path))
+        except Exception as e:
+            log.warning("⚠️ Previous graph unreadable (%s): every node and edge counts as new", e)
+            return cls(None)
+
+    def __bool__(self) -> bool:
+        return self.graph is not None
+
+    def unchanged_links(self, node_id: str, edited: Optional[str]) -> Optional[list[str]]:
+        """Last run's outgoing "Links to" ids if the note was not edited since; None = unknown."""
+        n = self.nodes.get(node_id)
+        if not n or not edited or n.get("edited") != edited:
+            return None
+        links = n.get("links")
+        return links if isinstance(links, list) else None
+
+
+def _changes(old: dict, new: dict, fields=None) -> dict:
+    keys = fields if fields is not None else list(dict.fromkeys([*old, *new]))
+    return {k: [old.get(k), new.get(k)] for k in keys if old.get(k) != new.get(k)}
+
+
+class ChangeSet:
+    def __init__(self, nodes: dict, edges: dict, previous: Optional[dict]):
+        self.nodes = nodes
+        self.edges = edges
+        self.previous = previous
+        self.version = new_version()
+
+    def __bool__(self) -> bool:
+        return any(self.nodes.values()) or any(self.edges.values())
+
+    def summary(self) -> dict:
+        return {f"{kind}_{op}": len(items)
+                for kind, part in (("nodes", self.nodes), ("edges", self.edges))
+                for op, items in part.items()}
+
+    def to_dict(self) -> dict:
+        return {"version": self.version, "previous": self.previous, "summary": self.summary(),
+                "nodes": self.nodes, "edges": self.edges}
+
+    def touched_nodes(self) -> set[str]:
+        """Ids of added/changed nodes and of the endpoints of any added, removed or changed edge."""
+        ids = {n["id"] for n in self.nodes["added"]} | {c["id"] for c in self.nodes["changed"]}
+        for e in self.edges["added"] + self.edges["changed"]:
+            ids.update((e["source"], e["target"]))
+        for s, t in self.edges["removed"]:
+            ids.update((s, t))
+        return ids
+
+
+def diff_graphs(old: Optional[dict], new: dict) -> ChangeSet:
+    """Change set from `old` (None: first run, all new) to `new`; both {"nodes", "edges"}."""
+    old = old or {}
+    old_nodes = {n["id"]: n for n in old.get("nodes", [])}
+    new_nodes = {n["id"]: n for n in new.get("nodes", [])}
+    nodes = {
+        "added": [n for nid, n in new_nodes.items() if nid not in old_nodes],
+        "removed": [nid for nid in old_nodes if nid not in new_nodes],
+        "changed": [],
+    }
+    for nid, n in new_nodes.items():
+        before = old_nodes.get(nid)
+        if before is not None and before != n:
+            nodes["changed"].append({"id": nid, "changes": _changes(before, n)})
+
+    old_edges = {edge_key(e): e for e in old.get("edges", [])}
+    new_edges = {edge_key(e): e for e in new.get("edges", [])}
+    edges = {
+        "added": [e for key, e in new_edges.items() if key not in old_edges],
+        "removed": [list(key) for key in old_edges if key not in new_edges],
+        "changed": [],
+    }
+    for key, e in new_edges.items():
+        before = old_edges.get(key)
+        if before is None:
+            continue
+        changes = _changes(before, e, EDGE_FIELDS)
+        if changes:
+            edges["changed"].append({"source": e["source"], "target": e["target"], "changes": changes})
+
+    previous = {"nodes": len(old_nodes), "edges": len(old_edges)} if old else None
+    return ChangeSet(nodes, edges, previous)
+
+
+def write_change_set(changes: ChangeSet, path) -> None:
+    write_graph(changes.to_dict(), path, compact=True)
+    log.info("🧾 Change set saved to %s (%s)", path, changes.summary())
+
+
+class GraphVersions:
+    """graph_version.json: {"graph": {version, summary}, "sigma": {version, graph_version, fingerprint}}."""
+
+    def __init__(self, data: Optional[dict] = None):
+        data = data if isinstance(data, dict) else {}
+        self.graph: dict = data.get("graph") or {}
+        self.sigma: dict = data.get("sigma") or {}
+
+    @classmethod
+    def load(cls, path) -> "GraphVersions":
+        try:
+            return cls(read_json(path)) if Path(path).exists() else cls()
+        except Exception as e:
+            log.warning("⚠️ %s unreadable (%s): graph versions start over", path, e)
+            return cls()
+
+    def graph_changed(self, changes: Optional[ChangeSet]) -> None:
+        """New graph version for a non-empty change set (or an unknown one: diff failed, no record yet)."""
+        if changes is None or changes or not self.graph:
+            self.graph = {"version": changes.version if changes else new_version(),
+                          "summary": changes.summary() if changes is not None else {}}
+
+    def sigma_is_current(self, fingerprint: str) -> bool:
+        """graph_sigma.json was rendered from this graph version with these settings and code."""
+        return (bool(self.sigma) and self.sigma.get("graph_version") == self.graph.get("version")
+                and self.sigma.get("fingerprint") == fingerprint)
+
+    def sigma_rendered(self, fingerprint: str) -> None:
+        self.sigma = {"version": new_version(), "graph_version": self.graph.get("version"),
+                      "fingerprint": fingerprint}
+
+    def save(self, path) -> None:
+        write_graph({"graph": self.graph, "sigma": self.sigma}, path, compact=True)
@@ -6,7 +6,7 @@ import json
 import math
 import networkx as nx
 from config.app_config import load_params 
-from pipeline.utils.json_sanitizer import sanitize_json_graph
+from pipeline.utils.json_sanitizer import write_sanitized_graph
 from pipeline.filter_graph import filter_graph, normalize_notion_tags
 import sys
 from pipeline.utils.graph_styles import (
@@ -16,6 +16,7 @@ from pipeline.utils.graph_styles import (
     SIM_BUCKETS,
     EXPLICIT_EDGE_COLOR,
     DIRECT_CONNECTION,
+    NEAR_DUPLICATE_EDGE_COLOR,
     notion_color_to_hex
 )
 import hashlib
@@ -27,6 +28,7 @@ log = get_logger(__name__)
 
 OUT_JSON = cfg.paths["OUT_JSON"]
 OUT_GRAPH = cfg.paths["OUT_GRAPH"]
+GRAPH_COMPACT = bool(cfg.output.get("compact_graph", True))
 
 def clean_label(s: str) -> str:
     return str(s).replace("tag::", "").strip("📍 ").strip()
@@ -47,11 +49,29 @@ def convert_for_sigma(
         include_tags=True,
         filters: Optional[dict] = None,
         layout: str = "reuse",
+        graph: Optional[dict] = None,
+        writer=None,
+        tags_normalized: bool = False,
 ):
+    """
+    graph:  validated graph handed over in memory by process(); `sugg_path` is
+            read only without it. Nodes are copied (tags/cluster are rewritten
+            here), edges are shared read-only.
+    writer: AsyncWriter that writes `out_path` off the critical path.
+    tags_normalized: node tags are already normalize_notion_tags() output (as
+            process() builds them), so only the cluster is set from them.
+    """
     filters = filters or {}
-    data = json.loads(Path(sugg_path).read_text(encoding="utf-8"))
+    if graph is not None:
+        data = {"nodes": [dict(n) for n in graph.get("nodes", [])], "edges": graph.get("edges", [])}
+    else:
+        data = json.loads(Path(sugg_path).read_text(encoding="utf-8"))
 
     for node in data.get("nodes", []):
+        if tags_normalized:
+            tags = node.get("tags")
+            node["cluster"] = tags[0]["name"] if tags else "Altres"
+            continue
         raw_tags = normalize_notion_tags(node.get("tags"))
 
         fixed_tags = []
@@ -104,6 +124,8 @@ def convert_for_sigma(
         
         if "explicit" in ev:
             weight = 3.0 # Strong pull for explicit links
+        elif "near_duplicate" in ev:
+            weight = 2.0 # Near-duplicates sit next to each other
         elif "ai" in ev:
             # AI links: weight based on similarity
             sim = float(e.get("similarity", 0) or 0)
@@ -221,6 +243,12 @@ def convert_for_sigma(
                 color = DIRECT_CONNECTION  # blue "Directed Connection"
             
             edge_type = "arrow" if directed else "line"
+        elif "near_duplicate" in ev:
+            stl = edge_style_by_evidence_and_similarity(ev, sim)
+            color = stl["color"]
+            kind = "near_duplicate"
+            dashed = False
+            edge_type = "line"
         elif is_tag_edge:
             # Non-explicit tag edges use tag styling
             stl = edge_style_by_evidence_and_similarity(["tags"])
@@ -325,6 +353,13 @@ def convert_for_sigma(
                 "kind": "similarity",
                 "evidence": ">60"
             },
+            {
+                "label": "Near-duplicate",
+                "color": NEAR_DUPLICATE_EDGE_COLOR,
+                "type": "near_duplicate",
+                "kind": "near_duplicate",
+                "evidence": "near_duplicate"
+            },
         ],
 
         "kinds": kinds_for_legend,
@@ -332,8 +367,11 @@ def convert_for_sigma(
     }
 
     out = {"nodes": sigma_nodes, "edges": sigma_edges, "legend": legend_data}
-    clean_str = sanitize_json_graph(out)
-    Path(out_path).write_text(clean_str, encoding="utf-8")
+    # Sanitized while streamed to disk (no full JSON string in memory)
+    if writer is not None:
+        writer.submit("graph_sigma", write_sanitized_graph, out, out_path, compact=GRAPH_COMPACT)
+    else:
+        write_sanitized_graph(out, out_path, compact=GRAPH_COMPACT)
 
     print(f"✅ Sigma graph generated with {len(sigma_nodes)} nodes and {len(sigma_edges)} edges.")
     # ... (rest of the script to inject and copy files)
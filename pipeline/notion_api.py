@@ -390,6 +390,7 @@ def get_notes_by_type(
             "contenido": content,
             "mentions": mentions, # New field
             "url": notion_url(page["id"]),
+            "edited": page.get("last_edited_time"),
         })
 
     return notes
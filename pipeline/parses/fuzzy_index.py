@@ -0,0 +1,99 @@
+# pipeline/parses/fuzzy_index.py
+"""
+Character-trigram inverted index for near-miss title lookup.
+
+Texts are folded by a normalize function (ResolverIndex uses to_slug: lowercase,
+no accents or punctuation) and split into padded trigrams. A lookup gathers
+candidates from the postings of the query's rarest trigrams (prefix filtering
+on the threshold) or takes a small allow-list, ranks them by Dice similarity
+and only answers above a confidence threshold with a unique winner.
+"""
+from __future__ import annotations
+
+import math
+import re
+from typing import Callable, Iterable, Optional
+
+_SPLIT_RE = re.compile(r"[\W_]+")
+
+
+def trigrams(text: str) -> frozenset[str]:
+    """Padded character trigrams of `text` (already folded), words joined by single spaces."""
+    words = _SPLIT_RE.sub(" ", text or "").split()
+    if not words:
+        return frozenset()
+    s = " " + " ".join(words) + " "
+    return frozenset(s[i:i + 3] for i in range(len(s) - 2))
+
+
+class TrigramIndex:
+    def __init__(self, items: Iterable[tuple[str, str]] = (), normalize: Callable[[str], str] = str.lower):
+        self.normalize = normalize
+        self._grams: dict[str, frozenset[str]] = {}     # key -> trigrams
+        self._postings: dict[str, set[str]] = {}        # trigram -> keys
+        for key, text in items:
+            self.add(key, text)
+
+    def __len__(self) -> int:
+        return len(self._grams)
+
+    def add(self, key: str, text: str) -> None:
+        grams = trigrams(self.normalize(text or ""))
+        self.remove(key)
+        if not grams:
+            return
+        self._grams[key] = grams
+        for g in grams:
+            self._postings.setdefault(g, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        grams = self._grams.pop(key, None)
+        for g in grams or ():
+            keys = self._postings.get(g)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[g]
+
+    def search(self, query: str, allowed: Optional[Iterable[str]] = None, limit: int = 5,
+               min_score: float = 0.0) -> list[tuple[str, float]]:
+        """
+        Top `limit` (key, dice) pairs for `query` with dice >= min_score, best first.
+        With `allowed`, only those keys are scored (directly, no postings walk).
+        """
+        q = trigrams(self.normalize(query or ""))
+        if not q:
+            return []
+        if allowed is not None:
+            keys = allowed
+        else:
+            # Prefix filter: dice >= t needs at least t|q|/(2-t) shared trigrams, so any match
+            # shares one of the |q| - that + 1 rarest query trigrams; only those postings are walked
+            need = math.ceil(min_score * len(q) / (2.0 - min_score)) if min_score > 0 else 1
+            rare = sorted(q, key=lambda g: len(self._postings.get(g, ())))[: max(1, len(q) - need + 1)]
+            keys = set()
+            for g in rare:
+                keys.update(self._postings.get(g, ()))
+
+        scored = []
+        for key in keys:
+            grams = self._grams.get(key)
+            if not grams:
+                continue
+            n = len(q & grams)
+            if n:
+                score = 2.0 * n / (len(q) + len(grams))
+                if score >= min_score:
+                    scored.append((key, score))
+        scored.sort(key=lambda kv: kv[1], reverse=True)
+        return scored[:limit]
+
+    def best(self, query: str, allowed: Optional[Iterable[str]] = None,
+             threshold: float = 0.6) -> Optional[tuple[str, float]]:
+        """Best match if its similarity >= threshold and it is not tied with another key."""
+        top = self.search(query, allowed, limit=2, min_score=threshold)
+        if not top:
+            return None
+        if len(top) > 1 and top[1][1] == top[0][1]:
+            return None
+        return top[0]
@@ -0,0 +1,179 @@
+# pipeline/parses/json_scanner.py
+"""
+Single-pass extraction of JSON values embedded in free text (AI responses).
+
+One linear scan tracks bracket depth, string state and escapes (jumping
+between structural characters with a single compiled regex), and yields
+the top-level {...} / [...] spans. Fences, prose, and brackets inside strings
+need no regex passes. A top-level array that never closes (a truncated
+answer) yields its complete elements instead, so the connections written
+before the cut are not lost.
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Iterator, Optional
+
+_OPEN = {"{": "}", "[": "]"}
+_CLOSE = {"}", "]"}
+# What may follow an opening bracket in JSON (after whitespace)
+_VALUE_START = set('{["-0123456789tfn]')
+_KEY_START = set('"}')
+_WS = " \t\r\n"
+# Only brackets, quotes and escape pairs matter; prose between them is skipped in C
+_TOKEN_RE = re.compile(r'\\.|[\[\]{}"]', re.DOTALL)
+
+
+def _plausible_open(text: str, i: int) -> bool:
+    """Cheap check that text[i] opens JSON and not prose like '[1] see' or '{name}'."""
+    j = i + 1
+    n = len(text)
+    while j < n and text[j] in _WS:
+        j += 1
+    if j >= n:
+        return True  # truncated right after the bracket
+    return text[j] in (_KEY_START if text[i] == "{" else _VALUE_START)
+
+
+def _remember(text: str, start: int, stop: int, at_end: bool, known: dict) -> None:
+    """
+    Records, for every bracket opened outside a string in the failed value
+    text[start:stop], how a scan starting at it ends: it would see the same
+    tokens, so it closes where it closed here ((end, children)) or fails the
+    same way ((None, children) for an array left open at the end, else None).
+    """
+    stack: list[list] = []   # [closer, start, direct children spans]
+    in_str = False
+    for m in _TOKEN_RE.finditer(text, start, stop):
+        ch = m.group()
+        if in_str:
+            if ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in _OPEN:
+            stack.append([_OPEN[ch], m.start(), []])
+        elif ch in _CLOSE:
+            closer, s, children = stack.pop()
+            known[s] = (m.end(), children if closer == "]" else [])
+            if stack:
+                stack[-1][2].append((s, m.end()))
+    for closer, s, children in stack:
+        known[s] = (None, children) if at_end and closer == "]" and children else None
+
+
+def iter_json_spans(text: str) -> Iterator[tuple[int, int, list[tuple[int, int]], bool]]:
+    """
+    Yields (start, end, children, complete) for top-level JSON-looking spans of `text`.
+
+    `children` are the (start, end) spans of the direct elements of a top-level array,
+    used to recover from an invalid array (trailing comma, one broken element).
+    complete=False marks a top-level array left open at the end of the text
+    (truncated output); `end` is then len(text).
+
+    After an unclosed or broken value the scan resumes just after its opening
+    bracket; the outcome of each bracket inside the failed value is remembered,
+    so the brackets it went through are not rescanned (linear time even on long
+    malformed answers).
+    """
+    if not text:
+        return
+    n = len(text)
+    known: dict[int, Optional[tuple]] = {}   # opener position -> outcome of a scan starting there
+    pos = 0
+    while pos < n:
+        stack: list[str] = []                  # expected closers
+        start = -1
+        children: list[tuple[int, int]] = []   # closed direct children of the open top-level array
+        child_start = -1
+        in_str = False
+        resume = -1
+
+        for m in _TOKEN_RE.finditer(text, pos):
+            ch = m.group()
+            i = m.start()
+            if in_str:
+                # escape pairs ("\\x") are single tokens, so only a bare quote ends the string
+                if ch == '"':
+                    in_str = False
+            elif ch == '"':
+                # quotes only matter inside a value; quotes in prose are ignored
+                in_str = bool(stack)
+            elif ch in _OPEN:
+                if not stack:
+                    if _plausible_open(text, i):
+                        if i in known:
+                            outcome = known[i]
+                            if outcome is None:
+                                resume = i + 1          # fails again
+                            elif outcome[0] is None:
+                                yield i, n, outcome[1], False
+                                return
+                            else:
+                                yield i, outcome[0], outcome[1], True
+                                resume = outcome[0]
+                            break
+                        start = i
+                        children = []
+                        stack.append(_OPEN[ch])
+                else:
+                    if len(stack) == 1 and stack[0] == "]":
+                        child_start = i
+                    stack.append(_OPEN[ch])
+            elif ch in _CLOSE and stack:
+                if ch != stack[-1]:
+                    # mismatched closer: not JSON, rescan right after the opener
+                    _remember(text, start, i, False, known)
+                    resume = start + 1
+                    break
+                stack.pop()
+                if not stack:
+                    yield start, i + 1, children, True
+                elif len(stack) == 1 and stack[0] == "]" and child_start >= 0:
+                    children.append((child_start, i + 1))
+                    child_start = -1
+
+        if resume >= 0:
+            pos = resume
+            continue
+        if not stack:
+            return
+        if stack[0] == "]" and children:
+            # truncated top-level array: keep its complete elements
+            yield start, n, children, False
+            return
+        # unclosed value: resume the scan just after its opening bracket
+        _remember(text, start, n, True, known)
+        pos = start + 1
+
+
+def iter_json_values(text: str) -> Iterator[Any]:
+    """
+    Yields the parsed top-level JSON values found in `text`, in order.
+
+    An array that is truncated or fails to parse is yielded as the list of its
+    parseable elements (if any); other invalid spans are skipped.
+    """
+    seen: set[str] = set()
+    for s, e, children, complete in iter_json_spans(text):
+        chunk = text[s:e]
+        if chunk in seen:
+            continue
+        seen.add(chunk)
+        if complete:
+            try:
+                value = json.loads(chunk)
+            except ValueError:
+                pass
+            else:
+                yield value
+                continue
+        salvaged = []
+        for cs, ce in children:
+            try:
+                salvaged.append(json.loads(text[cs:ce]))
+            except ValueError:
+                continue
+        if salvaged:
+            yield salvaged
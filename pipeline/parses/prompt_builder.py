@@ -0,0 +1,215 @@
+# pipeline/parses/prompt_builder.py
+"""
+Token-budgeted prompt construction for analyze_ai.
+
+- Token counts are estimated locally (optional tiktoken encoder, else a chars/token heuristic).
+- Candidates and content previews are packed until the configured budget is used.
+- Field order is fixed (instructions → source note → candidates) so the prompt prefix
+  stays byte-identical between calls and the server can reuse its prompt cache.
+"""
+from __future__ import annotations
+
+import math
+import textwrap
+from config.app_config import load_params
+from config.logger_config import get_logger
+
+cfg = load_params()
+log = get_logger(__name__)
+
+PROMPT_TOKEN_BUDGET   = int(cfg.ai.get("prompt_token_budget", 3000))
+PROMPT_MAX_CANDIDATES = int(cfg.ai.get("prompt_max_candidates", 30))
+PROMPT_SOURCE_SHARE   = float(cfg.ai.get("prompt_source_share", 0.3))
+PROMPT_TOKENIZER      = cfg.ai.get("tokenizer")  # e.g. "cl100k_base" (needs tiktoken)
+
+# Average characters per token for Catalan/Spanish prose on llama/qwen tokenizers
+CHARS_PER_TOKEN = 3.5
+
+# Upper bound of preview tokens per candidate, so a few long notes cannot starve the rest
+MAX_PREVIEW_TOKENS = 160
+MIN_PREVIEW_TOKENS = 12
+
+_encoder = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    """Returns a tiktoken encoder if configured and installed, else None (heuristic mode)."""
+    global _encoder, _encoder_loaded
+    if _encoder_loaded:
+        return _encoder
+    _encoder_loaded = True
+    if not PROMPT_TOKENIZER:
+        return None
+    try:
+        import tiktoken
+        _encoder = tiktoken.get_encoding(str(PROMPT_TOKENIZER))
+        log.info("Prompt builder: using tokenizer %s", PROMPT_TOKENIZER)
+    except Exception as e:
+        log.warning("Prompt builder: tokenizer %s unavailable (%s); using heuristic", PROMPT_TOKENIZER, e)
+        _encoder = None
+    return _encoder
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of tokens of `text`."""
+    if not text:
+        return 0
+    enc = _get_encoder()
+    if enc is not None:
+        return len(enc.encode(text))
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts `text` to about `max_tokens` tokens on a word boundary ('…' appended if cut)."""
+    text = " ".join((text or "").split())
+    if max_tokens <= 0 or not text:
+        return ""
+    enc = _get_encoder()
+    if enc is not None:
+        toks = enc.encode(text)
+        if len(toks) <= max_tokens:
+            return text
+        cut = enc.decode(toks[:max_tokens])
+    else:
+        max_chars = int(max_tokens * CHARS_PER_TOKEN)
+        if len(text) <= max_chars:
+            return text
+        cut = text[:max_chars]
+    space = cut.rfind(" ")
+    if space > len(cut) // 2:
+        cut = cut[:space]
+    return cut.rstrip(" ,;:.") + "…"
+
+
+def _tag_names(raw_tags, limit: int) -> str:
+    if not isinstance(raw_tags, list):
+        return "none"
+    names = []
+    for t in raw_tags[:limit]:
+        if isinstance(t, dict):
+            names.append(t.get("name", ""))
+        elif isinstance(t, str):
+            names.append(t)
+    return ", ".join(filter(None, names)) or "none"
+
+
+_FORMAT_ARRAY = """\
+OUTPUT FORMAT (array only):
+[
+  { "id": "<UUID exactly as shown in brackets>", "similarity": 0-100, "reason": "<brief explanation>" }
+]"""
+
+_FORMAT_OBJECT = """\
+OUTPUT FORMAT (object with a "connections" array):
+{ "connections": [
+  { "id": "<UUID exactly as shown in brackets>", "similarity": 0-100, "reason": "<brief explanation>" }
+] }"""
+
+
+def _instructions(min_sim: int, structured: bool = False) -> str:
+    # Constant for a given MIN_SIM and mode: keep it first so every call shares the same prefix.
+    output_format = _FORMAT_OBJECT if structured else _FORMAT_ARRAY
+    empty = '{"connections": []}' if structured else "[]"
+    return textwrap.dedent("""\
+        You are a JSON-only responder.
+
+        Return raw JSON ONLY. Do NOT include code fences, backticks, or any text before/after.
+
+        TASK:
+        Given a SOURCE NOTE and several CANDIDATE NOTES (each candidate shows its title and [UUID] in brackets),
+        return conceptual connections from the source note to candidates.
+
+        """) + output_format + textwrap.dedent(f"""
+
+        CONSTRAINTS:
+        - Use ONLY UUIDs appearing in the CANDIDATE NOTES headers (the text between [ and ]).
+        - similarity MUST be an integer 0-100 (no percentages, no floats).
+        - Include ONLY entries with similarity >= {min_sim}.
+        - If there are NO connections >= {min_sim}, return exactly: {empty}
+        - Reason MUST be 5–25 words, concrete and human-readable. Avoid single-word labels like "Ètica".
+        - Write reasons in Catalan or Spanish and mention 1–2 specific overlapping concepts/tags.
+        - If any reason would be shorter than 5 words, DO NOT include that entry.
+        """)
+
+
+def connections_schema(ids: list[str], min_sim: int) -> dict:
+    """
+    JSON schema of a structured answer: {"connections": [{id, similarity, reason}]},
+    with ids restricted to the candidate UUIDs shown in the prompt.
+    """
+    return {
+        "type": "object",
+        "properties": {
+            "connections": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "string", "enum": list(ids)},
+                        "similarity": {"type": "integer", "minimum": int(min_sim), "maximum": 100},
+                        "reason": {"type": "string"},
+                    },
+                    "required": ["id", "similarity", "reason"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["connections"],
+        "additionalProperties": False,
+    }
+
+
+def build_prompt(nota: dict, candidates: list[dict], min_sim: int,
+                 budget: int | None = None, max_candidates: int | None = None,
+                 structured: bool = False) -> tuple[str, list[dict], int]:
+    """
+    Packs the source note and as many candidates as fit into `budget` tokens.
+    `structured` asks for the {"connections": [...]} object of connections_schema().
+
+    Candidates are taken in the given order (best first). Headers (UUID, title, tags) are
+    packed first; the remaining budget is then shared evenly as content previews.
+
+    Returns: (prompt, included_candidates, estimated_tokens)
+    """
+    budget = int(budget or PROMPT_TOKEN_BUDGET)
+    max_candidates = int(max_candidates or PROMPT_MAX_CANDIDATES)
+
+    head = _instructions(min_sim, structured)
+    used = estimate_tokens(head)
+
+    # 1. Source note: title and tags always, content up to its share of the budget
+    source_head = (
+        "\nSOURCE NOTE:\n"
+        f"Title: {nota.get('titulo', '')}\n"
+        f"Tags: {_tag_names(nota.get('tags', []), 10)}\n"
+        "Content preview: "
+    )
+    source_tokens = max(0, int((budget - used - estimate_tokens(source_head)) * PROMPT_SOURCE_SHARE))
+    source_preview = truncate_to_tokens(nota.get("contenido") or "", source_tokens)
+    source = source_head + source_preview + "\n\nCANDIDATE NOTES (use the ID in brackets):\n"
+    used += estimate_tokens(source)
+
+    # 2. Candidate headers: as many as fit, keeping room for a minimal preview each
+    headers: list[str] = []
+    included: list[dict] = []
+    for c in candidates[:max_candidates]:
+        h = f"{len(headers) + 1}. [{c['id']}] {c.get('titulo', '')}\n   Tags: {_tag_names(c.get('tags', []), 3)}\n   Preview: "
+        cost = estimate_tokens(h) + MIN_PREVIEW_TOKENS
+        if used + cost > budget:
+            break
+        headers.append(h)
+        included.append(c)
+        used += cost
+
+    # 3. Previews: spread what is left evenly across the included candidates
+    lines = []
+    if included:
+        spare = max(0, budget - used)
+        per_cand = min(MAX_PREVIEW_TOKENS, MIN_PREVIEW_TOKENS + spare // len(included))
+        for h, c in zip(headers, included):
+            lines.append(h + truncate_to_tokens(c.get("contenido") or "", per_cand))
+
+    prompt = head + source + "\n".join(lines)
+    return prompt, included, estimate_tokens(prompt)
@@ -0,0 +1,196 @@
+# pipeline/parses/resolver_index.py
+"""
+Run-scoped index for resolving the ids the AI returns (UUIDs, titles, slugs, first words).
+
+Built once per run over all notes, then queried per AI call with an allow-list
+of the candidate ids the model actually saw. Titles, slugs and partial keys are
+computed once per note instead of once per note and call, and title occurrences
+in a response are found with one Aho–Corasick pass (title_matcher). Titles the
+model mangled (typos, cut-offs) are resolved last through a trigram index
+(fuzzy_index).
+
+With duplicate keys the last allowed note wins, as with the per-call dicts it replaces.
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Iterable, Optional
+
+from config.app_config import load_params
+from pipeline.parses.fuzzy_index import TrigramIndex
+from pipeline.parses.title_matcher import TitleMatcher
+
+cfg = load_params()
+
+# Minimum Dice similarity of title trigrams for a near-miss title to resolve
+FUZZY_TITLE_THRESHOLD = float(cfg.ai.get("fuzzy_title_threshold", 0.6))
+
+_UUID_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.I)
+
+_ACCENTS = str.maketrans({
+    **dict.fromkeys("àáäâ", "a"),
+    **dict.fromkeys("èéëê", "e"),
+    **dict.fromkeys("ìíïî", "i"),
+    **dict.fromkeys("òóöô", "o"),
+    **dict.fromkeys("ùúüû", "u"),
+    "ñ": "n",
+    "ç": "c",
+})
+_NON_SLUG_RE = re.compile(r'[^\w\s-]')
+_SEP_RE = re.compile(r'[-\s]+')
+
+
+def to_slug(text: str) -> str:
+    """Converts text to slug"""
+    text = text.lower().translate(_ACCENTS)
+    text = _NON_SLUG_RE.sub('', text)
+    text = _SEP_RE.sub('-', text)
+    return text.strip('-')
+
+
+def clean_id_value(value: str) -> str:
+    """Normalizes an id string for matching: removes containers and invisibles."""
+    v = unicodedata.normalize("NFKC", value)
+    v = v.strip().strip("[](){}<>")
+    v = v.replace("–", "-").replace("—", "-").replace("−", "-")
+    v = v.replace("\u200b", "").replace("\ufeff", "").replace("\u00a0", " ")
+    return v.strip()
+
+
+class ResolverIndex:
+    def __init__(self, nodes: Iterable[dict] = (), fuzzy_threshold: float = FUZZY_TITLE_THRESHOLD):
+        self.fuzzy_threshold = float(fuzzy_threshold)
+        self.id_to_node: dict[str, dict] = {}
+        self._title_of: dict[str, str] = {}          # id -> lower title
+        self._by_title: dict[str, list[str]] = {}
+        self._by_slug: dict[str, list[str]] = {}
+        self._by_partial: dict[str, list[str]] = {}
+        self._matcher: TitleMatcher | None = None   # Aho–Corasick over all titles, built on first use
+        self._fuzzy = TrigramIndex(normalize=to_slug)  # keyed by lowercased title
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self) -> int:
+        return len(self.id_to_node)
+
+    def add(self, node: dict) -> None:
+        nid = node["id"]
+        self.id_to_node[nid] = node
+        self._matcher = None
+        title = (node.get("titulo") or "").strip()
+        if not title:
+            return
+        low = title.lower()
+        self._title_of[nid] = low
+        if low not in self._by_title:
+            self._fuzzy.add(low, title)
+        self._by_title.setdefault(low, []).append(nid)
+        self._by_slug.setdefault(to_slug(title), []).append(nid)
+        words = low.split()[:3]
+        if words:
+            self._by_partial.setdefault(" ".join(words), []).append(nid)
+
+    @property
+    def matcher(self) -> TitleMatcher:
+        if self._matcher is None:
+            self._matcher = TitleMatcher(self._by_title)
+        return self._matcher
+
+    @staticmethod
+    def allow(ids: Iterable[str]) -> dict[str, int]:
+        """Allow-list for resolve()/titles_in(): id -> position in candidate order."""
+        return {nid: i for i, nid in enumerate(ids)}
+
+    @staticmethod
+    def _pick(ids: list[str] | None, allowed: dict[str, int] | None) -> Optional[str]:
+        # Last candidate wins, like assigning into a per-call dict in candidate order
+        if not ids:
+            return None
+        if allowed is None:
+            return ids[-1]
+        best, best_pos = None, -1
+        for nid in ids:
+            pos = allowed.get(nid, -1)
+            if pos > best_pos:
+                best, best_pos = nid, pos
+        return best
+
+    def _ordered(self, allowed: dict[str, int] | None) -> Iterable[str]:
+        return self._title_of.keys() if allowed is None else allowed.keys()
+
+    def resolve(self, value: str, allowed: dict[str, int] | None = None) -> Optional[str]:
+        """Resolves `value` to a note id among `allowed` (see allow(); all notes if None)."""
+        return self.resolve_with_method(value, allowed)[0]
+
+    def resolve_with_method(self, value: str,
+                            allowed: dict[str, int] | None = None) -> tuple[Optional[str], Optional[str]]:
+        """
+        Like resolve(), also returning how the id was found:
+        "uuid", "title", "slug", "partial", "substring" or "fuzzy" (None if unresolved).
+        """
+        if not value or not isinstance(value, str):
+            return None, None
+
+        v_stripped = clean_id_value(value)
+
+        # 1. UUID present in text?
+        m = _UUID_RE.search(v_stripped)
+        if m:
+            uid = m.group(0).lower()
+            ok = uid in self.id_to_node and (allowed is None or uid in allowed)
+            return (uid, "uuid") if ok else (None, None)
+
+        # 2. Mapping by title/slug/partials (do not pass to [0-9a-f-]!)
+        v_lower = v_stripped.lower()
+
+        hit = self._pick(self._by_title.get(v_lower), allowed)
+        if hit:
+            return hit, "title"
+
+        hit = self._pick(self._by_slug.get(to_slug(v_lower)), allowed)
+        if hit:
+            return hit, "slug"
+
+        words = v_lower.split()[:3]
+        if words:
+            hit = self._pick(self._by_partial.get(" ".join(words)), allowed)
+            if hit:
+                return hit, "partial"
+
+        # Titles contained in the value: one automaton pass; the value inside a title
+        # is only tested against the allowed titles
+        contained = self.matcher.find_all(v_lower)
+        seen: set[str] = set()
+        for nid in self._ordered(allowed):
+            title = self._title_of.get(nid)
+            if not title or title in seen:
+                continue
+            seen.add(title)
+            if title in contained or v_lower in title:
+                return self._pick(self._by_title[title], allowed), "substring"
+
+        # Near-miss title (typos, cut-offs): trigram similarity over the allowed titles
+        titles = None if allowed is None else list(dict.fromkeys(
+            self._title_of[nid] for nid in allowed if nid in self._title_of))
+        best = self._fuzzy.best(v_lower, titles, threshold=self.fuzzy_threshold)
+        if best:
+            return self._pick(self._by_title[best[0]], allowed), "fuzzy"
+
+        return None, None
+
+    def titles_in(self, text: str, allowed: dict[str, int] | None = None) -> list[str]:
+        """Ids of the (allowed) notes whose exact title appears in `text` (case-insensitive)."""
+        found = self.matcher.find_all((text or "").lower())
+        if not found:
+            return []
+        out: list[str] = []
+        seen: set[str] = set()
+        for nid in self._ordered(allowed):
+            title = self._title_of.get(nid)
+            if not title or title in seen:
+                continue
+            seen.add(title)
+            if title in found:
+                out.append(self._pick(self._by_title[title], allowed))
+        return out
@@ -3,19 +3,21 @@
 from typing import Dict, List, Any, Optional
 import time
 import requests, re
-import unicodedata
 import logging
 from pathlib import Path
 from config.logger_config import get_logger
 from config.app_config import load_params
-from pipeline.ai_client import call_ai_client
+from pipeline.ai_client import AI_STRUCTURED_OUTPUT, call_ai_client, ai_available
+from pipeline.ai_health import CircuitOpenError
+from pipeline.parses.json_scanner import iter_json_values
+from pipeline.parses.prompt_builder import build_prompt, connections_schema
+from pipeline.parses.resolver_index import ResolverIndex, to_slug
 import json
 
 cfg = load_params()
 log = get_logger(__name__)
 
-# Configuration for AI Model timeouts and retries
-AI_MODEL_TIMEOUT = int(cfg.ai.get("timeout", 180))
+# Configuration for AI Model retries (timeouts are adaptive, see pipeline/ai_latency.py)
 AI_MODEL_RETRIES = int(cfg.ai.get("retries", 2))
 AI_MODEL_BACKOFF = float(cfg.ai.get("backoff", 1.5))
 
@@ -259,7 +261,8 @@ def _parse_ai_json_robust(raw: str) -> list[dict]:
     """
     Attempt to parse JSON using multiple strategies:
       1. json.loads directly
-      2. Extract first reasonable JSON block (object or array) from text
+      2. JSON values embedded in the text (fences, prose, truncation), found in a single
+         scan by json_scanner; arrays are preferred over objects
       3. Return a normalized list of connections [{id, similarity, reason}, ...]
     """
     if not raw:
@@ -267,54 +270,23 @@ def _parse_ai_json_robust(raw: str) -> list[dict]:
 
     # 1. Direct attempt
     try:
-        data = json.loads(raw)
-        items = _extract_connections(data)
+        items = _extract_connections(json.loads(raw))
         if items:
             return items
-    except Exception:
+    except ValueError:
         pass
 
-    # 2. Remove fences/backticks and take the first big JSON array/object
-    txt = raw.strip()
-    txt = re.sub(r"^```(?:json)?|```$", "", txt.strip(), flags=re.IGNORECASE|re.MULTILINE).strip()
-
-    # try array [...] first
-    m = re.search(r"\[\s*\{[\s\S]*?\}\s*\]", txt)
-    if m:
-        try:
-            data = json.loads(m.group(0))
-            items = _extract_connections(data)
-            if items:
-                return items if isinstance(items, list) else data
-        except Exception:
-            pass
-
-    # then an object { ... } (may contain the envelope)
-    m = re.search(r"\{\s*\"[^\"]+\"\s*:\s*[\[\{][\s\S]*", txt)
-    # try also the longest object (until the last } )
-    if not m:
-        first = txt.find("{")
-        last  = txt.rfind("}")
-        if first != -1 and last != -1 and last > first:
-            candidate = txt[first:last+1]
-            try:
-                data = json.loads(candidate)
-                items = _extract_connections(data)
-                if items:
-                    return items
-            except Exception:
-                pass
-    else:
-        candidate = txt[m.start(): txt.rfind("}")+1]
-        try:
-            data = json.loads(candidate)
-            items = _extract_connections(data)
-            if items:
-                return items
-        except Exception:
-            pass
-
-    return []
+    # 2. Embedded values, first array with connections wins; else first object
+    from_object: list[dict] = []
+    for value in iter_json_values(raw):
+        items = _extract_connections(value)
+        if not items:
+            continue
+        if isinstance(value, list):
+            return items
+        if not from_object:
+            from_object = items
+    return from_object
 
 
 # Module logger
@@ -323,50 +295,25 @@ logger = logging.getLogger(__name__)
 class RobustAIResponseParser:
     """Robust parser to handle inconsistent AI responses"""
 
-    def __init__(self, valid_nodes: List[Dict[str, Any]]):
+    def __init__(self, valid_nodes: List[Dict[str, Any]], index: Optional[ResolverIndex] = None):
         """
         valid_nodes: List of valid nodes with 'id' and 'title'
+        index: run-wide ResolverIndex to reuse (only valid_nodes are matched); built here if None
         """
         self.uuid_pattern = re.compile(
             r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$',
             re.I
         )
 
-        # Create multiple indices for mapping
         self.id_to_node = {n['id']: n for n in valid_nodes}
-        self.title_to_id = {}
-        self.slug_to_id = {}
-        self.partial_to_id = {}
-
-        for node in valid_nodes:
-            title = node.get('titulo', '').strip()
-            if title:
-                # Exact title mapping
-                self.title_to_id[title.lower()] = node['id']
-
-                # Slug mapping (title converted to slug)
-                slug = self._to_slug(title)
-                self.slug_to_id[slug] = node['id']
-
-                # First words mapping
-                words = title.lower().split()[:3]
-                if words:
-                    key = ' '.join(words)
-                    self.partial_to_id[key] = node['id']
+        self.allowed = ResolverIndex.allow(self.id_to_node)
+        self.fuzzy_ids: set[str] = set()   # ids only found by near-miss title lookup
+        # Title/slug/partial indices (precomputed once per run when shared)
+        self.index = index if index is not None else ResolverIndex(valid_nodes)
 
     def _to_slug(self, text: str) -> str:
         """Converts text to slug"""
-        text = text.lower()
-        text = re.sub(r'[àáäâ]', 'a', text)
-        text = re.sub(r'[èéëê]', 'e', text)
-        text = re.sub(r'[ìíïî]', 'i', text)
-        text = re.sub(r'[òóöô]', 'o', text)
-        text = re.sub(r'[ùúüû]', 'u', text)
-        text = re.sub(r'[ñ]', 'n', text)
-        text = re.sub(r'[ç]', 'c', text)
-        text = re.sub(r'[^\w\s-]', '', text)
-        text = re.sub(r'[-\s]+', '-', text)
-        return text.strip('-')
+        return to_slug(text)
 
     def _extract_json_from_text(self, text: str) -> Optional[Any]:
         def score_obj(o):
@@ -394,78 +341,25 @@ class RobustAIResponseParser:
             except Exception:
                 pass
 
-        # Collect candidates
-        blocks = []
-        blocks += re.findall(r"```json\s*(.*?)\s*```", text, flags=re.DOTALL | re.IGNORECASE)
-        blocks += re.findall(r"```(?:jsonc?|javascript)\s*(.*?)\s*```", text, flags=re.DOTALL | re.IGNORECASE)
-        blocks += re.findall(r"```\s*(.*?)\s*```", text, flags=re.DOTALL | re.IGNORECASE)
-        blocks += re.findall(r"\[.*?\]|\{.*?\}", text, flags=re.DOTALL)
-
-        candidates = sorted(blocks, key=lambda x: -len(x or ""))
+        # Case 2: every top-level value in the text, found in one scan
+        parsed = list(iter_json_values(text))
 
         logger.debug("[debug] id_to_node keys (first 3): %s", list(self.id_to_node.keys())[:3])
-        logger.debug("[debug] raw candidates collected: %s", len(candidates))
-
-        parsed, seen = [], set()
-        for chunk in candidates:
-            if not isinstance(chunk, str):
-                continue
-            s = chunk.strip()
-            for trial in (s, s.rstrip(",;")):
-                try:
-                    obj = json.loads(trial)
-                    key = json.dumps(obj, ensure_ascii=False, sort_keys=True)
-                    if key not in seen:
-                        parsed.append(obj)
-                        seen.add(key)
-                    break
-                except Exception:
-                    continue
+        logger.debug("[debug] JSON values found: %s", len(parsed))
 
         if not parsed:
             return None
 
-        parsed.sort(key=score_obj, reverse=True)
-        return parsed[0]
+        # Best-scoring value; ties keep the first one in the text
+        return max(parsed, key=score_obj)
 
     def _resolve_id(self, value: str) -> Optional[str]:
-        if not value or not isinstance(value, str):
-            return None
-
-        # Normalize ID string for matching: remove containers and invisibles
-        v = unicodedata.normalize("NFKC", value)
-        v = v.strip().strip("[](){}<>")
-        v = v.replace("–", "-").replace("—", "-").replace("−", "-")
-        v = v.replace("\u200b", "").replace("\ufeff", "").replace("\u00a0", " ")
-        v_stripped = v.strip()
-
-        # 1. UUID present in text?
-        m = self.uuid_pattern.search(v_stripped)
-        if m:
-            uid = m.group(0).lower()
-            return uid if uid in self.id_to_node else None
-
-        # 2. Mapping by title/slug/partials (do not pass to [0-9a-f-]!)
-        v_lower = v_stripped.lower()
-
-        if v_lower in self.title_to_id:
-            return self.title_to_id[v_lower]
-
-        slug = self._to_slug(v_lower)
-        if slug in self.slug_to_id:
-            return self.slug_to_id[slug]
-
-        words = v_lower.split()[:3]
-        if words:
-            key = " ".join(words)
-            if key in self.partial_to_id:
-                return self.partial_to_id[key]
-
-        for title, node_id in self.title_to_id.items():
-            if v_lower in title or title in v_lower:
-                return node_id
-
-        return None
+        node_id, method = self.index.resolve_with_method(value, self.allowed)
+        if method == "fuzzy":
+            self.fuzzy_ids.add(node_id)
+            PARSER_STATS["fuzzy_resolved"] += 1
+            logger.debug("[parser] near-miss title %r resolved to %s", value, node_id)
+        return node_id
 
     def parse_ai_response(self, response_text: str) -> List[Dict[str, Any]]:
         """
@@ -629,9 +523,8 @@ class RobustAIResponseParser:
 
         if not connections:
             # Fallback for exact title (case-insensitive, uses created indices)
-            low = response_text.lower()
-            for title_low, node_id in self.title_to_id.items():
-                if title_low and title_low in low:
+            for node_id in self.index.titles_in(response_text, self.allowed):
+                if node_id:
                     connections.append({
                         "id": node_id,
                         "titulo": self.id_to_node[node_id].get("titulo", ""),
@@ -642,87 +535,75 @@ class RobustAIResponseParser:
         logger.debug("[parser] returning %d connections", len(connections))
         return connections
 
-def analyze_ai(nota: dict, candidatos: list[dict], ids_ja_trobats: set[str]) -> list[dict]:
-    """Robust AI analysis function: always returns list (can be empty), never None."""
+# Near-miss title resolution counters for the run summary
+PARSER_STATS = {"fuzzy_resolved": 0, "retries_saved": 0}
+
+# Per output mode: answers, answers that were not valid JSON, answers that needed the
+# heavy parser fallback, answers with no valid connection, and retried attempts
+MODE_STATS = {
+    mode: {"calls": 0, "invalid_json": 0, "fallback": 0, "empty": 0, "retries": 0}
+    for mode in ("free", "structured")
+}
+
+
+def _count_saved_retry(found: list[dict], parser: RobustAIResponseParser) -> None:
+    # Without the near-miss lookup this answer would have been empty → another AI call
+    if found and all(c.get("id") in parser.fuzzy_ids for c in found):
+        PARSER_STATS["retries_saved"] += 1
+
+
+def log_parser_stats() -> None:
+    """Logs how often near-miss title lookup rescued an AI answer, and parse rates per output mode."""
+    if PARSER_STATS["fuzzy_resolved"]:
+        logger.info("🔎 Near-miss titles resolved: %d · AI retries saved: %d",
+                    PARSER_STATS["fuzzy_resolved"], PARSER_STATS["retries_saved"])
+    for mode, st in MODE_STATS.items():
+        n = st["calls"]
+        if not n:
+            continue
+        logger.info("🧾 AI answers (%s): %d · invalid JSON %.1f%% · parser fallback %.1f%% · empty %.1f%% · retries %.1f%%",
+                    mode, n, 100.0 * st["invalid_json"] / n, 100.0 * st["fallback"] / n,
+                    100.0 * st["empty"] / n, 100.0 * st["retries"] / n)
+
+
+def analyze_ai(nota: dict, candidatos: list[dict], ids_ja_trobats: set[str],
+               index: Optional[ResolverIndex] = None, ranker=None) -> list[dict]:
+    """
+    Robust AI analysis function: always returns list (can be empty), never None.
+    `index`: run-wide ResolverIndex over all notes (see process()); built per call if None.
+    `ranker`: run-wide SemanticIndex or LexicalIndex; the model then sees the closest
+    candidates instead of the first ones in database order.
+    """
     # 0. Filter out already processed candidates
     pendents = [c for c in candidatos if c["id"] not in ids_ja_trobats]
     if not pendents:
         return []
 
+    # Circuit open → tags-only, no retries and no backoff against a dead server
+    if not ai_available():
+        logger.info("  ⏭ AI circuit open: skipping AI analysis (tags only)")
+        return []
+
+    if ranker is not None:
+        pendents = ranker.rank(nota["id"], pendents)
+
     time.sleep(0.5)
 
-    # Initialize parser and helper indices
-    parser = RobustAIResponseParser(pendents)
-    valid_ids = {c["id"] for c in pendents}
-
-    # 1. Build context from candidate notes
-    contexto_lines = []
-    for i, c in enumerate(pendents[:10], 1):
-        raw_tags = c.get("tags", [])
-        if isinstance(raw_tags, list):
-            tag_names = []
-            for t in raw_tags[:3]:
-                if isinstance(t, dict):
-                    tag_names.append(t.get("name", ""))
-                elif isinstance(t, str):
-                    tag_names.append(t)
-            tags = ", ".join(filter(None, tag_names)) if tag_names else "none"
-        else:
-            tags = "none"
+    # 1. Pack the prompt with as many candidates as fit the token budget
+    structured = bool(AI_STRUCTURED_OUTPUT)
+    prompt, included, prompt_tokens = build_prompt(nota, pendents, MIN_SIM, structured=structured)
+    if not included:
+        logger.warning("  ⚠ Prompt budget too small for any candidate; skipping AI analysis")
+        return []
+    # Constrained output: ids limited to the candidates in the prompt
+    schema = connections_schema([c["id"] for c in included], MIN_SIM) if structured else None
+    logger.info("  ↳ AI prompt: ~%d tokens · %d/%d candidates", prompt_tokens, len(included), len(pendents))
 
-        preview = (c.get("contenido") or "")[:100]
-        contexto_lines.append(
-            f"{i}. [{c['id']}] {c['titulo']}\n"
-            f"   Tags: {tags}\n"
-            f"   Preview: {preview}..."
-        )
+    # Initialize parser and helper indices (only candidates the model actually sees)
+    parser = RobustAIResponseParser(included, index=index)
+    valid_ids = {c["id"] for c in included}
 
-    contexto = "\n".join(contexto_lines)
-
-    # 2. Construct robust prompt for AI
-    raw_tags = nota.get("tags", [])
-    if isinstance(raw_tags, list):
-        tag_names = []
-        for t in raw_tags[:10]:
-            if isinstance(t, dict):
-                tag_names.append(t.get("name", ""))
-            elif isinstance(t, str):
-                tag_names.append(t)
-        tags_str = ", ".join(filter(None, tag_names)) if tag_names else "none"
-    else:
-        tags_str = "none"
-
-    prompt = f"""You are a JSON-only responder.
-
-        Return raw JSON ONLY. Do NOT include code fences, backticks, or any text before/after.
-        
-        TASK:
-        Given a SOURCE NOTE and several CANDIDATE NOTES (each candidate shows its title and [UUID] in brackets),
-        return conceptual connections from the source note to candidates.
-        
-        OUTPUT FORMAT (array only):
-        [
-          {{ "id": "<UUID exactly as shown in brackets>", "similarity": 0-100, "reason": "<brief explanation>" }}
-        ]
-        
-        CONSTRAINTS:
-        - Use ONLY UUIDs appearing in the CANDIDATE NOTES headers (the text between [ and ]).
-        - similarity MUST be an integer 0-100 (no percentages, no floats).
-        - Include ONLY entries with similarity >= {MIN_SIM}.
-        - If there are NO connections >= {MIN_SIM}, return exactly: []
-        - Reason MUST be 5–25 words, concrete and human-readable. Avoid single-word labels like "Ètica".
-        - Write reasons in Catalan or Spanish and mention 1–2 specific overlapping concepts/tags.
-        - If any reason would be shorter than 5 words, DO NOT include that entry.
-        
-        SOURCE NOTE:
-        Title: {nota['titulo']}
-        Tags: {tags_str}
-        Content preview: {(nota.get('contenido') or '')[:300]}...
-        
-        CANDIDATE NOTES (use the ID in brackets):
-        {contexto}"""
-
-    # 3. Execute AI call with retries and parsing
+    # 2. Execute AI call with retries and parsing
     logger.debug("\n================ PROMPT to AI_MODEL ================\n%s\n==================================================\n", prompt)
 
     last_err = None
@@ -731,8 +612,13 @@ def analyze_ai(nota: dict, candidatos: list[dict], ids_ja_trobats: set[str]) ->
         try:
             # --- AI CLIENT API ---
             # call_ai_client returns the text string directly (or raises exception on error)
-            response_text = call_ai_client(prompt, stream=True, timeout=AI_MODEL_TIMEOUT)
-            
+            response_text = call_ai_client(prompt, stream=True, json_schema=schema)
+            mode = "structured" if getattr(response_text, "structured", False) else "free"
+            stats = MODE_STATS[mode]
+            stats["calls"] += 1
+            if attempt:
+                stats["retries"] += 1
+
             if not isinstance(response_text, str):
                 response_text = str(response_text)
             
@@ -743,8 +629,14 @@ def analyze_ai(nota: dict, candidatos: list[dict], ids_ja_trobats: set[str]) ->
                 response_text[:600].replace("\n", "\\n")
             )
 
-            # Robust JSON parsing
-            items = _parse_ai_json_robust(response_text)
+            # Schema-constrained answers are plain JSON; robust parsing only if that fails
+            try:
+                data = json.loads(response_text)
+            except ValueError:
+                data = None
+                stats["invalid_json"] += 1
+            schema_ok = mode == "structured" and data is not None
+            items = _extract_connections(data) if schema_ok else _parse_ai_json_robust(response_text)
 
             # Normalization and filter
             out = []
@@ -756,6 +648,9 @@ def analyze_ai(nota: dict, candidatos: list[dict], ids_ja_trobats: set[str]) ->
                 _id_raw = str(it.get("id") or "").strip()
                 _id = _strip_id(_id_raw)
 
+                if _id not in valid_ids:
+                    # title instead of UUID, or a mangled one: shared resolver (incl. near-miss titles)
+                    _id = parser._resolve_id(_id_raw)
                 if not _id or _id not in valid_ids:
                     skipped_id += 1
                     continue
@@ -780,10 +675,19 @@ def analyze_ai(nota: dict, candidatos: list[dict], ids_ja_trobats: set[str]) ->
                          len(out), skipped_id, skipped_sim, skipped_reason)
 
             if out:
+                _count_saved_retry(out, parser)
                 logger.info("  ✓ Found %d valid connections", len(out))
                 return out
 
+            if schema_ok:
+                # Valid constrained answer with nothing usable: no text to dig titles or UUIDs from
+                stats["empty"] += 1
+                logger.debug("  ℹ Attempt %d/%d: structured answer with no valid connections",
+                             attempt + 1, AI_MODEL_RETRIES + 1)
+                continue
+
             # Fallback
+            stats["fallback"] += 1
             connections = parser.parse_ai_response(response_text) or []
 
             connections = [
@@ -794,16 +698,23 @@ def analyze_ai(nota: dict, candidatos: list[dict], ids_ja_trobats: set[str]) ->
             ]
 
             if connections:
+                _count_saved_retry(connections, parser)
                 logger.info("  ✓ Found %d valid connections (fallback)", len(connections))
                 return connections
 
+            stats["empty"] += 1
             if not out and not connections:
                 logger.debug("  ℹ Attempt %d/%d: AI returned no valid connections. Raw preview: %s", 
                                attempt + 1, AI_MODEL_RETRIES + 1, response_text[:200].replace("\n", " "))
 
+        except CircuitOpenError as e:
+            last_err = e
+            logger.warning("  ⏭ %s", e)
+            break
+
         except (requests.Timeout, requests.ConnectionError) as e:
             last_err = e
-            if attempt < AI_MODEL_RETRIES:
+            if attempt < AI_MODEL_RETRIES and ai_available():
                 sleep_s = AI_MODEL_BACKOFF ** attempt
                 logger.warning("%s call failed (attempt %d/%d): %s · retrying in %.2fs",
                                AI_MODEL_NAME, attempt + 1, AI_MODEL_RETRIES + 1, e, sleep_s)
@@ -811,12 +722,12 @@ def analyze_ai(nota: dict, candidatos: list[dict], ids_ja_trobats: set[str]) ->
                 continue
             else:
                 logger.error("%s call failed after %d attempts: %s",
-                             AI_MODEL_NAME, AI_MODEL_RETRIES + 1, e)
+                             AI_MODEL_NAME, attempt + 1, e)
                 break
 
         except Exception as e:
             last_err = e
-            if attempt < AI_MODEL_RETRIES:
+            if attempt < AI_MODEL_RETRIES and ai_available():
                 sleep_s = AI_MODEL_BACKOFF ** attempt
                 logger.warning("%s error (attempt %d/%d): %s · retrying in %.2fs",
                                AI_MODEL_NAME, attempt + 1, AI_MODEL_RETRIES + 1, e, sleep_s)
@@ -0,0 +1,82 @@
+# pipeline/parses/title_matcher.py
+"""
+Aho–Corasick multi-pattern matcher.
+
+Built once over many patterns (e.g. all lowercased note titles), then finds
+every pattern occurrence in a text in a single pass: O(len(text) + matches)
+instead of one substring search per pattern.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import Iterable, Iterator
+
+
+class TitleMatcher:
+    def __init__(self, patterns: Iterable[str] = ()):
+        # Trie as parallel arrays: transitions, failure link, patterns ending here,
+        # and the nearest node on the failure chain that ends a pattern (output link)
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[int]] = [[]]
+        self._dict_link: list[int] = [-1]
+        self.patterns: list[str] = []
+        self._index: dict[str, int] = {}
+        for p in patterns:
+            self._insert(p)
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def _insert(self, pattern: str) -> None:
+        if not pattern or pattern in self._index:
+            return
+        pid = len(self.patterns)
+        self.patterns.append(pattern)
+        self._index[pattern] = pid
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._dict_link.append(-1)
+            node = nxt
+        self._out[node].append(pid)
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                fc = self._fail[child]
+                self._dict_link[child] = fc if self._out[fc] else self._dict_link[fc]
+                queue.append(child)
+
+    def iter_matches(self, text: str) -> Iterator[tuple[int, str]]:
+        """Yields (end_index, pattern) for every occurrence, overlapping ones included."""
+        goto, fail, out, link = self._goto, self._fail, self._out, self._dict_link
+        patterns = self.patterns
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if out[node] else link[node]
+            while hit > 0:
+                for pid in out[hit]:
+                    yield i + 1, patterns[pid]
+                hit = link[hit]
+
+    def find_all(self, text: str) -> set[str]:
+        """Distinct patterns that occur in `text`."""
+        return {p for _, p in self.iter_matches(text or "")}
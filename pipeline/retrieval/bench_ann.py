@@ -0,0 +1,132 @@
+# pipeline/retrieval/bench_ann.py
+"""
+Recall/speed benchmark of the IVF index against exact (blocked brute-force) search.
+
+Vectors are synthetic and clustered, like note embeddings (topics). Reports the
+build time, incremental insertion, save/load, and for each nprobe the query
+throughput and recall@k of the approximate neighbours.
+
+Usage:
+    python -m pipeline.retrieval.bench_ann --n 100000 --dim 128 --k 10 --nprobe 1,4,8,16,32
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from pipeline.retrieval.ivf_index import IVFIndex, _unit
+
+
+def clustered_vectors(n: int, dim: int, clusters: int, spread: float = 0.6, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return _unit(centers[labels] + spread * rng.normal(size=(n, dim)).astype(np.float32))
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, block: int = 1024) -> np.ndarray:
+    out = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), block):
+        sims = queries[start:start + block] @ vectors.T
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1)
+        out[start:start + block] = np.take_along_axis(top, order, axis=1)
+    return out
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size if truth.size else 1.0
+
+
+def run(args) -> dict:
+    vectors = clustered_vectors(args.n, args.dim, args.clusters or max(8, args.n // 500), seed=args.seed)
+    keys = [f"v{i}" for i in range(args.n)]
+    rng = np.random.default_rng(args.seed + 1)
+    qidx = rng.choice(args.n, min(args.queries, args.n), replace=False)
+    queries = vectors[qidx]
+
+    t0 = time.perf_counter()
+    truth = exact_top_k(vectors, queries, args.k)
+    exact_s = time.perf_counter() - t0
+
+    # Train on 90%, insert the rest incrementally
+    split = int(args.n * 0.9)
+    index = IVFIndex(nlist=args.nlist, nprobe=1, seed=args.seed)
+    t0 = time.perf_counter()
+    index.train(vectors[:split])
+    index.add(keys[:split], vectors[:split])
+    build_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    index.add(keys[split:], vectors[split:])
+    insert_s = time.perf_counter() - t0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "ann.npz"
+        t0 = time.perf_counter()
+        index.save(path)
+        save_s = time.perf_counter() - t0
+        size_mb = path.stat().st_size / 1e6
+        t0 = time.perf_counter()
+        index = IVFIndex.load(path)
+        load_s = time.perf_counter() - t0
+
+    # internal row -> position in `vectors`
+    position = np.empty(len(index), dtype=np.int64)
+    position[index.rows(keys)] = np.arange(args.n)
+    results = []
+    for nprobe in args.nprobe:
+        t0 = time.perf_counter()
+        found, _ = index.search(queries, args.k, nprobe=nprobe)
+        elapsed = time.perf_counter() - t0
+        results.append({
+            "nprobe": nprobe,
+            "recall": round(recall_at_k(np.where(found >= 0, position[found.clip(0)], -1), truth), 4),
+            "queries_per_s": round(len(queries) / elapsed, 1) if elapsed else None,
+            "speedup_vs_exact": round(exact_s / elapsed, 1) if elapsed else None,
+        })
+
+    return {
+        "n": args.n, "dim": args.dim, "k": args.k, "queries": len(queries),
+        "nlist": len(index.centroids),
+        "build_s": round(build_s, 2), "insert_s": round(insert_s, 2),
+        "save_s": round(save_s, 2), "load_s": round(load_s, 2), "size_mb": round(size_mb, 1),
+        "exact_queries_per_s": round(len(queries) / exact_s, 1) if exact_s else None,
+        "results": results,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Recall@k of the IVF index against exact search")
+    ap.add_argument("--n", type=int, default=100000)
+    ap.add_argument("--dim", type=int, default=128)
+    ap.add_argument("--clusters", type=int, default=0, help="synthetic topics (0 = n/500)")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--nlist", type=int, default=0, help="0 = 4·√n")
+    ap.add_argument("--nprobe", type=lambda s: [int(x) for x in s.split(",")], default=[1, 4, 8, 16, 32])
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", dest="json_out", help="also write the report to this file")
+    args = ap.parse_args()
+
+    report = run(args)
+    print("=" * 60)
+    print(f"📦 {report['n']} × {report['dim']} vectors · {report['nlist']} lists · "
+          f"build {report['build_s']}s · insert 10% {report['insert_s']}s · "
+          f"save {report['save_s']}s / load {report['load_s']}s ({report['size_mb']} MB)")
+    print(f"🎯 exact: {report['exact_queries_per_s']} queries/s")
+    for r in report["results"]:
+        print(f"   nprobe={r['nprobe']:>3}: recall@{report['k']}={r['recall']:.3f} · "
+              f"{r['queries_per_s']} queries/s · ×{r['speedup_vs_exact']} vs exact")
+    print("=" * 60)
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# pipeline/retrieval/embeddings.py
+"""
+Note embeddings from an OpenAI-compatible /v1/embeddings endpoint, cached on disk.
+
+Vectors are kept L2-normalized (float32) in one .npz file, keyed by a hash of
+the embedding model and the note text: an unchanged note is never embedded
+twice, and an edited note simply gets a new key (the old one is dropped by
+retain() once no note uses it).
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import requests
+
+from config.app_config import load_params
+from config.logger_config import get_logger
+
+cfg = load_params()
+log = get_logger(__name__)
+
+EMBED_TEXT_CHARS = int(cfg.retrieval.get("text_chars", 2000))
+
+
+def note_text(note: dict) -> str:
+    """Text embedded for a note: title, tags, then the start of its content."""
+    tags = " ".join(t.get("name", "") if isinstance(t, dict) else str(t) for t in (note.get("tags") or []))
+    parts = [note.get("titulo") or "", tags, note.get("contenido") or ""]
+    return "\n".join(p for p in parts if p)[:EMBED_TEXT_CHARS]
+
+
+def content_hash(model: str, text: str) -> str:
+    return hashlib.sha1(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingStore:
+    """Content hash → unit vector, persisted to `path` (.npz with 'keys' and 'vectors')."""
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path else None
+        self._row: dict[str, int] = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._dirty = False
+        if self.path and self.path.exists():
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._row)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._row
+
+    @property
+    def dim(self) -> int:
+        return self._vectors.shape[1] if len(self._row) else 0
+
+    def get(self, key: str) -> np.ndarray | None:
+        row = self._row.get(key)
+        return None if row is None else self._vectors[row]
+
+    def get_many(self, keys: list[str]) -> np.ndarray:
+        """Stacked vectors for `keys` (all must be present)."""
+        return self._vectors[[self._row[k] for k in keys]]
+
+    def put_many(self, keys: list[str], vectors: np.ndarray) -> None:
+        vectors = _unit(vectors)
+        if not len(keys):
+            return
+        if self._row and vectors.shape[1] != self.dim:
+            # Another embedding model: the old vectors are not comparable
+            log.warning("⚠️ Embedding size changed (%d → %d); dropping %d cached vectors",
+                        self.dim, vectors.shape[1], len(self._row))
+            self._row = {}
+            self._vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        new = [(k, v) for k, v in zip(keys, vectors) if k not in self._row]
+        if not new:
+            return
+        base = len(self._row)
+        for i, (k, _) in enumerate(new):
+            self._row[k] = base + i
+        block = np.stack([v for _, v in new])
+        self._vectors = block if base == 0 else np.vstack([self._vectors, block])
+        self._dirty = True
+
+    def retain(self, keys: Iterable[str]) -> int:
+        """Drops the vectors of every key not in `keys` (edited or deleted notes); returns how many."""
+        keys = set(keys)
+        kept = [k for k in self._row if k in keys]
+        dropped = len(self._row) - len(kept)
+        if dropped:
+            self._vectors = self._vectors[[self._row[k] for k in kept]]
+            self._row = {k: i for i, k in enumerate(kept)}
+            self._dirty = True
+        return dropped
+
+    def load(self) -> None:
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                keys = [str(k) for k in data["keys"]]
+                vectors = np.asarray(data["vectors"], dtype=np.float32)
+        except (OSError, KeyError, ValueError) as e:
+            log.warning("⚠️ Could not read embedding store %s (%s); starting empty", self.path, e)
+            return
+        self._row = {k: i for i, k in enumerate(keys)}
+        self._vectors = vectors
+        self._dirty = False
+
+    def save(self) -> None:
+        """Writes the store if it changed (temp file + rename, so a crash never leaves half a file)."""
+        if not self.path or not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        keys = np.array(list(self._row), dtype="U40")
+        buf = io.BytesIO()
+        np.savez(buf, keys=keys, vectors=self._vectors)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_bytes(buf.getvalue())
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+
+class EmbeddingClient:
+    """Batched calls to an OpenAI-compatible /v1/embeddings endpoint."""
+
+    def __init__(self, url: str, model: str, api_key: str | None = None,
+                 batch_size: int = 32, timeout: float = 60):
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.batch_size = max(1, int(batch_size))
+        self.timeout = float(timeout)
+
+    def _headers(self) -> dict:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def embed(self, texts: Iterable[str]) -> np.ndarray:
+        """One row per text, in order. Raises on HTTP or format errors."""
+        texts = list(texts)
+        rows: list[list[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i:i + self.batch_size]
+            resp = requests.post(self.url, headers=self._headers(),
+                                 json={"model": self.model, "input": batch}, timeout=self.timeout)
+            if resp.status_code != 200:
+                raise RuntimeError(f"Embedding error {resp.status_code}: {resp.text[:200]}")
+            data = sorted(resp.json()["data"], key=lambda d: d.get("index", 0))
+            if len(data) != len(batch):
+                raise RuntimeError(f"Embedding endpoint returned {len(data)} vectors for {len(batch)} texts")
+            rows.extend(d["embedding"] for d in data)
+        return np.asarray(rows, dtype=np.float32)
@@ -0,0 +1,236 @@
+# pipeline/retrieval/ivf_index.py
+"""
+Inverted-file (IVF) approximate nearest-neighbour index for unit vectors, NumPy only.
+
+Vectors are grouped by their nearest centroid (spherical k-means, trained on
+a sample). A query scores only the vectors of its `nprobe` closest lists, so a
+search costs about nprobe / nlist of brute force: more probes, more recall.
+Queries are searched in batches: every list is scored once against all the
+queries that probe it, as one matrix product.
+
+New vectors are assigned to the existing centroids (incremental insertion);
+retrain once the index has grown well past its training set (stale()).
+The index, keyed by caller keys (e.g. embedding content hashes), is saved to
+and loaded from a single .npz file.
+"""
+from __future__ import annotations
+
+import io
+import math
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def default_nlist(n: int) -> int:
+    """About 4·√n lists (the usual IVF sizing), at least 1."""
+    return max(1, int(4 * math.sqrt(max(n, 1))))
+
+
+class IVFIndex:
+    def __init__(self, nlist: int = 0, nprobe: int = 8, iterations: int = 10,
+                 train_per_list: int = 64, seed: int = 0):
+        """
+        nlist: number of lists (0 = default_nlist of the training set).
+        nprobe: lists scanned per query (recall/speed knob; can be overridden per search).
+        """
+        self.nlist = int(nlist)
+        self.nprobe = max(1, int(nprobe))
+        self.iterations = int(iterations)
+        self.train_per_list = int(train_per_list)
+        self.seed = int(seed)
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.trained_on = 0
+        self.keys: list[str] = []
+        self._row: dict[str, int] = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)   # capacity-grown, first len(keys) rows used
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._lists: list[np.ndarray] | None = None          # rows per list, rebuilt after inserts
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._row
+
+    @property
+    def trained(self) -> bool:
+        return len(self.centroids) > 0
+
+    @property
+    def dim(self) -> int:
+        return self.centroids.shape[1] if self.trained else 0
+
+    def rows(self, keys: Iterable[str]) -> np.ndarray:
+        """Internal rows of `keys` (all must be present)."""
+        return np.fromiter((self._row[k] for k in keys), dtype=np.int64)
+
+    def stale(self, growth: float = 2.0) -> bool:
+        """True once the index holds `growth` times the vectors its centroids were trained on."""
+        return not self.trained or len(self) > growth * max(self.trained_on, 1)
+
+    # ------------------------------------------------------------------ training
+
+    def _nearest(self, vectors: np.ndarray, block: int = 4096) -> np.ndarray:
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block):
+            out[start:start + block] = np.argmax(vectors[start:start + block] @ self.centroids.T, axis=1)
+        return out
+
+    def train(self, vectors: np.ndarray) -> None:
+        """Spherical k-means on a sample of `vectors`; drops any indexed vectors."""
+        vectors = _unit(vectors)
+        n = len(vectors)
+        if n == 0:
+            raise ValueError("IVFIndex.train needs at least one vector")
+        nlist = min(self.nlist or default_nlist(n), n)
+        rng = np.random.default_rng(self.seed)
+        sample = vectors
+        if n > nlist * self.train_per_list:
+            sample = vectors[rng.choice(n, nlist * self.train_per_list, replace=False)]
+        self.centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assign = self._nearest(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # reseed empty lists with random sample points
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+            self.centroids = _unit(sums)
+        self.trained_on = n
+        self.keys = []
+        self._row = {}
+        self._vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._lists = None
+
+    # ------------------------------------------------------------------ insertion
+
+    def add(self, keys: list[str], vectors: np.ndarray) -> int:
+        """Inserts the vectors whose key is not indexed yet; returns how many were added."""
+        if not self.trained:
+            raise RuntimeError("IVFIndex.add before train()")
+        vectors = _unit(vectors)
+        new = [i for i, k in enumerate(keys) if k not in self._row]
+        if not new:
+            return 0
+        vectors = vectors[new]
+        n0, n1 = len(self.keys), len(self.keys) + len(new)
+        if n1 > len(self._vectors):
+            cap = max(n1, 2 * len(self._vectors), 1024)
+            grown = np.zeros((cap, vectors.shape[1]), dtype=np.float32)
+            grown[:n0] = self._vectors[:n0]
+            self._vectors = grown
+            assign = np.zeros(cap, dtype=np.int32)
+            assign[:n0] = self._assign[:n0]
+            self._assign = assign
+        self._vectors[n0:n1] = vectors
+        self._assign[n0:n1] = self._nearest(vectors)
+        for i, idx in enumerate(new):
+            self._row[keys[idx]] = n0 + i
+            self.keys.append(keys[idx])
+        self._lists = None
+        return len(new)
+
+    def _list_rows(self) -> list[np.ndarray]:
+        if self._lists is None:
+            n = len(self.keys)
+            order = np.argsort(self._assign[:n], kind="stable")
+            bounds = np.searchsorted(self._assign[:n][order], np.arange(len(self.centroids) + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        return self._lists
+
+    # ------------------------------------------------------------------ search
+
+    def search(self, queries: np.ndarray, k: int, nprobe: Optional[int] = None,
+               live: Optional[np.ndarray] = None, block: int = 4096) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k by cosine for each query row.
+        `live`: boolean mask over internal rows; other rows are never returned.
+        Returns (rows, scores), both (n_queries, k), best first; missing hits are -1 / -inf.
+        """
+        queries = _unit(queries)
+        nq = len(queries)
+        rows_out = np.full((nq, k), -1, dtype=np.int64)
+        scores_out = np.full((nq, k), -np.inf, dtype=np.float32)
+        if not self.trained or not len(self.keys) or k <= 0:
+            return rows_out, scores_out
+        nprobe = min(max(1, int(nprobe or self.nprobe)), len(self.centroids))
+        lists = self._list_rows()
+        if live is not None:
+            lists = [r[live[r]] for r in lists]
+        vectors = self._vectors
+
+        for start in range(0, nq, block):
+            q = queries[start:start + block]
+            best_r = rows_out[start:start + block]
+            best_s = scores_out[start:start + block]
+            coarse = q @ self.centroids.T
+            probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe] if nprobe < coarse.shape[1] \
+                else np.broadcast_to(np.arange(coarse.shape[1]), coarse.shape)
+            # invert (query, list) pairs: every list is scored once against its queries
+            flat = probes.ravel()
+            order = np.argsort(flat, kind="stable")
+            qids = order // nprobe
+            bounds = np.searchsorted(flat[order], np.arange(len(self.centroids) + 1))
+            for li in range(len(self.centroids)):
+                qs = qids[bounds[li]:bounds[li + 1]]
+                cand = lists[li]
+                if not len(qs) or not len(cand):
+                    continue
+                sims = q[qs] @ vectors[cand].T
+                all_s = np.hstack([best_s[qs], sims])
+                all_r = np.hstack([best_r[qs], np.broadcast_to(cand, sims.shape)])
+                if all_s.shape[1] > k:
+                    top = np.argpartition(-all_s, k - 1, axis=1)[:, :k]
+                    all_s = np.take_along_axis(all_s, top, axis=1)
+                    all_r = np.take_along_axis(all_r, top, axis=1)
+                best_s[qs] = all_s
+                best_r[qs] = all_r
+            order = np.argsort(-best_s, axis=1, kind="stable")
+            rows_out[start:start + block] = np.take_along_axis(best_r, order, axis=1)
+            scores_out[start:start + block] = np.take_along_axis(best_s, order, axis=1)
+        return rows_out, scores_out
+
+    # ------------------------------------------------------------------ persistence
+
+    def save(self, path: str | Path) -> None:
+        """Writes the index (temp file + rename)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        n = len(self.keys)
+        buf = io.BytesIO()
+        np.savez(buf, centroids=self.centroids, vectors=self._vectors[:n], assign=self._assign[:n],
+                 keys=np.array(self.keys, dtype="U64"),
+                 params=np.array([self.nlist, self.nprobe, self.iterations, self.train_per_list,
+                                  self.seed, self.trained_on], dtype=np.int64))
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(buf.getvalue())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "IVFIndex":
+        with np.load(Path(path), allow_pickle=False) as data:
+            nlist, nprobe, iterations, train_per_list, seed, trained_on = (int(x) for x in data["params"])
+            index = cls(nlist=nlist, nprobe=nprobe, iterations=iterations,
+                        train_per_list=train_per_list, seed=seed)
+            index.centroids = np.asarray(data["centroids"], dtype=np.float32)
+            index._vectors = np.asarray(data["vectors"], dtype=np.float32)
+            index._assign = np.asarray(data["assign"], dtype=np.int32)
+            index.keys = [str(k) for k in data["keys"]]
+        index.trained_on = trained_on
+        index._row = {k: i for i, k in enumerate(index.keys)}
+        return index
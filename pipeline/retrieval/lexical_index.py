@@ -0,0 +1,209 @@
+# pipeline/retrieval/lexical_index.py
+"""
+BM25 lexical index over note titles, tags and content (no embedding model needed).
+
+Postings are sparse dicts (term → {note id: term frequency}); document
+frequencies and the average length are kept up to date, so single notes can
+be added or removed without a rebuild. A note's query is its own highest
+tf·idf terms, and only their postings are walked.
+
+Tags are indexed as whole terms ("#<normalized tag>"), the same equality
+tag_similarity() uses, so notes sharing a tag are always found. An optional
+`keywords` tokenizer gets its own postings (token → note ids), so matches()
+can follow the exact tokens a scorer compares instead of the BM25 terms.
+"""
+from __future__ import annotations
+
+import json
+import math
+import re
+import time
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from config.app_config import load_params
+from config.logger_config import get_logger
+from pipeline.utils.tag_normalization import normalize_tag
+
+cfg = load_params()
+log = get_logger(__name__)
+
+LEXICAL_ENABLED = bool(cfg.retrieval.get("lexical", True))
+BM25_K1         = float(cfg.retrieval.get("bm25_k1", 1.2))
+BM25_B          = float(cfg.retrieval.get("bm25_b", 0.75))
+QUERY_TERMS     = int(cfg.retrieval.get("query_terms", 64))
+TOP_K           = int(cfg.retrieval.get("top_k", 10))
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+TAG_PREFIX = "#"
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFD", (text or "").casefold())
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+
+
+def load_stopwords(path: str | Path | None = None) -> frozenset[str]:
+    """Stopwords from config/stopwords.json (a list or {"all": [...]}), accent-folded."""
+    path = Path(path or cfg.paths.get("STOPWORDS_PATH") or "")
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        log.warning("⚠️ Could not load stopwords from %s (%s); indexing every word", path, e)
+        return frozenset()
+    words = data.get("all", []) if isinstance(data, dict) else data if isinstance(data, list) else []
+    return frozenset(_fold(w).strip() for w in words if isinstance(w, str) and w.strip())
+
+
+class LexicalIndex:
+    def __init__(self, notes: Iterable[dict] = (), stopwords: Optional[Iterable[str]] = None,
+                 k1: float = BM25_K1, b: float = BM25_B, query_terms: int = QUERY_TERMS, top_k: int = TOP_K,
+                 keywords: Optional[Callable[[dict], Iterable[str]]] = None):
+        self.k1 = float(k1)
+        self.b = float(b)
+        self.query_terms = int(query_terms)
+        self.top_k = int(top_k)
+        self.stopwords = frozenset(stopwords) if stopwords is not None else load_stopwords()
+        self._postings: dict[str, dict[str, int]] = {}   # term -> note id -> tf
+        self._terms: dict[str, Counter] = {}             # note id -> term counts
+        self._length: dict[str, int] = {}
+        self._total_length = 0
+        self.keywords = keywords
+        self._keyword_postings: dict[str, set[str]] = {}   # keyword token -> note ids
+        self._keywords: dict[str, frozenset[str]] = {}     # note id -> keyword tokens
+        for note in notes:
+            self.add(note)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def __contains__(self, note_id: str) -> bool:
+        return note_id in self._terms
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._postings)
+
+    def terms(self, note: dict) -> Counter:
+        """Indexed terms of a note: folded words of title and content without stopwords, plus its tags."""
+        text = f"{note.get('titulo') or ''} {note.get('contenido') or ''}"
+        words = [w for w in _WORD_RE.findall(_fold(text)) if len(w) > 1 and w not in self.stopwords]
+        counts = Counter(words)
+        for t in note.get("tags") or []:
+            tag = normalize_tag(t.get("name", "") if isinstance(t, dict) else t)
+            if tag:
+                counts[TAG_PREFIX + tag] += 1
+        return counts
+
+    def add(self, note: dict) -> None:
+        """Indexes (or re-indexes) a note."""
+        nid = note["id"]
+        self.remove(nid)
+        counts = self.terms(note)
+        self._terms[nid] = counts
+        length = sum(counts.values())
+        self._length[nid] = length
+        self._total_length += length
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[nid] = tf
+        if self.keywords is not None:
+            tokens = self._keywords[nid] = frozenset(self.keywords(note))
+            for token in tokens:
+                self._keyword_postings.setdefault(token, set()).add(nid)
+
+    def remove(self, note_id: str) -> None:
+        for token in self._keywords.pop(note_id, ()):
+            ids = self._keyword_postings.get(token)
+            if ids is not None:
+                ids.discard(note_id)
+                if not ids:
+                    del self._keyword_postings[token]
+        counts = self._terms.pop(note_id, None)
+        if counts is None:
+            return
+        self._total_length -= self._length.pop(note_id, 0)
+        for term in counts:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(note_id, None)
+                if not posting:
+                    del self._postings[term]
+
+    def idf(self, term: str) -> float:
+        df = len(self._postings.get(term, ()))
+        n = len(self._terms)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def _query(self, note_id: str) -> list[tuple[str, float]]:
+        """(term, query weight) of the note's top tf·idf terms; tags always included."""
+        counts = self._terms.get(note_id) or {}
+        weighted = [(t, tf * self.idf(t)) for t, tf in counts.items()]
+        tags = [tw for tw in weighted if tw[0].startswith(TAG_PREFIX)]
+        words = sorted((tw for tw in weighted if not tw[0].startswith(TAG_PREFIX)),
+                       key=lambda tw: tw[1], reverse=True)
+        return tags + words[:max(0, self.query_terms - len(tags))]
+
+    def scores(self, note_id: str, allowed: Optional[Iterable[str]] = None) -> dict[str, float]:
+        """BM25 scores of the notes sharing a query term with `note_id` (itself excluded)."""
+        allowed = None if allowed is None else set(allowed)
+        avgdl = (self._total_length / len(self._terms)) if self._terms else 0.0
+        k1, b = self.k1, self.b
+        out: dict[str, float] = {}
+        for term, _ in self._query(note_id):
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            idf = self.idf(term)
+            for nid, tf in posting.items():
+                if nid == note_id or (allowed is not None and nid not in allowed):
+                    continue
+                norm = k1 * (1.0 - b + b * self._length[nid] / avgdl) if avgdl else k1
+                out[nid] = out.get(nid, 0.0) + idf * tf * (k1 + 1.0) / (tf + norm)
+        return out
+
+    def rank(self, note_id: str, candidates: list[dict], k: Optional[int] = None) -> list[dict]:
+        """
+        The k candidates with the highest BM25 score for `note_id`, best first
+        (ties and unmatched candidates keep their order after them).
+        """
+        k = self.top_k if k is None else int(k)
+        if note_id not in self._terms:
+            return candidates[:k]
+        scores = self.scores(note_id, (c["id"] for c in candidates))
+        ranked = sorted((c for c in candidates if c["id"] != note_id),
+                        key=lambda c: scores.get(c["id"], 0.0), reverse=True)
+        return ranked[:k]
+
+    def matches(self, note_id: str, candidates: list[dict], tags_only: bool = False) -> list[dict]:
+        """
+        Candidates sharing a tag with `note_id` or, unless `tags_only`, a keyword
+        token (an indexed word if the index has no `keywords` tokenizer), in their
+        original order. Unknown notes get every candidate back.
+        """
+        counts = self._terms.get(note_id)
+        if counts is None:
+            return list(candidates)
+        by_keyword = not tags_only and self.keywords is not None
+        found: set[str] = set()
+        for term in counts:
+            if (tags_only or by_keyword) and not term.startswith(TAG_PREFIX):
+                continue
+            found.update(self._postings.get(term, ()))
+        if by_keyword:
+            for token in self._keywords.get(note_id, ()):
+                found.update(self._keyword_postings.get(token, ()))
+        return [c for c in candidates if c["id"] in found]
+
+
+def build_lexical_index(notes: Iterable[dict],
+                        keywords: Optional[Callable[[dict], Iterable[str]]] = None) -> Optional[LexicalIndex]:
+    """LexicalIndex over `notes` (see LexicalIndex for `keywords`), or None if retrieval.lexical is off."""
+    if not LEXICAL_ENABLED:
+        return None
+    t0 = time.perf_counter()
+    index = LexicalIndex(notes, keywords=keywords)
+    log.info("📚 Lexical index: %d notes · %d terms in %.2fs",
+             len(index), index.vocabulary_size, time.perf_counter() - t0)
+    return index
@@ -0,0 +1,176 @@
+# pipeline/retrieval/near_duplicates.py
+"""
+Near-duplicate notes (e.g. several reading notes on the same source) via MinHash-LSH.
+
+Each note becomes a set of hashed word shingles and a MinHash signature
+(NumPy, one pass over all notes). Signatures are cut into bands; notes sharing
+any band bucket are candidate pairs, confirmed by their exact shingle Jaccard.
+Confirmed pairs are joined into clusters (union-find), so the whole stage is
+near-linear in the number of notes instead of comparing every pair.
+
+Per cluster, the first note in input order is the representative: process()
+runs the AI for it and reuses its connections for the other members.
+"""
+from __future__ import annotations
+
+import re
+import time
+import unicodedata
+import zlib
+from typing import Iterable, Optional
+
+import numpy as np
+
+from config.app_config import load_params
+from config.logger_config import get_logger
+
+cfg = load_params()
+log = get_logger(__name__)
+
+NEAR_DUP_ENABLED   = bool(cfg.retrieval.get("near_duplicates", True))
+NEAR_DUP_THRESHOLD = float(cfg.retrieval.get("near_duplicate_threshold", 0.8))
+MINHASH_PERM       = int(cfg.retrieval.get("minhash_permutations", 128))
+MINHASH_BANDS      = int(cfg.retrieval.get("minhash_bands", 32))
+SHINGLE_SIZE       = int(cfg.retrieval.get("shingle_size", 3))
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_PRIME = np.uint64((1 << 61) - 1)
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFD", (text or "").casefold())
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[int]:
+    """32-bit hashes (crc32, stable across runs) of the word `size`-grams of `text`."""
+    words = _WORD_RE.findall(_fold(text))
+    if len(words) < size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: set[int], b: set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """MinHash signatures: min over shingles of (a·x + b) mod p for `permutations` (a, b) pairs."""
+
+    def __init__(self, permutations: int = MINHASH_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # a, b < 2^29 keep a·x + b (x < 2^32) below 2^61 – no uint64 overflow
+        self.a = rng.integers(1, 1 << 29, size=permutations, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 29, size=permutations, dtype=np.uint64)
+
+    @property
+    def permutations(self) -> int:
+        return len(self.a)
+
+    def signature(self, shingle_set: set[int]) -> np.ndarray:
+        if not shingle_set:
+            return np.full(self.permutations, np.iinfo(np.uint64).max, dtype=np.uint64)
+        x = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+        return ((np.outer(x, self.a) + self.b) % _PRIME).min(axis=0)
+
+
+class NearDuplicates:
+    def __init__(self, notes: Iterable[dict], threshold: float = NEAR_DUP_THRESHOLD,
+                 permutations: int = MINHASH_PERM, bands: int = MINHASH_BANDS,
+                 shingle_size: int = SHINGLE_SIZE):
+        """
+        Clusters of `notes` whose shingle Jaccard is >= threshold (through chains).
+        `bands` must divide `permutations`; more bands catch lower similarities.
+        """
+        if permutations % bands:
+            raise ValueError(f"minhash_bands ({bands}) must divide minhash_permutations ({permutations})")
+        self.threshold = float(threshold)
+        self.ids: list[str] = []
+        seen: set[str] = set()
+        sets: list[set[int]] = []
+        for n in notes:
+            if n["id"] in seen:
+                continue
+            seen.add(n["id"])
+            self.ids.append(n["id"])
+            sets.append(shingles(f"{n.get('titulo') or ''} {n.get('contenido') or ''}", shingle_size))
+
+        hasher = MinHasher(permutations)
+        sigs = np.stack([hasher.signature(s) for s in sets]) if sets else np.zeros((0, permutations), np.uint64)
+
+        # LSH: notes sharing a band bucket are candidates
+        rows = permutations // bands
+        candidates: set[tuple[int, int]] = set()
+        for band in range(bands):
+            buckets: dict[bytes, list[int]] = {}
+            chunk = np.ascontiguousarray(sigs[:, band * rows:(band + 1) * rows])
+            for i in range(len(self.ids)):
+                if sets[i]:
+                    buckets.setdefault(chunk[i].tobytes(), []).append(i)
+            for members in buckets.values():
+                for x in range(len(members)):
+                    for y in range(x + 1, len(members)):
+                        candidates.add((members[x], members[y]))
+        self.candidate_pairs = len(candidates)
+
+        # Confirm with exact Jaccard, then union-find (smallest index = representative)
+        parent = list(range(len(self.ids)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        self.pairs: list[tuple[str, str, float]] = []
+        for i, j in sorted(candidates):
+            sim = jaccard(sets[i], sets[j])
+            if sim >= self.threshold:
+                self.pairs.append((self.ids[i], self.ids[j], sim))
+                ri, rj = find(i), find(j)
+                if ri != rj:
+                    parent[max(ri, rj)] = min(ri, rj)
+
+        groups: dict[int, list[str]] = {}
+        for i, nid in enumerate(self.ids):
+            groups.setdefault(find(i), []).append(nid)
+        self.clusters = [members for members in groups.values() if len(members) > 1]
+        self._rep = {nid: members[0] for members in self.clusters for nid in members}
+        self._members = {members[0]: members for members in self.clusters}
+        self.reused = 0   # AI analyses answered from a representative (see process())
+
+    def __len__(self) -> int:
+        return len(self.clusters)
+
+    def representative(self, note_id: str) -> str:
+        """First note (input order) of the note's cluster; the note itself if it has no duplicate."""
+        return self._rep.get(note_id, note_id)
+
+    def cluster(self, note_id: str) -> list[str]:
+        rep = self._rep.get(note_id)
+        return self._members[rep] if rep is not None else [note_id]
+
+    def edges(self) -> list[dict]:
+        """Graph edges (evidence "near_duplicate") for the confirmed pairs."""
+        return [{
+            "source": a,
+            "target": b,
+            "evidence": ["near_duplicate"],
+            "dashes": False,
+            "similarity": min(int(round(sim * 100)), 100),
+            "score": round(sim, 4),
+            "reason": f"near-duplicate notes ({int(round(sim * 100))}% shared text)",
+        } for a, b, sim in self.pairs]
+
+
+def find_near_duplicates(notes: Iterable[dict]) -> Optional[NearDuplicates]:
+    """NearDuplicates over `notes` (in processing order), or None if disabled."""
+    if not NEAR_DUP_ENABLED:
+        return None
+    t0 = time.perf_counter()
+    dups = NearDuplicates(notes)
+    log.info("🪞 Near-duplicates: %d clusters (%d notes) from %d candidate pairs in %.2fs",
+             len(dups), sum(len(c) for c in dups.clusters), dups.candidate_pairs, time.perf_counter() - t0)
+    return dups
@@ -0,0 +1,210 @@
+# pipeline/retrieval/semantic_index.py
+"""
+Embedding-based candidate pre-selection for analyze_ai.
+
+Every note is embedded once (cached by content hash, see embeddings.py); the
+cosine top-k neighbours of all notes are then computed with blocked matrix
+products, so memory stays at block_size × n scores. From ann_min_notes notes
+on, an IVF index (ivf_index.py, kept on disk between runs) replaces the exact
+search. analyze_ai sends the model the candidates closest to the source note
+instead of the first ones in database order.
+"""
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+import requests
+
+from config.app_config import load_params
+from config.logger_config import get_logger
+from pipeline.retrieval.embeddings import EmbeddingClient, EmbeddingStore, content_hash, note_text
+from pipeline.retrieval.ivf_index import IVFIndex
+
+cfg = load_params()
+log = get_logger(__name__)
+
+RETRIEVAL_ENABLED = bool(cfg.retrieval.get("enabled", False))
+EMBED_URL         = cfg.retrieval.get("embedding_url")
+EMBED_MODEL       = cfg.retrieval.get("embedding_model", "nomic-embed-text")
+EMBED_BATCH       = int(cfg.retrieval.get("batch_size", 32))
+EMBED_TIMEOUT     = float(cfg.retrieval.get("timeout", 60))
+EMBED_STORE_PATH  = cfg.paths.get("EMBEDDINGS_PATH")
+TOP_K             = int(cfg.retrieval.get("top_k", 10))
+NEIGHBOURS        = int(cfg.retrieval.get("neighbours", 40))
+BLOCK_SIZE        = int(cfg.retrieval.get("block_size", 512))
+ANN_MIN_NOTES     = int(cfg.retrieval.get("ann_min_notes", 20000))
+ANN_NLIST         = int(cfg.retrieval.get("ann_nlist", 0))
+ANN_NPROBE        = int(cfg.retrieval.get("ann_nprobe", 8))
+ANN_INDEX_PATH    = cfg.paths.get("ANN_INDEX_PATH")
+
+
+class SemanticIndex:
+    def __init__(self, ids: list[str], vectors: np.ndarray, top_k: int = TOP_K,
+                 neighbours: int = NEIGHBOURS, block_size: int = BLOCK_SIZE,
+                 keys: Optional[list[str]] = None, ann_min_notes: int = ANN_MIN_NOTES):
+        """
+        `vectors`: one unit row per id. `keys`: their embedding store keys, which
+        identify vectors in the persisted IVF index (approximate search needs them).
+        """
+        self.ids = list(ids)
+        self.top_k = int(top_k)
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self._row = {nid: i for i, nid in enumerate(self.ids)}
+        k = max(neighbours, top_k)
+        self.approximate = keys is not None and 0 < ann_min_notes <= len(self.ids)
+        if self.approximate:
+            self._nbr, self._nbr_scores = self._neighbours_ann(k, keys)
+        else:
+            self._nbr, self._nbr_scores = self._neighbours(k, block_size)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, note_id: str) -> bool:
+        return note_id in self._row
+
+    def _neighbours(self, k: int, block_size: int) -> tuple[np.ndarray, np.ndarray]:
+        """Row indices and cosine scores of each row's k nearest rows (itself excluded), best first."""
+        n = len(self.ids)
+        k = min(k, n - 1)
+        if k <= 0:
+            return np.zeros((n, 0), dtype=np.int32), np.zeros((n, 0), dtype=np.float32)
+        idx = np.empty((n, k), dtype=np.int32)
+        scores = np.empty((n, k), dtype=np.float32)
+        step = max(1, block_size)
+        for start in range(0, n, step):
+            stop = min(start + step, n)
+            sims = self.vectors[start:stop] @ self.vectors.T
+            sims[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+            part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            part_scores = np.take_along_axis(sims, part, axis=1)
+            order = np.argsort(-part_scores, axis=1, kind="stable")
+            idx[start:stop] = np.take_along_axis(part, order, axis=1)
+            scores[start:stop] = np.take_along_axis(part_scores, order, axis=1)
+        return idx, scores
+
+    def _neighbours_ann(self, k: int, keys: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """Like _neighbours(), through the persisted IVF index (inserting this run's new vectors)."""
+        ann = None
+        if ANN_INDEX_PATH and Path(ANN_INDEX_PATH).exists():
+            try:
+                ann = IVFIndex.load(ANN_INDEX_PATH)
+            except (OSError, KeyError, ValueError) as e:
+                log.warning("⚠️ Could not read ANN index %s (%s); rebuilding", ANN_INDEX_PATH, e)
+        if ann is None or ann.dim != self.vectors.shape[1] or ann.stale():
+            ann = IVFIndex(nlist=ANN_NLIST, nprobe=ANN_NPROBE)
+            t0 = time.perf_counter()
+            ann.train(self.vectors)
+            log.info("🧭 ANN index trained: %d lists over %d vectors in %.1fs",
+                     len(ann.centroids), len(self.vectors), time.perf_counter() - t0)
+        added = ann.add(keys, self.vectors)
+
+        # Only this run's notes are answers; map internal rows back to run rows
+        rows = ann.rows(keys)
+        live = np.zeros(len(ann), dtype=bool)
+        live[rows] = True
+        to_run = np.full(len(ann), -1, dtype=np.int64)
+        to_run[rows] = np.arange(len(keys))
+        found, scores = ann.search(self.vectors, k + 1, live=live)
+        run_rows = np.where(found >= 0, to_run[np.maximum(found, 0)], -1)
+
+        n = len(self.ids)
+        k = min(k, n - 1)
+        idx = np.full((n, max(k, 0)), -1, dtype=np.int32)
+        out_scores = np.full((n, max(k, 0)), -np.inf, dtype=np.float32)
+        for i in range(n):
+            keep = (run_rows[i] >= 0) & (run_rows[i] != i)
+            hits, s = run_rows[i][keep][:k], scores[i][keep][:k]
+            idx[i, :len(hits)] = hits
+            out_scores[i, :len(hits)] = s
+        if added and ANN_INDEX_PATH:
+            try:
+                ann.save(ANN_INDEX_PATH)
+            except OSError as e:
+                log.warning("⚠️ Could not save ANN index %s: %s", ANN_INDEX_PATH, e)
+        return idx, out_scores
+
+    def neighbours(self, note_id: str) -> list[tuple[str, float]]:
+        """Precomputed (id, cosine) neighbours of a note, best first."""
+        row = self._row.get(note_id)
+        if row is None:
+            return []
+        return [(self.ids[j], float(s)) for j, s in zip(self._nbr[row], self._nbr_scores[row]) if j >= 0]
+
+    def rank(self, note_id: str, candidates: list[dict], k: Optional[int] = None) -> list[dict]:
+        """
+        The k candidates closest to `note_id`, best first.
+        Candidates without a vector (or an unknown source note) keep their order after them.
+        """
+        k = self.top_k if k is None else int(k)
+        row = self._row.get(note_id)
+        if row is None or k <= 0:
+            return candidates[:k] if k > 0 else list(candidates)
+
+        by_id = {c["id"]: c for c in candidates}
+        known = [nid for nid in by_id if nid in self._row and nid != note_id]
+        want = min(k, len(known))
+
+        # Usually the precomputed neighbours already hold the best k candidates
+        picked = [self.ids[j] for j in self._nbr[row] if j >= 0 and self.ids[j] in by_id][:want]
+        if len(picked) < want:
+            # Candidate set excludes too many neighbours: score the candidates directly
+            rows = [self._row[nid] for nid in known]
+            sims = self.vectors[rows] @ self.vectors[row]
+            order = np.argsort(-sims, kind="stable")[:want]
+            picked = [known[i] for i in order]
+
+        out = [by_id[nid] for nid in picked]
+        if len(out) < k:
+            seen = set(picked)
+            out.extend(c for c in candidates if c["id"] not in seen and c["id"] != note_id)
+        return out[:k]
+
+
+def build_semantic_index(notes: Iterable[dict], client: EmbeddingClient | None = None,
+                         store: EmbeddingStore | None = None) -> Optional[SemanticIndex]:
+    """
+    Embeds the notes missing from the store and returns their SemanticIndex.
+    None if retrieval is disabled or the embedding endpoint fails (callers keep database order).
+    """
+    if not RETRIEVAL_ENABLED or not EMBED_URL:
+        return None
+    notes = list(notes)
+    if not notes:
+        return None
+    if client is None:
+        from pipeline.ai_client import AI_API_KEY
+        client = EmbeddingClient(EMBED_URL, EMBED_MODEL, AI_API_KEY, batch_size=EMBED_BATCH, timeout=EMBED_TIMEOUT)
+    store = store if store is not None else EmbeddingStore(EMBED_STORE_PATH)
+
+    by_id = {n["id"]: n for n in notes}
+    ids = list(by_id)
+    texts = [note_text(by_id[nid]) for nid in ids]
+    keys = [content_hash(client.model, t) for t in texts]
+    missing = {k: t for k, t in zip(keys, texts) if k not in store}
+
+    t0 = time.perf_counter()
+    if missing:
+        try:
+            vectors = client.embed(missing.values())
+        except (requests.RequestException, RuntimeError, KeyError, ValueError, TypeError) as e:
+            log.warning("⚠️ Embeddings unavailable (%s); AI candidates keep database order", e)
+            return None
+        store.put_many(list(missing), vectors)
+    t_embed = time.perf_counter() - t0
+    # Only this run's notes are kept: the vectors of older texts would pile up in the file
+    stale = store.retain(keys)
+    try:
+        store.save()
+    except OSError as e:
+        log.warning("⚠️ Could not save embedding store %s: %s", store.path, e)
+
+    t0 = time.perf_counter()
+    index = SemanticIndex(ids, store.get_many(keys), keys=keys)
+    log.info("🧭 Embeddings: %d notes (%d cached, %d embedded in %.1fs, %d stale dropped) · top-%d neighbours in %.2fs%s",
+             len(ids), len(ids) - len(missing), len(missing), t_embed, stale, index.top_k, time.perf_counter() - t0,
+             " (IVF)" if index.approximate else "")
+    return index
@@ -0,0 +1,355 @@
+# pipeline/stub_ai_server.py
+"""
+Local OpenAI-compatible stand-in for the AI model (no LLM needed).
+
+Serves:
+- GET  /v1/models
+- POST /v1/chat/completions   (non-streaming, or SSE chunks with "stream": true)
+- POST /v1/embeddings         (hashed bag-of-words vectors: shared words → higher cosine)
+
+Answers are deterministic for a given prompt and seed. They are built from the
+candidate UUIDs in the prompt ("[<uuid>]"), so the pipeline's parsing and
+filtering run exactly as against a real model. Latency, tokens/sec, the share of
+deliberately malformed answers and of 5xx errors are configurable. Requests
+carrying a JSON schema (response_format / format) get a well-formed
+{"connections": [...]} object, as from a grammar-constrained server.
+
+Usage:
+    python -m pipeline.stub_ai_server --port 11435 --latency 0.2 --tps 40 --malformed-rate 0.1
+    # then point ai.model_url (or an ai.endpoints entry) to
+    # http://127.0.0.1:11435/v1/chat/completions
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config.logger_config import setup_logging, get_logger
+
+log = get_logger(__name__)
+
+_UUID_RE = re.compile(r"\[([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})\]")
+_TITLE_RE = re.compile(r"^\s*\d+\. \[[^\]]+\] (.*)$", re.MULTILINE)
+_MIN_SIM_RE = re.compile(r"similarity >= (\d+)")
+
+# Reasons pass robust_ai_parser.reason_ok (Catalan, 5–20 words, several content words)
+_REASONS = [
+    "Les dues notes analitzen la relació entre {a} i {b} des d'una perspectiva crítica",
+    "Comparteixen el concepte de {a} i el connecten amb debats sobre {b}",
+    "Ambdues notes desenvolupen idees sobre {a} aplicades a problemes de {b}",
+    "La nota candidata amplia l'argument sobre {a} amb exemples concrets de {b}",
+]
+_TOPICS = ["coneixement", "memòria", "llenguatge", "ètica", "tecnologia", "aprenentatge",
+           "societat", "identitat", "xarxes", "creativitat", "atenció", "sistemes"]
+
+_MALFORMED = ("fenced", "prose", "truncated", "titles", "mangled_titles", "single_quotes")
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+EMBED_DIM = 64
+
+
+class StubConfig:
+    def __init__(self, model: str = "stub-model", latency: float = 0.0, jitter: float = 0.0,
+                 tokens_per_second: float = 0.0, malformed_rate: float = 0.0, error_rate: float = 0.0,
+                 match_rate: float = 0.3, seed: int = 0):
+        self.model = model
+        self.latency = float(latency)                       # fixed seconds per request (time to first token)
+        self.jitter = float(jitter)                         # ± seconds, deterministic per prompt
+        self.tokens_per_second = float(tokens_per_second)   # 0 → instant generation
+        self.malformed_rate = float(malformed_rate)         # share of answers with broken JSON
+        self.error_rate = float(error_rate)                 # share of requests answered with 5xx
+        self.match_rate = float(match_rate)                 # share of candidates returned as connections
+        self.seed = int(seed)
+
+
+class StubStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.streamed = 0
+        self.errors_5xx = 0
+        self.malformed = 0
+        self.completion_tokens = 0
+        self.embedded = 0
+
+    def add(self, **counts) -> None:
+        with self._lock:
+            for k, v in counts.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {k: getattr(self, k) for k in
+                    ("requests", "streamed", "errors_5xx", "malformed", "completion_tokens", "embedded")}
+
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
+def embed_text(text: str, dim: int = EMBED_DIM) -> list[float]:
+    """Deterministic vector: each word adds ±1 to a few hashed dimensions."""
+    vec = [0.0] * dim
+    for word in _WORD_RE.findall((text or "").lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        for i in range(0, 6, 2):
+            vec[digest[i] % dim] += 1.0 if digest[i + 1] & 1 else -1.0
+    return vec
+
+
+def _rng(cfg: StubConfig, prompt: str, salt: str = "") -> random.Random:
+    digest = hashlib.sha256(f"{cfg.seed}:{salt}:{prompt}".encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def build_answer(cfg: StubConfig, prompt: str, structured: bool = False) -> tuple[str, str | None]:
+    """
+    Returns (answer_text, malformed_kind). Same prompt + seed → same answer.
+    `structured`: schema-constrained answer, never malformed.
+    """
+    rng = _rng(cfg, prompt)
+    ids = list(dict.fromkeys(m.lower() for m in _UUID_RE.findall(prompt)))
+    titles = _TITLE_RE.findall(prompt)
+    m = _MIN_SIM_RE.search(prompt)
+    min_sim = int(m.group(1)) if m else 50
+
+    connections = []
+    for uid in ids:
+        if rng.random() >= cfg.match_rate:
+            continue
+        a, b = rng.sample(_TOPICS, 2)
+        connections.append({
+            "id": uid,
+            "similarity": rng.randint(min_sim, 95),
+            "reason": rng.choice(_REASONS).format(a=a, b=b),
+        })
+
+    if structured:
+        return json.dumps({"connections": connections}, ensure_ascii=False), None
+    if rng.random() >= cfg.malformed_rate:
+        return json.dumps(connections, ensure_ascii=False), None
+
+    kind = rng.choice(_MALFORMED)
+    body = json.dumps(connections, ensure_ascii=False, indent=2)
+    if kind == "fenced":
+        text = f"```json\n{body}\n```"
+    elif kind == "prose":
+        text = f"Here are the connections I found:\n{body}\nLet me know if you need more."
+    elif kind == "truncated":
+        text = body[: max(1, int(len(body) * 0.6))]
+    elif kind == "titles":
+        # ids replaced by candidate titles (the parser must resolve them)
+        by_id = dict(zip(ids, titles))
+        text = json.dumps([{**c, "id": by_id.get(c["id"], c["id"])} for c in connections], ensure_ascii=False)
+    elif kind == "mangled_titles":
+        # titles with a dropped character and cut short, as small models do
+        def _mangle(t: str) -> str:
+            if len(t) > 6:
+                i = rng.randrange(1, len(t) - 1)
+                t = t[:i] + t[i + 1:]
+            return t[: max(6, int(len(t) * 0.8))]
+        by_id = {uid: _mangle(t) for uid, t in zip(ids, titles)}
+        text = json.dumps([{**c, "id": by_id.get(c["id"], c["id"])} for c in connections], ensure_ascii=False)
+    else:
+        text = body.replace('"', "'")
+    return text, kind
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "StubAI/1.0"
+
+    def log_message(self, fmt, *args):
+        log.debug("stub: " + fmt, *args)
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        cfg: StubConfig = self.server.stub_config
+        if self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": cfg.model, "object": "model", "owned_by": "stub"}]})
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def do_POST(self):
+        cfg: StubConfig = self.server.stub_config
+        stats: StubStats = self.server.stub_stats
+        path = self.path.rstrip("/")
+        if path not in ("/v1/chat/completions", "/v1/embeddings"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError):
+            self._send_json(400, {"error": {"message": "invalid JSON body"}})
+            return
+        if path == "/v1/embeddings":
+            self._embeddings(body)
+            return
+
+        messages = body.get("messages") or []
+        prompt = "\n".join(str(m.get("content", "")) for m in messages if isinstance(m, dict))
+        stream = bool(body.get("stream"))
+        stats.add(requests=1, streamed=int(stream))
+
+        rng = _rng(cfg, prompt, salt="timing")
+        delay = max(0.0, cfg.latency + rng.uniform(-cfg.jitter, cfg.jitter))
+        # Seeded per-server sequence (not per prompt), so a retried prompt can succeed
+        if self.server.next_fault() < cfg.error_rate:
+            time.sleep(delay)
+            stats.add(errors_5xx=1)
+            self._send_json(503, {"error": {"message": "stub: injected server error"}})
+            return
+
+        structured = bool(body.get("format")) or (body.get("response_format") or {}).get("type") == "json_schema"
+        text, malformed = build_answer(cfg, prompt, structured)
+        max_tokens = body.get("max_tokens")
+        if isinstance(max_tokens, int) and max_tokens > 0 and _count_tokens(text) > max_tokens:
+            text = text[: max_tokens * 4]
+        completion_tokens = _count_tokens(text)
+        stats.add(malformed=int(malformed is not None), completion_tokens=completion_tokens)
+        usage = {
+            "prompt_tokens": _count_tokens(prompt),
+            "completion_tokens": completion_tokens,
+            "total_tokens": _count_tokens(prompt) + completion_tokens,
+        }
+        time.sleep(delay)
+
+        if stream:
+            self._stream(text, body.get("model") or cfg.model, usage)
+            return
+
+        if cfg.tokens_per_second > 0:
+            time.sleep(completion_tokens / cfg.tokens_per_second)
+        self._send_json(200, {
+            "id": f"chatcmpl-stub-{stats.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model") or cfg.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _embeddings(self, body: dict) -> None:
+        cfg: StubConfig = self.server.stub_config
+        texts = body.get("input")
+        if isinstance(texts, str):
+            texts = [texts]
+        if not isinstance(texts, list):
+            self._send_json(400, {"error": {"message": "input must be a string or a list of strings"}})
+            return
+        self.server.stub_stats.add(embedded=len(texts))
+        tokens = sum(_count_tokens(str(t)) for t in texts)
+        self._send_json(200, {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": embed_text(str(t))} for i, t in enumerate(texts)],
+            "model": body.get("model") or cfg.model,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _stream(self, text: str, model: str, usage: dict) -> None:
+        cfg: StubConfig = self.server.stub_config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def _event(payload) -> None:
+            data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+            self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        chunk_chars = 16  # ~4 tokens per chunk
+        pause = (chunk_chars / 4) / cfg.tokens_per_second if cfg.tokens_per_second > 0 else 0.0
+        base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        try:
+            _event({**base, "choices": [{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}]})
+            for i in range(0, len(text), chunk_chars):
+                if pause:
+                    time.sleep(pause)
+                _event({**base, "choices": [{"index": 0, "delta": {"content": text[i:i + chunk_chars]}, "finish_reason": None}]})
+            _event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage})
+            _event("[DONE]")
+        except (BrokenPipeError, ConnectionResetError):
+            log.debug("stub: client closed the stream")
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: StubConfig | None = None):
+        super().__init__(address, _Handler)
+        self.stub_config = config or StubConfig()
+        self.stub_stats = StubStats()
+        self._fault_rng = random.Random(self.stub_config.seed)
+        self._fault_lock = threading.Lock()
+
+    def next_fault(self) -> float:
+        with self._fault_lock:
+            return self._fault_rng.random()
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0,
+                      config: StubConfig | None = None) -> StubServer:
+    """
+    Starts the stub in a daemon thread. port=0 picks a free port.
+    The chat URL is http://{host}:{server.server_port}/v1/chat/completions
+    """
+    server = StubServer((host, port), config)
+    threading.Thread(target=server.serve_forever, name="stub-ai-server", daemon=True).start()
+    return server
+
+
+def chat_url(server: StubServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1/chat/completions"
+
+
+def embeddings_url(server: StubServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1/embeddings"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local OpenAI-compatible stub for AI-path benchmarks")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11435)
+    ap.add_argument("--model", default="stub-model")
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds before the first token")
+    ap.add_argument("--jitter", type=float, default=0.0, help="± seconds added to the latency")
+    ap.add_argument("--tps", type=float, default=0.0, help="generation speed in tokens/s (0 = instant)")
+    ap.add_argument("--malformed-rate", type=float, default=0.0, help="share of answers with broken JSON")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    ap.add_argument("--match-rate", type=float, default=0.3, help="share of candidates returned as connections")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    setup_logging("INFO")
+    config = StubConfig(model=args.model, latency=args.latency, jitter=args.jitter,
+                        tokens_per_second=args.tps, malformed_rate=args.malformed_rate,
+                        error_rate=args.error_rate, match_rate=args.match_rate, seed=args.seed)
+    server = StubServer((args.host, args.port), config)
+    log.info("🧪 Stub AI server on %s (model=%s)", chat_url(server), config.model)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.info("🧪 Stub stats: %s", server.stub_stats.summary())
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,27 +10,40 @@ Hybrid system:
 from __future__ import annotations
 from collections import Counter
 from config.schema_keys import NODE_KIND_KEYS
-from pipeline.parses.robust_ai_parser import analyze_ai
-from pipeline.ai_client import check_model_availability
+from pipeline.parses.robust_ai_parser import analyze_ai, log_parser_stats
+from pipeline.parses.resolver_index import ResolverIndex
+from pipeline.retrieval.lexical_index import build_lexical_index
+from pipeline.retrieval.near_duplicates import find_near_duplicates
+from pipeline.retrieval.semantic_index import build_semantic_index
+from pipeline.ai_client import check_model_availability, ai_available, log_ai_stats
+from pipeline.ai_session import AISession
 import requests
-import unicodedata
-import json
+import hashlib
 import html
+import inspect
 import re
-import os
 import smtplib
 import ssl
+import sys
 import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from pipeline.brain.validate_suggestions import validate_graph
+from pipeline.brain.edge_pruner import log_stats as log_pruning
+from pipeline.brain.edge_store import EdgeStore, project_features, tag_features
+from pipeline.brain.graph_diff import (
+    GraphVersions, PreviousRun, diff_graphs, run_minute, stable_edit_time, write_change_set,
+)
 from config.logger_config import setup_logging, get_logger
 from config.app_config import load_params
 from config.text_normalization import normalize_text
 from pathlib import Path
 from pprint import pprint
 from itertools import combinations
+from pipeline.filter_graph import normalize_notion_tags
 from pipeline.json_to_sigma import convert_for_sigma
+import pipeline.json_to_sigma as json_to_sigma
+from pipeline.utils.async_writer import AsyncWriter
+from pipeline.utils.graph_writer import write_graph
 from pipeline.notion_api import (
     get_notes_by_type, 
     notion_url, 
@@ -109,13 +122,34 @@ AI_MODEL_BACKOFF    = cfg.ai.get("backoff")
 DELAY_ENTRE_NOTAS   = cfg.get("delay_entre_notas")
 DELAY_ENTRE_IA      = cfg.get("delay_entre_ia")
 
+def _pipeline_sources(module) -> list[Path]:
+    """Source files of `module` and of every pipeline.* module it imports from, transitively."""
+    seen, todo = set(), [module.__name__]
+    while todo:
+        name = todo.pop()
+        mod = sys.modules.get(name)
+        if name in seen or not name.startswith("pipeline.") or not getattr(mod, "__file__", None):
+            continue
+        seen.add(name)
+        for value in vars(mod).values():
+            dep = value.__name__ if inspect.ismodule(value) else getattr(value, "__module__", None)
+            if isinstance(dep, str):
+                todo.append(dep)
+    return sorted(Path(sys.modules[name].__file__) for name in seen)
+
 # -----------------------------
 # 📁 Paths (derived from get_paths())
 # -----------------------------
 OUT_JSON            = cfg.paths["OUT_JSON"]
 OUT_GRAPH           = cfg.paths["OUT_GRAPH"]
+OUT_CHANGES         = cfg.paths["OUT_CHANGES"]
+OUT_VERSION         = cfg.paths["OUT_VERSION"]
+# What graph_sigma.json is rendered with, besides the graph: settings and exporter code
+# (json_to_sigma and every pipeline module it imports from)
+SIGMA_INPUTS        = (cfg.paths["CONFIG_DIR"] / "params.yaml", *_pipeline_sources(json_to_sigma))
 LOG_DIR             = cfg.paths["LOG_DIR"]
 STOPWORDS_PATH      = cfg.paths["STOPWORDS_PATH"]
+SUGGESTIONS_COMPACT = bool(cfg.output.get("compact_suggestions", False))
 
 # -----------------------------
 # 🔧 Optional configuration for robust_ai_parser
@@ -246,7 +280,7 @@ def _find_relation_prop_by_aliases(props: dict, aliases: list[str]) -> str | Non
                 return k
     return None
 
-def _get_relations_links_to(page_id: str) -> list[str]:
+def _get_relations_links_to(page_id: str, raise_errors: bool = False) -> list[str]:
     """Reads the 'Links to' relational property (with aliases)."""
     try:
         page = retrieve_page(page_id=page_id)
@@ -258,10 +292,25 @@ def _get_relations_links_to(page_id: str) -> list[str]:
         if rel and rel.get("type") == "relation":
             return [r["id"] for r in rel.get("relation", []) if "id" in r]
     except Exception:
-        pass
+        if raise_errors:
+            raise
     return []
 
 
+def _write_back_mentions(note: dict, previous: PreviousRun, written: set) -> None:
+    """Adds the note's mentions to its "Links to" relation, unless last run's relations already had them all."""
+    mentions = note.get("mentions", [])
+    if not mentions:
+        return
+    known = previous.unchanged_links(_norm_uuid(note["id"]), note.get("edited"))
+    if known is not None and {_norm_uuid(m) for m in mentions} <= set(known):
+        log.info(f"   → {len(mentions)} mentions already linked (note unchanged since last run)")
+        return
+    log.info(f"   → Found {len(mentions)} mentions. Updating relations...")
+    update_page_relations(note["id"], mentions, LINKS_PROP_KEYS)
+    written.add(_norm_uuid(note["id"]))
+
+
 # -----------------------------------------------------------------------------
 # TAG-BASED EDGES (direct match by tag coincidence)
 # -----------------------------------------------------------------------------
@@ -350,9 +399,24 @@ def tag_similarity(n1: dict, n2: dict, cfg) -> tuple[int, list[str]]:
 
     return min(score, 99), razones
 
-def analyze_tags(note: dict, candidates: list[dict], threshold=None) -> list[dict]:
+def _content_keywords(note: dict) -> list[str]:
+    """The keyword tokens tag_similarity() compares (LexicalIndex `keywords` tokenizer)."""
+    return _extract_keywords(note.get("contenido", ""), int(getattr(cfg, "tags_keywords_min_len", 5)))
+
+def analyze_tags(note: dict, candidates: list[dict], threshold=None, lexical=None) -> list[dict]:
+    """
+    Tag/keyword matches of `note` among `candidates` (score >= threshold), best first.
+    With a LexicalIndex only candidates sharing a tag or a content keyword are scored
+    (the index must be built with keywords=_content_keywords, the tokens scored here);
+    when keywords alone cannot reach the threshold, only those sharing a tag.
+    """
     if threshold is None:
         threshold = TAGS_MIN_SCORE_KEEP
+    if lexical is not None:
+        kw_cap = int(getattr(cfg, "tags_keywords_max_points", 50))
+        tags_only = kw_cap < threshold
+        if tags_only or lexical.keywords is _content_keywords:
+            candidates = lexical.matches(note["id"], candidates, tags_only=tags_only)
     out = []
     for cand in candidates:
         sc, reasons = tag_similarity(note, cand, cfg)
@@ -360,6 +424,23 @@ def analyze_tags(note: dict, candidates: list[dict], threshold=None) -> list[dic
             out.append({"id": cand["id"], "titulo": cand["titulo"], "score": sc, "razones": reasons, "metodo": "tags"})
     return sorted(out, key=lambda x: x["score"], reverse=True)
 
+def _analyze_ai_once(note: dict, candidates: list[dict], ids_found: set[str], near_dups,
+                     reuse: dict[str, list[dict]], **kwargs) -> list[dict]:
+    """
+    analyze_ai, run once per near-duplicate cluster: members reuse their
+    representative's connections (minus themselves and what tags already found).
+    """
+    rep = near_dups.representative(note["id"]) if near_dups else note["id"]
+    if rep != note["id"] and rep in reuse:
+        near_dups.reused += 1
+        reused = [c for c in reuse[rep] if c["id"] != note["id"] and c["id"] not in ids_found]
+        log.info("  ♻️ Near-duplicate of %s: reusing %d AI connections", rep[:8], len(reused))
+        return reused
+    out = analyze_ai(note, candidates, ids_found, **kwargs) or []
+    if near_dups and rep == note["id"]:
+        reuse[rep] = out
+    return out
+
 # -----------------------------------------------------------------------------
 # AI Analysis (AI_MODEL)
 # -----------------------------------------------------------------------------
@@ -406,25 +487,68 @@ def _render_html(resultats: dict[str, list[dict]], id2meta: dict[str, dict]) ->
         parts.append("</ul>")
     return "\n".join(parts)
 
+def _is_connection(e: dict) -> bool:
+    # note ↔ note (edges to tag nodes are structure, not suggestions)
+    return not (str(e.get("source", "")).startswith("tag::") or str(e.get("target", "")).startswith("tag::"))
+
+def _changed_connections(changes) -> tuple[list[dict], list[dict]]:
+    """New connection edges and connections whose evidence/similarity/direction changed."""
+    return ([e for e in changes.edges["added"] if _is_connection(e)],
+            [c for c in changes.edges["changed"] if _is_connection(c)])
+
+def _render_changes_html(new_conns: list[dict], changed_conns: list[dict], graph: dict, changes) -> str:
+    nodes = {n["id"]: n for n in graph.get("nodes", [])}
+
+    def link(nid: str) -> str:
+        n = nodes.get(nid, {})
+        ttl = normalize_text(_escape(n.get("title") or nid[:12]))
+        return f"<a href='{_escape(n.get('url'))}' target='_blank'>{ttl}</a>" if n.get("url") else ttl
+
+    summary = changes.summary()
+    parts = [
+        "<h2>Connection Suggestions</h2>",
+        f"<p>Since the previous run: {len(new_conns)} new and {len(changed_conns)} updated connections, "
+        f"{summary['edges_removed']} removed · {summary['nodes_added']} new notes.</p>",
+    ]
+    by_source: dict[str, list[dict]] = {}
+    for e in new_conns:
+        by_source.setdefault(e["source"], []).append(e)
+    for src, lst in by_source.items():
+        parts.append(f"<h3>📖 {link(src)}</h3><ul>")
+        for e in sorted(lst, key=lambda x: -(x.get("similarity") or 0))[:8]:
+            line = f"<li>→ {link(e['target'])} · {int(e.get('similarity') or 0)}%"
+            reason = normalize_text(_escape((e.get("reasons") or [""])[0]))
+            if reason:
+                line += f"<br><small>{reason}</small>"
+            parts.append(line + "</li>")
+        parts.append("</ul>")
+    if changed_conns:
+        parts.append("<h3>↻ Updated</h3><ul>")
+        for c in changed_conns[:30]:
+            what = ", ".join(f"{k}: {_escape(str(old))} → {_escape(str(new))}" for k, (old, new) in c["changes"].items())
+            parts.append(f"<li>{link(c['source'])} ↔ {link(c['target'])}<br><small>{what}</small></li>")
+        parts.append("</ul>")
+    return "\n".join(parts)
+
+def _sigma_fingerprint() -> str:
+    """Hash of the settings and exporter code graph_sigma.json is rendered with."""
+    h = hashlib.sha1()
+    for path in SIGMA_INPUTS:
+        try:
+            h.update(path.read_bytes())
+        except OSError:
+            h.update(b"-")
+    return h.hexdigest()
+
 def save_graph(graph: dict, path: Path = OUT_JSON) -> None:
     """
-    Writes JSON atomically using a temporary file.
+    Writes JSON atomically using a temporary file, streaming nodes and edges.
     `graph` must be a dict with keys "nodes" and "edges".
     """
     try:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        tmp = path.with_suffix(path.suffix + ".tmp")
-
-        with tmp.open("w", encoding="utf-8") as f:
-            json.dump(graph, f, ensure_ascii=False, indent=2)
-            f.flush();
-            os.fsync(f.fileno())
-
-        os.replace(tmp, path)
-
-        n_nodes = len(graph.get("nodes", []))
-        n_edges = len(graph.get("edges", []))
-        log.info("[OK] Final graph saved to: %s  (%d nodes · %d edges)", str(path), n_nodes, n_edges)
+        written = write_graph(graph, path, compact=SUGGESTIONS_COMPACT)
+        log.info("[OK] Final graph saved to: %s  (%d nodes · %d edges)", str(path),
+                 written.counts.get("nodes", 0), written.counts.get("edges", 0))
 
     except Exception as e:
         log.exception("Could not save graph to %s: %s", path, e)
@@ -571,6 +695,12 @@ def process():
     log.info("🔧 Aliases: TAGS =%s", TAGS_PROP_KEYS)
     # ─────────────────────────────────────────────────────────────
 
+    # Previous run's graph: what changed drives the Notion write-back, the export and the email
+    previous = PreviousRun.load(OUT_JSON)
+    versions = GraphVersions.load(OUT_VERSION)
+    fetched_minute = run_minute()
+    written_back: set[str] = set()
+
     log.info("🔄 Loading notes...")
     permanents = get_notes("Nota permanent")
     lectures   = get_notes("Nota de lectura")
@@ -585,6 +715,23 @@ def process():
     # Index for quick metadata
     id2meta: dict[str, dict] = {n["id"]: n for n in (permanents + lectures + indexos)}
 
+    # Preload the model and keep it resident for the whole analysis (released below)
+    ai_session = AISession().start() if AI_MODEL_ok else None
+
+    # Id/title/slug index over all notes, shared by every analyze_ai call
+    resolver = ResolverIndex(permanents + lectures + indexos) if AI_MODEL_ok else None
+
+    # Lexical (BM25) index: candidate generator for tags, and AI ranking without embeddings
+    lexical = build_lexical_index(permanents + lectures, keywords=_content_keywords)
+
+    # Embedding neighbours of every note: the AI only sees the closest candidates
+    semantic = build_semantic_index(permanents + lectures) if AI_MODEL_ok else None
+    ranker = semantic or lexical
+
+    # Near-duplicate clusters (processing order: reading notes, then permanent notes)
+    near_dups = find_near_duplicates(lectures + permanents)
+    ai_reuse: dict[str, list[dict]] = {}
+
     # Result expected by the viewer:
     # { "SOURCE_ID": [ {"target_id": "...", "score": 0.82, "reason": "…"}, ... ] }
     resultats: dict[str, list[dict]] = {}
@@ -597,21 +744,19 @@ def process():
         log.info(f"[{i}/{len(lect_recents)}] 📖 {lect['titulo'][:50]}...")
         
         # 0) Update "Enllaça a" from mentions (if any)
-        mentions = lect.get("mentions", [])
-        if mentions:
-            log.info(f"   → Found {len(mentions)} mentions. Updating relations...")
-            update_page_relations(lect["id"], mentions, LINKS_PROP_KEYS)
+        _write_back_mentions(lect, previous, written_back)
 
         time.sleep(DELAY_ENTRE_NOTAS)
 
         # vs permanent notes
-        conn_perm_tags = analyze_tags(lect, permanents)[:5]
+        conn_perm_tags = analyze_tags(lect, permanents, lexical=lexical)[:5]
         ids_tags = {c["id"] for c in conn_perm_tags}
-        conn_perm_ia = (analyze_ai(lect, permanents, ids_tags) or [])[:3] if AI_MODEL_ok else []
+        conn_perm_ia = _analyze_ai_once(lect, permanents, ids_tags, near_dups, ai_reuse,
+                                        index=resolver, ranker=ranker)[:3] if AI_MODEL_ok and ai_available() else []
 
         # vs other reading notes
         altres_lect = [l for l in lectures if l["id"] != lect["id"]]
-        conn_lect_tags = analyze_tags(lect, altres_lect)[:5]
+        conn_lect_tags = analyze_tags(lect, altres_lect, lexical=lexical)[:5]
 
         # Consolidated -> viewer format
         items: list[dict] = []
@@ -648,17 +793,15 @@ def process():
         log.info(f"[{i}/{len(perm_recents)}] 💎 {perm['titulo'][:50]}...")
         
         # 0) Update "Enllaça a" from mentions (if any)
-        mentions = perm.get("mentions", [])
-        if mentions:
-            log.info(f"   → Found {len(mentions)} mentions. Updating relations...")
-            update_page_relations(perm["id"], mentions, LINKS_PROP_KEYS)
+        _write_back_mentions(perm, previous, written_back)
             
         time.sleep(DELAY_ENTRE_NOTAS)
 
         altres_perm = [p for p in permanents if p["id"] != perm["id"]]
-        conn_tags = analyze_tags(perm, altres_perm)[:5]
+        conn_tags = analyze_tags(perm, altres_perm, lexical=lexical)[:5]
         ids_tags = {c["id"] for c in conn_tags}
-        conn_ia  = analyze_ai(perm, altres_perm, ids_tags)[:3] if AI_MODEL_ok else []
+        conn_ia  = _analyze_ai_once(perm, altres_perm, ids_tags, near_dups, ai_reuse,
+                                    index=resolver, ranker=ranker)[:3] if AI_MODEL_ok and ai_available() else []
 
         items: list[dict] = []
         for c in (conn_tags + conn_ia):
@@ -686,6 +829,12 @@ def process():
     log.info("=" * 70)
     log.info("✅ ANALYSIS COMPLETED")
     log.info("=" * 70 + "\n")
+    if ai_session:
+        ai_session.stop()
+    log_ai_stats()
+    log_parser_stats()
+    if near_dups and near_dups.reused:
+        log.info("♻️ AI analyses reused across near-duplicates: %d", near_dups.reused)
 
     # Save JSON for the viewer
     # ──────────────────────────────────────────────────────────────────────────────
@@ -721,12 +870,10 @@ def process():
             else:
                 kind = ""
 
-        # Collect tags from this note
-        note_tags = n.get("tags", [])[:8]
+        # Collect tags from this note (normalized once: the Sigma export reuses them)
+        note_tags = normalize_notion_tags(n.get("tags", [])[:8])
         for tag in note_tags:
-            tag_name = tag.get("name") if isinstance(tag, dict) else str(tag)
-            if tag_name:
-                all_tags.add(tag_name.strip())
+            all_tags.add(tag["name"])
 
         nodes.append({
             "id": pid,
@@ -736,6 +883,7 @@ def process():
             "tags": note_tags,
             "projects": n.get("projects", []),
             "project_ids": n.get("project_ids", []),
+            "edited": stable_edit_time(n.get("edited"), fetched_minute),
         })
 
     # 1a) Create nodes for tags
@@ -782,13 +930,22 @@ def process():
     log.info(f"🔗 Created {len(tag_edges)} edges connecting notes to tags")
 
     # 2) Explicit edges ("Links to"): evidence=["explicit"], dashes=False
+    #    Notes not edited since the previous run (nor written back now) reuse its relations
     edges = []
+    links_of: dict[str, list[str]] = {}
+    reused_links = 0
     for n in (permanents + lectures + indexos):
         src = _norm_uuid(n["id"])
-        try:
-            targets = _get_relations_links_to(src)
-        except Exception:
-            targets = []
+        targets = None if src in written_back else previous.unchanged_links(src, n.get("edited"))
+        if targets is not None:
+            links_of[src] = targets
+            reused_links += 1
+        else:
+            try:
+                targets = _get_relations_links_to(src, raise_errors=True)
+                links_of[src] = sorted({_norm_uuid(t) for t in targets})
+            except Exception:
+                targets = []
         for t in targets:
             dst = _norm_uuid(t)
             if src == dst:
@@ -804,6 +961,13 @@ def process():
             })
 
 
+    if previous:
+        log.info("🔗 Relations reused from the previous run for %d of %d notes",
+                 reused_links, len(permanents + lectures + indexos))
+    for node in nodes:
+        if node["id"] in links_of:
+            node["links"] = links_of[node["id"]]
+
     # 3) AI/tag edges (from your 'results'): dashes=True
     for src_id, lst in (resultats or {}).items():
         src = _norm_uuid(src_id)
@@ -832,59 +996,88 @@ def process():
     # 3c) Add edges between notes and tags
     edges.extend(tag_edges)
 
-    # 4) Write enriched format to the same OUT_JSON
-    graph = {"nodes": nodes, "edges": edges}
-
-    # Unify and enrich
-    graph = postprocess_graph(graph)
+    # 3d) Near-duplicate clusters: evidence=["near_duplicate"]
+    if near_dups:
+        for e in near_dups.edges():
+            edges.append({**e, "source": _norm_uuid(e["source"]), "target": _norm_uuid(e["target"])})
 
-    # 📊 DEBUG: final edges table
-    try:
-        debug_edges_table(graph)
-    except Exception as _e:
-        log.warning("debug_edges_table failed: %s", _e)
-
-    # ➌ Add metadata (point 3)
-    graph["_meta"] = {
-        "nodes": len(graph.get("nodes", [])),
-        "edges": len(graph.get("edges", [])),
-        "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-       "min_similarity_kept": int(getattr(cfg, "min_similarity_kept", 60)),
-        "topk_per_node": int(getattr(cfg, "topk_per_node", 3)),
-    }
-
-    # 4b) Integrated validation + atomic save of final JSON
+    # 4) Consolidate (validation, one edge per pair, similarity cut); the JSON
+    #    artifacts are written by a background thread while the export runs
+    graph = {"nodes": nodes, "edges": edges}
+    writer = AsyncWriter("graph-writer")
+    sigma_fingerprint = None
     try:
-        res = validate_graph(graph, min_sim=int(getattr(cfg, "min_similarity_kept", 60)))
-        # Can return a dict or (validated_graph, report)
-        if isinstance(res, tuple):
-            graph, validation_report = res
-        else:
-            graph = res
-            validation_report = None
+        try:
+            core, validation_report = consolidate_core(graph, min_sim=int(getattr(cfg, "min_similarity_kept", 60)),
+                                                       topk=getattr(cfg, "topk_per_node", None))
+            graph = core.to_graph()   # JSON boundary: dict edges are built only here
 
-        save_graph(graph, OUT_JSON)
+            # 📊 DEBUG: final edges table
+            try:
+                debug_edges_table(graph)
+            except Exception as _e:
+                log.warning("debug_edges_table failed: %s", _e)
 
-        if validation_report:
+            writer.submit("suggestions", save_graph, graph, OUT_JSON)
             # leave as INFO/DEBUG as preferred
             log.info("Validation report: %s", validation_report)
 
-    except Exception as e:
-        log.warning("validate_graph failed (%s); writing unvalidated graph", e)
-        # Save unvalidated graph anyway
-        save_graph(graph, OUT_JSON)
+        except Exception as e:
+            log.warning("consolidate_core failed (%s); writing unvalidated graph", e)
+            # Save unvalidated graph anyway
+            writer.submit("suggestions", save_graph, graph, OUT_JSON)
 
-    # 5) Step json to sigma
-    convert_for_sigma()
+        # 4b) Change set against the previous run (changes.json keeps the last non-empty one)
+        try:
+            changes = diff_graphs(previous.graph, graph)
+        except Exception as e:
+            log.warning("Graph diff failed (%s); treating everything as changed", e)
+            changes = None
+        versions.graph_changed(changes)
+        if changes and previous:
+            writer.submit("changes", write_change_set, changes, OUT_CHANGES)
+        elif changes:
+            log.info("🆕 First run: no change set written (everything is new)")
+        elif changes is not None:
+            log.info("🟰 No changes since the previous run")
+
+        # 5) Step json to sigma: in memory, no read-back of suggestions.json;
+        #    skipped while graph_sigma.json was rendered from this graph version
+        #    with the current settings and code
+        fingerprint = _sigma_fingerprint()
+        if not (versions.sigma_is_current(fingerprint) and Path(OUT_GRAPH).exists()):
+            convert_for_sigma(graph=graph, writer=writer, tags_normalized=True)
+            sigma_fingerprint = fingerprint
+        else:
+            log.info("⏭️ Sigma graph already up to date: export skipped")
+    finally:
+        writer.close()
+
+    # Sigma version: only once graph_sigma.json is actually on disk
+    if sigma_fingerprint is not None and not any(label == "graph_sigma" for label, _ in writer.errors):
+        versions.sigma_rendered(sigma_fingerprint)
+    try:
+        versions.save(OUT_VERSION)
+    except Exception as e:
+        log.warning("⚠️ Could not save graph versions: %s", e)
 
     # 6) Email (optional) — if creds are missing, skip
     try:
-        n_src = len(resultats)
-        n_edges = sum(len(v) for v in resultats.values())
-        subject = f"[Brain] Daily suggestions · {n_src} notes · {n_edges} connections"
-        html    = _render_html(resultats, id2meta)
+        changed_only = bool(previous) and changes is not None
+        if changed_only:
+            # Only what changed since the previous run
+            new_conns, changed_conns = _changed_connections(changes)
+            subject = f"[Brain] Suggestions · {len(new_conns)} new · {len(changed_conns)} updated connections"
+            html    = _render_changes_html(new_conns, changed_conns, graph, changes)
+        else:
+            n_src = len(resultats)
+            n_edges = sum(len(v) for v in resultats.values())
+            subject = f"[Brain] Daily suggestions · {n_src} notes · {n_edges} connections"
+            html    = _render_html(resultats, id2meta)
         text    = "See the HTML version of the suggestions."
-        if all([SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, MAIL_TO]):
+        if changed_only and not (new_conns or changed_conns):
+            log.info("📭 No new or updated connections: skipping email send.")
+        elif all([SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, MAIL_TO]):
             _enviar_email(subject, html, text)
         else:
             log.info("[INFO] SMTP not fully configured: skipping email send.")
@@ -914,21 +1107,10 @@ def sort_pair(a, b):
     return tuple(sorted([a, b]))
 
 def compute_overlap(a_tags, b_tags):
-    def _normalize_tag(tag):
-        if isinstance(tag, dict):
-            tag = tag.get("name") or tag.get("title") or ""
-        tag = str(tag or "").strip().casefold()
-        tag = unicodedata.normalize("NFD", tag)
-        return "".join(ch for ch in tag if unicodedata.category(ch) != "Mn")
-
-    a = {_normalize_tag(t) for t in (a_tags or []) if _normalize_tag(t)}
-    b = {_normalize_tag(t) for t in (b_tags or []) if _normalize_tag(t)}
-    return sorted(a & b)
+    return sorted(tag_features(a_tags) & tag_features(b_tags))
 
 def compute_project_overlap(a_projects, b_projects):
-    a = [ (p or "").strip().casefold() for p in (a_projects or []) ]
-    b = [ (p or "").strip().casefold() for p in (b_projects or []) ]
-    return sorted(set(a) & set(b))
+    return sorted(project_features(a_projects) & project_features(b_projects))
 
 def reason_ok(reason: str) -> bool:
     if not reason:
@@ -936,207 +1118,35 @@ def reason_ok(reason: str) -> bool:
     words = re.findall(r"\w+", reason, flags=re.UNICODE)
     return len(words) >= max(5, MIN_REASON_WORDS)
 
-def postprocess_graph(graph):
-    """
-    Inputs:
-      graph = {"nodes": [...], "edges": [...]}
-    Output:
-      New cleaned and enriched graph
-    """
-    id2node = {n["id"]: n for n in graph.get("nodes", [])}
-
-    # 1) Normalize node texts
-    for n in graph.get("nodes", []):
+def _normalize_nodes(nodes) -> None:
+    for n in nodes:
         n["title"] = normalize_text(n.get("title", ""))
         n["projects"] = [normalize_text(p) for p in n.get("projects", [])]
 
-    merged = {}  # key: (a,b) if undirected, or (a,b,"dir") if you want to preserve direction
-    new_edges = []
-
-    for e in graph.get("edges", []):
-        s = e["source"]; t = e["target"]
-        if s not in id2node or t not in id2node:
-            continue  # safety
-
-        # 2) Classify evidence (respect 'evidence' if provided)
-        ev_list = e.get("evidence")
-        if isinstance(ev_list, str):
-            ev_list = [ev_list]
-        ev_set = {(x or "").strip().lower() for x in (ev_list or []) if isinstance(x, str) and x.strip()}
-
-        if not ev_set:
-            # old compatibility: infer from dashes if needed
-            ev_set = {"ai"} if e.get("dashes", False) else {"explicit"}
-
-        # if via_tags exists, ensure 'tags'
-        if e.get("via_tags"):
-            ev_set.add("tags")
-
-        # 3) Clean, validate and (if needed) enrich reason with overlaps
-        reason = normalize_text(e.get("reason", "")).strip()
-        sim = e.get("similarity")
-
-        # 4) Calculate overlaps BEFORE to use them if reason is too short
-        tags_overlap = compute_overlap(id2node[s].get("tags", []), id2node[t].get("tags", []))
-        proj_overlap = compute_project_overlap(id2node[s].get("projects", []), id2node[t].get("projects", []))
-
-        if ev_set == "ai":
-            # If reason is too short, try to enrich with objective info
-            if not reason_ok(reason):
-                extras = []
-                if tags_overlap:
-                    extras.append(f"tags comuns: {', '.join(tags_overlap[:2])}")
-                if proj_overlap:
-                    extras.append(f"projectes comuns: {', '.join(proj_overlap[:1])}")
-                if extras:
-                    # Join without repeating dash if 'reason' is empty
-                    reason = (reason + (" – " if reason else "") + "; ".join(extras)).strip()
-
-                # Re-validate; if still poor, discard edge
-                if not reason_ok(reason):
-                    continue
-
-        # 5) Decide merge keys (undirected recommended)
-        key = sort_pair(s, t)
-
-        entry = merged.get(key)
-        if not entry:
-            # for explicit without 'sim', assign 100; if AI, leave None
-            sim_init = sim if isinstance(sim, (int, float)) else (100 if ev_set == "explicit" else None)
-            entry = {
-                "source": s, "target": t,
-                "evidence": ev_set,
-                "reasons": [reason] if reason else [],
-                "similarity": sim_init,  # single displayable value
-                "score": e.get("score", None),
-                "tags_overlap": tags_overlap,
-                "project_overlap": proj_overlap
-            }
-        else:
-            # Merge
-            entry["evidence"].update(ev_set)
-            if reason:
-                entry["reasons"].append(reason)
-
-            # Max similarity:
-            if isinstance(sim, (int, float)):
-                if entry["similarity"] is None or sim > entry["similarity"]:
-                    entry["similarity"] = sim
-            elif ev_set == "explicit":
-                # if explicit and we didn't have 'sim' (or was lower), set 100
-                if entry["similarity"] is None or entry["similarity"] < 100:
-                    entry["similarity"] = 100
-
-            # Max score
-            if isinstance(e.get("score"), (int, float)):
-                if entry["score"] is None or e["score"] > entry["score"]:
-                    entry["score"] = e["score"]
-
-            # Union overlaps
-            entry["tags_overlap"] = sorted(set(entry["tags_overlap"]) | set(tags_overlap))
-            entry["project_overlap"] = sorted(set(entry["project_overlap"]) | set(proj_overlap))
-
-        merged[key] = entry
-
-        # --- Directionality (only for explicit evidence) ------------------------
-        directed = False
-        direction_info = "undirected"
-
-        # If there are reasons or explicit evidence
-        if "explicit" in entry.get("evidence", set()):
-            reasons_lower = [r.lower() for r in entry.get("reasons", [])]
-            if any("enllaça a" in r for r in reasons_lower):
-                directed = True
-                direction_info = "source_to_target"
-            elif any("enllaçat per" in r or "referenciat per" in r for r in reasons_lower):
-                directed = True
-                direction_info = "target_to_source"
-
-        entry["directed"] = directed
-        entry["direction_info"] = direction_info
-
-    # 6) Build final edges
-    for key, m in merged.items():
-        m["evidence"] = sorted(list(m["evidence"]))
-        # Decide line style: dashed only if EXCLUSIVELY AI
-        m["dashes"] = (m["evidence"] == ["ai"])
-        # If explicit+ai → solid line but keep reasons
-        # Unique and clean reasons
-        m["reasons"] = [r for r in dict.fromkeys([normalize_text(r) for r in m["reasons"]]) if r]
-        # If no reasons, put a minimal informative one for "explicit"
-        if not m["reasons"] and "explicit" in m["evidence"]:
-            m["reasons"] = ["Explicit link between the two notes"]
-        # Arrow if directional
-        m["arrow"] = "end" if m.get("directed") else None
-        new_edges.append(m)
-
-    graph["edges"] = new_edges
-
-    # 7) Prune by min similarity and Top-K per node
-    meta_min = None
-    meta_topk = None
-    try:
-        meta_min = int(graph.get("_meta", {}).get("min_similarity_kept"))
-    except Exception:
-        pass
-    try:
-        meta_topk = int(graph.get("_meta", {}).get("topk_per_node"))
-    except Exception:
-        pass
-
-    if meta_min is not None or meta_topk is not None:
-        # Index by "node key" (sort by id for stability)
-        by_node = {}
-        for e in graph["edges"]:
-            # Treat edge as undirected for pruning (consistent with merge)
-            a, b = sort_pair(e["source"], e["target"])
-            by_node.setdefault(a, []).append(e)
-            by_node.setdefault(b, []).append(e)
-
-        def keep_edge(e):
-            if meta_min is None:
-                return True
-            sim = e.get("similarity")
-            try:
-                return (sim is None) or (int(sim) >= meta_min)  # explicit ones can carry None
-            except Exception:
-                return True
-
-        kept = []
-        # 1) Filter by min similarity
-        prelim = [e for e in graph["edges"] if keep_edge(e)]
-
-        if meta_topk is None or meta_topk <= 0:
-            kept = prelim
-        else:
-            # 2) Top-K per node (by similarity desc; explicit with None at the end)
-            def score_of(e):
-                s = e.get("similarity")
-                return (-1 if s is None else int(s))
-
-            # For stability, do a global sort first
-            prelim_sorted = sorted(prelim, key=lambda e: (score_of(e), e["source"], e["target"]), reverse=True)
-
-            cap_count = {}  # (node_id -> how many edges it already has)
-            def can_take(e):
-                a, b = sort_pair(e["source"], e["target"])
-                ca = cap_count.get(a, 0)
-                cb = cap_count.get(b, 0)
-                return (ca < meta_topk) or (cb < meta_topk)
-
-            for e in prelim_sorted:
-                a, b = sort_pair(e["source"], e["target"])
-                if can_take(e):
-                    kept.append(e)
-                    cap_count[a] = cap_count.get(a, 0) + 1
-                    cap_count[b] = cap_count.get(b, 0) + 1
-
-        graph["edges"] = kept
-
-    directed_count = sum(1 for e in new_edges if e.get("directed"))
-    log.info(f"📈 {directed_count} directional edges inferred from {len(new_edges)} total.")
-
-    return graph
+def consolidate_core(graph, min_sim=0, topk=None):
+    """
+    Nodes normalized, every edge merged into an EdgeStore in one pass (id and
+    self-loop checks, per-pair merge), then streamed through the similarity cut
+    and optional top-K per node into a columnar GraphCore; dict edges are only
+    built at the JSON boundary (core.to_graph()). Returns (core, validation stats,
+    with the pruning counts per evidence type under "pruning").
+    """
+    timings = {}
+    t0 = time.perf_counter()
+    _normalize_nodes(graph.get("nodes", []))
+    store = EdgeStore(graph.get("nodes", []), min_sim=min_sim)
+    timings["nodes"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    store.extend(graph.get("edges", []))
+    timings["merge"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    core = store.core(topk=topk)
+    timings["core"] = time.perf_counter() - t0
+    log_pruning(store.stats["pruning"], min_sim, topk)
+    log.info(f"📈 {int((core.direction != 0).sum())} directional edges inferred from {len(core)} total.")
+    log.info("⏱️ consolidate_core: " + " · ".join(f"{k} {v:.3f}s" for k, v in timings.items())
+             + f" · {len(core)} edges in {core.nbytes() / 1e6:.1f} MB")
+    return core, store.stats
 
 # -----------------------------------------------------------------------------
 if __name__ == "__main__":
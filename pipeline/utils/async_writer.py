@@ -0,0 +1,78 @@
+# pipeline/utils/async_writer.py
+"""
+Background writer for the run's JSON artifacts.
+
+process() hands the validated graph to the Sigma export in memory, and the
+files (suggestions.json, graph_sigma.json) are written by one writer thread
+meanwhile, in submission order. Callers must not mutate an object after
+submitting it. close() waits for every queued write.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Callable
+
+from config.logger_config import get_logger
+
+log = get_logger(__name__)
+
+_STOP = object()
+
+
+class AsyncWriter:
+    def __init__(self, name: str = "json-writer"):
+        self.name = name
+        self.errors: list[tuple[str, Exception]] = []
+        self.written = 0
+        self.busy_seconds = 0.0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+
+    # -- context manager ------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    # -- queue ------------------------------------------------------------------
+    def submit(self, label: str, fn: Callable, *args, **kwargs) -> None:
+        """Queues fn(*args, **kwargs); `label` names it in logs."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        self._queue.put((label, fn, args, kwargs))
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                return
+            label, fn, args, kwargs = job
+            t0 = time.perf_counter()
+            try:
+                fn(*args, **kwargs)
+                self.written += 1
+            except Exception as e:
+                self.errors.append((label, e))
+                log.error("❌ Background write failed (%s): %s", label, e)
+            finally:
+                self.busy_seconds += time.perf_counter() - t0
+
+    def close(self, timeout: float | None = None) -> bool:
+        """Waits for the queued writes; True if all of them succeeded."""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            t0 = time.perf_counter()
+            self._thread.join(timeout)
+            waited = time.perf_counter() - t0
+            if self._thread.is_alive():
+                log.warning("⚠️ Writer %s still busy after %.1fs", self.name, waited)
+                return False
+            self._thread = None
+            log.info("💾 %d artifacts written in the background (%.2fs writing, %.2fs waited at close)",
+                     self.written, self.busy_seconds, waited)
+        return not self.errors
@@ -18,6 +18,7 @@ EXPLICIT_EDGE_COLOR = C["edges"]["explicit_color"]
 DIRECT_CONNECTION = C["edges"]["direct_color"]
 DEFAULT_INFERRED_EDGE_COLOR = C["edges"]["default_inferred_color"]
 INFERRED_EDGE_DASHED = C["edges"]["inferred_dashed"]
+NEAR_DUPLICATE_EDGE_COLOR = C["edges"].get("near_duplicate_color", "#6D4C41")
 
 
 def notion_color_to_hex(color_name: str) -> str:
@@ -48,6 +49,9 @@ def edge_style_by_evidence_and_similarity(evidence, similarity=None):
     if "explicit" in evset:
         return {"color": EXPLICIT_EDGE_COLOR, "dashes": False}
 
+    if "near_duplicate" in evset:
+        return {"color": NEAR_DUPLICATE_EDGE_COLOR, "dashes": False}
+
     if evset == {"tags"}:
         return {"color": "#888888", "dashes": False}
 
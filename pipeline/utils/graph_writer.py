@@ -0,0 +1,155 @@
+# pipeline/utils/graph_writer.py
+"""
+Streaming JSON writer for graph artifacts (suggestions.json, graph_sigma.json).
+
+Top-level list values ("nodes", "edges") are written one element at a time
+into a temporary file next to the target, which is fsynced and renamed over
+it at the end; on error the target is left untouched. Only one element is
+ever serialized in memory, so peak memory no longer grows with the output.
+
+  pretty   byte-identical to json.dump(..., ensure_ascii=False, indent=2)
+  compact  no whitespace (",", ":"), for machine consumers
+Compression follows the file suffix (.gz → gzip, .zst → zstd, which needs the
+optional `zstandard` package) unless given explicitly.
+"""
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import os
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+
+
+def compression_for(path) -> Optional[str]:
+    """Compression implied by the file suffix (None for plain JSON)."""
+    return _SUFFIXES.get(Path(path).suffix.lower())
+
+
+def _compressor(raw, compression: Optional[str]):
+    if compression is None:
+        return raw
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise RuntimeError("zstd output needs the 'zstandard' package (pip install zstandard)") from e
+        return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+    raise ValueError(f"Unknown compression: {compression!r} (expected gzip or zstd)")
+
+
+def open_json(path):
+    """Text stream of a possibly compressed JSON file (by suffix)."""
+    compression = compression_for(path)
+    if compression == "gzip":
+        return gzip.open(path, "rt", encoding="utf-8")
+    if compression == "zstd":
+        import zstandard
+        return zstandard.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def read_json(path) -> Any:
+    with open_json(path) as f:
+        return json.load(f)
+
+
+class GraphWriter:
+    def __init__(self, path, compact: bool = False, compression: Optional[str] = None, fsync: bool = True):
+        self.path = Path(path)
+        self.compact = compact
+        self.compression = compression or compression_for(self.path)
+        self.fsync = fsync
+        self.counts: dict[str, int] = {}
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._raw = None
+        self._out = None
+        self._first_key = True
+        if compact:
+            self._dumps = lambda v: json.dumps(v, ensure_ascii=False, separators=(",", ":"))
+        else:
+            self._dumps = lambda v: json.dumps(v, ensure_ascii=False, indent=2)
+
+    # -- context manager ------------------------------------------------------
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._raw = open(self._tmp, "wb")
+        try:
+            self._out = io.TextIOWrapper(_compressor(self._raw, self.compression),
+                                         encoding="utf-8", write_through=False)
+        except Exception:
+            self._raw.close()
+            self._tmp.unlink(missing_ok=True)
+            raise
+        self._write("{")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self._write("}" if self.compact or self._first_key else "\n}")
+            if self._out.buffer is self._raw:
+                self._out.flush()
+                self._out.detach()
+            else:
+                self._out.close()   # ends the compressed stream; the raw file stays open
+            self._raw.flush()
+            if exc_type is None and self.fsync:
+                os.fsync(self._raw.fileno())
+        finally:
+            self._raw.close()
+        if exc_type is None:
+            os.replace(self._tmp, self.path)
+        else:
+            self._tmp.unlink(missing_ok=True)
+        return False
+
+    # -- writing ----------------------------------------------------------------
+    def _write(self, s: str) -> None:
+        self._out.write(s)
+
+    def _key(self, key: str) -> None:
+        sep = "" if self._first_key else ","
+        self._first_key = False
+        if self.compact:
+            self._write(f"{sep}{json.dumps(key, ensure_ascii=False)}:")
+        else:
+            self._write(f"{sep}\n  {json.dumps(key, ensure_ascii=False)}: ")
+
+    def value(self, key: str, value: Any) -> None:
+        """Writes one top-level member at once (small values: legend, metadata)."""
+        self._key(key)
+        text = self._dumps(value)
+        self._write(text if self.compact else text.replace("\n", "\n  "))
+
+    def items(self, key: str, items: Iterable[Any]) -> int:
+        """Streams a top-level list member, one element at a time; returns the count."""
+        self._key(key)
+        n = 0
+        for item in items:
+            text = self._dumps(item)
+            if self.compact:
+                self._write(("[" if n == 0 else ",") + text)
+            else:
+                self._write(("[\n    " if n == 0 else ",\n    ") + text.replace("\n", "\n    "))
+            n += 1
+        self._write("[]" if n == 0 else ("]" if self.compact else "\n  ]"))
+        self.counts[key] = n
+        return n
+
+
+def write_graph(graph: dict, path, compact: bool = False, compression: Optional[str] = None,
+                fsync: bool = True) -> GraphWriter:
+    """Writes a dict atomically, streaming its list members; returns the finished writer (item counts)."""
+    with GraphWriter(path, compact=compact, compression=compression, fsync=fsync) as w:
+        for key, value in graph.items():
+            if isinstance(value, list):
+                w.items(key, value)
+            else:
+                w.value(key, value)
+    return w
@@ -1,88 +1,226 @@
 # ──────────────────────────────────────────────────────────────────────────────
 # 🔍 Graph JSON Sanitization Module
 # ──────────────────────────────────────────────────────────────────────────────
+"""
+Rules (unchanged): values that are None, NaN/Infinity or strings with quotes or
+newlines are dropped; an object whose critical field (id, source, target,
+label) is dropped is removed; containers left empty are removed.
+
+Clean data is checked without recursion or allocation (an explicit stack, no
+path strings) and returned as the same object. Only a value that actually
+needs fixing is rebuilt, copying just the containers on its path; paths are
+formatted only for the report, which aggregates counts per field
+("edges[].label") and keeps a few samples.
+"""
 import math
-from datetime import datetime
-from typing import Any, Union
+from collections import Counter
+from itertools import chain
+from typing import Any, Iterable, Iterator, Union
 from config.logger_config import get_logger
+from pipeline.utils.graph_writer import GraphWriter
 import json
 
 log = get_logger(__name__)
 
-def sanitize_json_graph(data: Any, path: str = "") -> str:
-    """
-    Sanitize JSON data structure:
-      1. Clean invalid values (NaN, Infinity, None, quotes, newlines).
-      2. Remove objects with invalid critical fields (id, source, target, label).
-      3. Display summary in Streamlit (if enabled).
-      4. Save full trace to log file.
-    """
-    issues, removed = [], []
-    CRITICAL_KEYS = {"id", "source", "target", "label"}
-
-    def is_invalid(v: Any) -> bool:
-        return (
-            v is None
-            or (isinstance(v, float) and (math.isnan(v) or math.isinf(v)))
-            or (isinstance(v, str) and ('"' in v or "\n" in v))
-        )
-
-    def clean_value(v: Any, p: str) -> Union[Any, None]:
-        if isinstance(v, dict):
-            new_dict = {}
-            invalid_critical = False
-            for k, vv in v.items():
-                if is_invalid(vv):
-                    issues.append(f"{p}.{k} = {vv}")
-                    if k in CRITICAL_KEYS:
-                        invalid_critical = True
-                    continue
-                cleaned = clean_value(vv, f"{p}.{k}" if p else k)
-                if cleaned is not None:
-                    new_dict[k] = cleaned
-            if invalid_critical:
-                removed.append(f"{p} (invalid critical field)")
-                return None
-            return new_dict if new_dict else None
-
-        elif isinstance(v, list):
-            new_list = []
-            for idx, i in enumerate(v):
-                cleaned = clean_value(i, f"{p}[{idx}]")
-                if cleaned is not None:
-                    new_list.append(cleaned)
-                else:
-                    removed.append(f"{p}[{idx}] removed (invalid object)")
-            return new_list if new_list else None
+CRITICAL_KEYS = {"id", "source", "target", "label"}
+SAMPLE_LIMIT = 10     # concrete examples kept for the report
+FIELD_LIMIT = 20      # fields listed per category in the report
 
-        elif is_invalid(v):
-            issues.append(f"{p} = {v}")
-            return None
-        elif isinstance(v, str):
-            return v.replace('"', '\\"').replace("\n", " ")
+
+def is_invalid(v: Any) -> bool:
+    return (
+        v is None
+        or (isinstance(v, float) and (math.isnan(v) or math.isinf(v)))
+        or (isinstance(v, str) and ('"' in v or "\n" in v))
+    )
+
+
+def needs_fix(v: Any) -> bool:
+    """True if clean() would change `v` (an invalid value or an empty container anywhere inside)."""
+    if not isinstance(v, (dict, list)):
+        return is_invalid(v)
+    stack = [v]
+    while stack:
+        x = stack.pop()
+        if not x:
+            return True
+        for y in (x.values() if isinstance(x, dict) else x):
+            t = type(y)
+            if t is str:
+                if '"' in y or "\n" in y:
+                    return True
+            elif t is int or t is bool:
+                continue
+            elif t is float:
+                if y != y or y in (math.inf, -math.inf):
+                    return True
+            elif t is dict or t is list:
+                stack.append(y)
+            elif isinstance(y, (dict, list)):
+                stack.append(y)
+            elif is_invalid(y):
+                return True
+    return False
+
+
+def _path(parts: Iterable, indexed: bool = True) -> str:
+    """'nodes[3].x' (or 'nodes[].x' for the per-field counts)."""
+    s = ""
+    for x in parts:
+        if isinstance(x, int):
+            s += f"[{x}]" if indexed else "[]"
         else:
+            s += f".{x}" if s else str(x)
+    return s
+
+
+class JsonSanitizer:
+    """Cleans values one at a time (or as a streaming filter), aggregating one report."""
+
+    def __init__(self):
+        self.issues: Counter = Counter()     # field -> dropped values
+        self.removed: Counter = Counter()    # field (reason) -> removed objects
+        self.samples: list[str] = []
+
+    # -- report -----------------------------------------------------------------
+    def _issue(self, parts: list, value: Any) -> None:
+        self.issues[_path(parts, indexed=False)] += 1
+        if len(self.samples) < SAMPLE_LIMIT:
+            self.samples.append(f"{_path(parts)} = {value!r}")
+
+    def _remove(self, parts: list, why: str) -> None:
+        self.removed[f"{_path(parts, indexed=False)} ({why})"] += 1
+        if len(self.samples) < SAMPLE_LIMIT:
+            self.samples.append(f"{_path(parts)} removed ({why})")
+
+    def log_report(self) -> None:
+        """Counts per field (capped) plus a few samples."""
+        if not (self.issues or self.removed):
+            log.info("🧹 JSON sanitize: no anomalies detected")
+            return
+        log.info("🧹 JSON sanitize: %d values cleaned, %d objects removed",
+                 sum(self.issues.values()), sum(self.removed.values()))
+        for label, counter in (("cleaned", self.issues), ("removed", self.removed)):
+            for field, n in counter.most_common(FIELD_LIMIT):
+                log.info("   %s %s × %d", label, field, n)
+            if len(counter) > FIELD_LIMIT:
+                log.info("   … %d more %s fields", len(counter) - FIELD_LIMIT, label)
+        for s in self.samples:
+            log.info("   e.g. %s", s)
+
+    # -- cleaning -----------------------------------------------------------------
+    def clean(self, v: Any, p: str = "") -> Union[Any, None]:
+        """Cleaned value: `v` itself when nothing needs fixing, else a fixed copy (None if removed)."""
+        if not needs_fix(v):
             return v
+        return self._fix(v, [p] if p else [])
+
+    def clean_items(self, items: Iterable[Any], p: str) -> Iterator[Any]:
+        """Streaming filter over the elements of a list (invalid ones are dropped and reported)."""
+        for idx, item in enumerate(items):
+            if not needs_fix(item):
+                yield item
+                continue
+            cleaned = self._fix(item, [p, idx])
+            if cleaned is not None:
+                yield cleaned
+            else:
+                self._remove([p, idx], "invalid object")
+
+    def _fix(self, v: Any, parts: list) -> Union[Any, None]:
+        if not isinstance(v, (dict, list)):
+            self._issue(parts, v)
+            return None
+        # Frames: [source, item iterator, output, path parts, critical field dropped]
+        def frame(src, src_parts):
+            if isinstance(src, dict):
+                return [src, iter(src.items()), {}, src_parts, False]
+            return [src, enumerate(src), [], src_parts, False]
 
-    safe_data = clean_value(data, path)
+        stack = [frame(v, parts)]
+        result = None
+        while stack:
+            top = stack[-1]
+            src, it, out, top_parts, _ = top
+            is_dict = isinstance(src, dict)
+            descended = False
+            for k, child in it:
+                if is_invalid(child):
+                    self._issue(top_parts + [k], child)
+                    if is_dict and k in CRITICAL_KEYS:
+                        top[4] = True
+                    elif not is_dict:
+                        self._remove(top_parts + [k], "invalid object")
+                    continue
+                if isinstance(child, (dict, list)) and needs_fix(child):
+                    stack.append(frame(child, top_parts + [k]))
+                    descended = True
+                    break
+                if is_dict:
+                    out[k] = child
+                else:
+                    out.append(child)
+            if descended:
+                continue
 
-    # ── Write sanitization report to log ──────────────────────
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            stack.pop()
+            if top[4]:
+                self._remove(top_parts, "invalid critical field")
+                value = None
+            else:
+                value = out if out else None
+            if not stack:
+                result = value
+            elif value is not None:
+                parent = stack[-1]
+                if isinstance(parent[0], dict):
+                    parent[2][top_parts[-1]] = value
+                else:
+                    parent[2].append(value)
+            elif not isinstance(stack[-1][0], dict):
+                self._remove(top_parts, "invalid object")
+        return result
 
-    log.info(f"\n=== JSON Sanitize Report — {timestamp} ===\n")
-    if issues:
-        log.info(f"Cleaned fields ({len(issues)}):\n")
-        for i in issues:
-            log.info(f"  - {i}\n")
-    if removed:
-        log.info(f"Removed objects ({len(removed)}):\n")
-        for r in removed:
-            log.info(f"  - {r}\n")
-    if not (issues or removed):
-        log.info("No anomalies detected.\n")
-    log.info("=" * 60 + "\n")
+
+def sanitize_json_graph(data: Any, path: str = "") -> str:
+    """
+    Sanitize JSON data structure:
+      1. Clean invalid values (NaN, Infinity, None, quotes, newlines).
+      2. Remove objects with invalid critical fields (id, source, target, label).
+      3. Log an aggregated report.
+    """
+    sanitizer = JsonSanitizer()
+    safe_data = sanitizer.clean(data, path)
+    sanitizer.log_report()
 
     try:
         return json.dumps(safe_data, ensure_ascii=False)
     except Exception as e:
         log.error(f"❌ Error serializing JSON: {e}")
         return "{}"
+
+
+def write_sanitized_graph(data: dict, path, compact: bool = True) -> None:
+    """
+    sanitize_json_graph + write, streamed: each node/edge is cleaned as it is
+    written by GraphWriter, so no cleaned copy nor JSON string of the whole
+    graph is built. Lists left empty are dropped, as sanitize_json_graph does.
+    """
+    sanitizer = JsonSanitizer()
+    try:
+        with GraphWriter(path, compact=compact) as w:
+            for key, value in data.items():
+                if isinstance(value, list):
+                    items = sanitizer.clean_items(value, key)
+                    first = next(items, None)
+                    if first is not None:
+                        w.items(key, chain([first], items))
+                    continue
+                cleaned = sanitizer.clean(value, key)
+                if cleaned is not None:
+                    w.value(key, cleaned)
+    except Exception as e:
+        log.error(f"❌ Error serializing JSON: {e}")
+        raise
+    finally:
+        sanitizer.log_report()